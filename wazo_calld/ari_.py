@@ -4,6 +4,7 @@
 import errno
 import logging
 import socket
+import threading
 import time
 
 from contextlib import contextmanager
@@ -15,6 +16,12 @@ from requests.exceptions import HTTPError
 from websocket import WebSocketException
 from xivo.status import Status
 
+from .ari_cache import ARICache
+from .ari_docs_cache import ARIDocsCache
+from .dispatch import (
+    ShardedDispatcher,
+    is_shard_safe,
+)
 from .exceptions import ARIUnreachable
 
 logger = logging.getLogger(__name__)
@@ -22,6 +29,21 @@ logger = logging.getLogger(__name__)
 DEFAULT_APPLICATION_NAME = 'callcontrol'
 
 
+def event_shard_key(event):
+    '''Events about the same channel, or else the same bridge, must be handled in order'''
+    for field in ('channel', 'peer', 'bridge'):
+        obj = event.get(field)
+        if obj:
+            return obj['id']
+
+    playback = event.get('playback')
+    if playback:
+        # target_uri is channel:<id> or bridge:<id>
+        return playback['target_uri'].split(':', 1)[-1]
+
+    return None
+
+
 def not_found(error):
     return error.response is not None and error.response.status_code == 404
 
@@ -38,19 +60,50 @@ class CoreARI:
 
     def __init__(self, config):
         self._apps = []
+        self._connected_apps = None
+        self._reload_lock = threading.Lock()
+        self._reload_timer = None
+        self._reconnections = 0
         self.config = config
         self._is_running = False
         self._should_delay_reconnect = True
         self._should_stop = False
+        self._docs_cache = None
+        if config['docs_cache']['enabled']:
+            self._docs_cache = ARIDocsCache(config['docs_cache']['directory'])
         self.client = self._new_ari_client(
             config['connection'],
             config['startup_connection_tries'],
             config['startup_connection_delay'],
         )
+        self.cache = ARICache(self.client, DEFAULT_APPLICATION_NAME, enabled=config['cache']['enabled'])
+        if config['cache']['enabled']:
+            self.register_application(DEFAULT_APPLICATION_NAME)
+        # the cache is updated from the websocket thread, before the events are dispatched
+        self.cache.subscribe()
+        self._dispatcher = ShardedDispatcher('ari_events', **config['dispatch'])
+        if config['dispatch']['workers']:
+            self._dispatch_events()
+
+    def _dispatch_events(self):
+        # on_channel_event, on_bridge_event and friends all register through on_event
+        on_event = self.client.on_event
+
+        def on_event_dispatched(event_type, event_cb, *args, **kwargs):
+            if not is_shard_safe(event_cb):
+                return on_event(event_type, event_cb, *args, **kwargs)
+
+            def dispatch(event, *args, **kwargs):
+                self._dispatcher.submit(event_shard_key(event), event_cb, event, *args, **kwargs)
+            return on_event(event_type, dispatch, *args, **kwargs)
+
+        self.client.on_event = on_event_dispatched
 
     def _new_ari_client(self, ari_config, connection_tries, connection_delay):
         for _ in range(connection_tries):
             try:
+                if self._docs_cache:
+                    return self._docs_cache.connect(**ari_config)
                 return ari.connect(**ari_config)
             except requests.ConnectionError:
                 logger.info('No ARI server found, retrying in %s seconds...', connection_delay)
@@ -66,10 +119,33 @@ class CoreARI:
         raise ARIUnreachable(ari_config)
 
     def reload(self):
+        '''Reconnect the websocket with the registered applications.
+
+        Asterisk only registers the applications given when the websocket is
+        opened, so a reconnection is needed. Reloads requested within
+        reload_delay seconds are coalesced into a single reconnection.'''
+        with self._reload_lock:
+            if self._reload_timer:
+                return
+            if set(self._apps) == self._connected_apps:
+                logger.debug('ARI applications unchanged: no reload needed')
+                return
+            self._reload_timer = threading.Timer(self.config['reload_delay'], self._reload)
+            self._reload_timer.daemon = True
+            self._reload_timer.start()
+
+    def _reload(self):
+        with self._reload_lock:
+            self._reload_timer = None
+            if set(self._apps) == self._connected_apps:
+                logger.debug('ARI applications unchanged: no reload needed')
+                return
+        logger.info('Reconnecting to ARI to register applications')
         self._should_delay_reconnect = False
         self._trigger_disconnect()
 
     def run(self):
+        self._dispatcher.start()
         if not self._should_stop:
             self._connect()
         while not self._should_stop:
@@ -82,6 +158,10 @@ class CoreARI:
 
     def _connect(self):
         logger.debug('ARI client listening...')
+        if self._connected_apps is not None:
+            self._reconnections += 1
+        with self._reload_lock:
+            self._connected_apps = set(self._apps)
         try:
             with self._running():
                 self.client.run(apps=self._apps)
@@ -119,6 +199,8 @@ class CoreARI:
 
     def provide_status(self, status):
         status['ari']['status'] = Status.ok if self.is_running() else Status.fail
+        status['ari']['event_queues'] = self._dispatcher.queue_depths()
+        status['ari']['reconnections'] = self._reconnections
 
     def _connection_error(self, error):
         logger.warning('ARI connection error: %s...', error)
@@ -132,7 +214,12 @@ class CoreARI:
 
     def stop(self):
         self._should_stop = True
+        with self._reload_lock:
+            if self._reload_timer:
+                self._reload_timer.cancel()
+                self._reload_timer = None
         self._trigger_disconnect()
+        self._dispatcher.stop()
 
     def _trigger_disconnect(self):
         self._sync()
@@ -0,0 +1,211 @@
+# Copyright 2019 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import logging
+import threading
+
+from collections import defaultdict
+
+from ari.model import (
+    Bridge,
+    Channel,
+)
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_EVENTS = (
+    'ChannelCallerId',
+    'ChannelConnectedLine',
+    'ChannelCreated',
+    'ChannelDialplan',
+    'ChannelStateChange',
+)
+BRIDGE_EVENTS = (
+    'BridgeCreated',
+    'ChannelEnteredBridge',
+    'ChannelLeftBridge',
+)
+
+
+class ARICache:
+    '''In-memory mirror of the Asterisk channels and bridges.
+
+    The mirror is bootstrapped from channels.list/bridges.list each time the
+    websocket is (re)connected and is then kept up to date with the ARI events.
+    When the mirror is disabled or not synchronized, every read falls back to
+    an ARI HTTP request.'''
+
+    def __init__(self, ari_client, application_name, enabled=False):
+        self._ari = ari_client
+        self._application_name = application_name
+        self._enabled = enabled
+        self._synced = False
+        self._lock = threading.Lock()
+        self._channels = {}
+        self._bridges = {}
+        self._channel_bridges = defaultdict(set)
+
+    def subscribe(self):
+        if not self._enabled:
+            return
+
+        for event_type in CHANNEL_EVENTS:
+            self._ari.on_event(event_type, self._on_channel_updated)
+        for event_type in BRIDGE_EVENTS:
+            self._ari.on_event(event_type, self._on_bridge_updated)
+        self._ari.on_event('ChannelVarset', self._on_channel_variable_set)
+        self._ari.on_event('ChannelDestroyed', self._on_channel_destroyed)
+        self._ari.on_event('BridgeDestroyed', self._on_bridge_destroyed)
+        self._ari.on_application_registered(self._application_name, self._on_websocket_start)
+        self._ari.on_application_deregistered(self._application_name, self._on_websocket_stop)
+
+    def is_enabled(self):
+        return self._enabled
+
+    def is_synced(self):
+        return self._synced
+
+    def get_channel(self, channel_id):
+        with self._lock:
+            channel_json = self._channels.get(channel_id) if self._synced else None
+        if channel_json is None:
+            return self._ari.channels.get(channelId=channel_id)
+        return Channel(self._ari, channel_json)
+
+    def get_channelvars(self, channel_id):
+        with self._lock:
+            channel_json = self._channels.get(channel_id) if self._synced else None
+        if channel_json is None:
+            return {}
+        return channel_json.get('channelvars') or {}
+
+    def list_channels(self):
+        with self._lock:
+            if not self._synced:
+                channels_json = None
+            else:
+                channels_json = list(self._channels.values())
+        if channels_json is None:
+            return self._ari.channels.list()
+        return [Channel(self._ari, channel_json) for channel_json in channels_json]
+
+    def get_bridge(self, bridge_id):
+        with self._lock:
+            bridge_json = self._bridges.get(bridge_id) if self._synced else None
+        if bridge_json is None:
+            return self._ari.bridges.get(bridgeId=bridge_id)
+        return Bridge(self._ari, bridge_json)
+
+    def list_bridges(self):
+        with self._lock:
+            if not self._synced:
+                bridges_json = None
+            else:
+                bridges_json = list(self._bridges.values())
+        if bridges_json is None:
+            return self._ari.bridges.list()
+        return [Bridge(self._ari, bridge_json) for bridge_json in bridges_json]
+
+    def list_channel_bridges(self, channel_id):
+        with self._lock:
+            if not self._synced:
+                bridges_json = None
+            else:
+                bridge_ids = self._channel_bridges.get(channel_id, ())
+                bridges_json = [self._bridges[bridge_id] for bridge_id in bridge_ids]
+        if bridges_json is None:
+            return [bridge for bridge in self._ari.bridges.list() if channel_id in bridge.json['channels']]
+        return [Bridge(self._ari, bridge_json) for bridge_json in bridges_json]
+
+    def _on_websocket_start(self):
+        try:
+            self._ari.applications.subscribe(applicationName=self._application_name, eventSource='channel:')
+            self._ari.applications.subscribe(applicationName=self._application_name, eventSource='bridge:')
+            channels = self._ari.channels.list()
+            bridges = self._ari.bridges.list()
+        except Exception as e:
+            logger.error('ARI cache: could not synchronize: %s', e)
+            return
+
+        with self._lock:
+            self._channels = {channel.id: channel.json for channel in channels}
+            self._bridges = {}
+            self._channel_bridges = defaultdict(set)
+            for bridge in bridges:
+                self._set_bridge(bridge.json)
+            self._synced = True
+        logger.debug('ARI cache synchronized: %s channels, %s bridges', len(channels), len(bridges))
+
+    def _on_websocket_stop(self):
+        with self._lock:
+            self._synced = False
+            self._channels = {}
+            self._bridges = {}
+            self._channel_bridges = defaultdict(set)
+
+    def _on_channel_updated(self, event):
+        channel_json = event.get('channel')
+        if not channel_json:
+            return
+
+        with self._lock:
+            self._channels[channel_json['id']] = channel_json
+
+    def _on_channel_variable_set(self, event):
+        channel_json = event.get('channel')
+        if not channel_json:
+            return  # global variable
+
+        channel_id = channel_json['id']
+        variable = event['variable']
+        with self._lock:
+            cached_json = self._channels.get(channel_id)
+            if cached_json is None:
+                return
+            channelvars = cached_json.get('channelvars')
+            if channelvars is None or variable not in channelvars:
+                return
+            # copy-on-write: readers may still hold the previous dict
+            new_json = dict(cached_json)
+            new_json['channelvars'] = dict(channelvars)
+            new_json['channelvars'][variable] = event['value']
+            self._channels[channel_id] = new_json
+
+    def _on_channel_destroyed(self, event):
+        with self._lock:
+            self._channels.pop(event['channel']['id'], None)
+
+    def _on_bridge_updated(self, event):
+        bridge_json = event.get('bridge')
+        if not bridge_json:
+            return
+
+        channel_json = event.get('channel')
+        with self._lock:
+            self._set_bridge(bridge_json)
+            if channel_json:
+                self._channels[channel_json['id']] = channel_json
+
+    def _on_bridge_destroyed(self, event):
+        with self._lock:
+            self._remove_bridge(event['bridge']['id'])
+
+    def _set_bridge(self, bridge_json):
+        bridge_id = bridge_json['id']
+        self._remove_bridge(bridge_id)
+        self._bridges[bridge_id] = bridge_json
+        for channel_id in bridge_json['channels']:
+            self._channel_bridges[channel_id].add(bridge_id)
+
+    def _remove_bridge(self, bridge_id):
+        bridge_json = self._bridges.pop(bridge_id, None)
+        if not bridge_json:
+            return
+
+        for channel_id in bridge_json['channels']:
+            bridge_ids = self._channel_bridges.get(channel_id)
+            if bridge_ids is None:
+                continue
+            bridge_ids.discard(bridge_id)
+            if not bridge_ids:
+                del self._channel_bridges[channel_id]
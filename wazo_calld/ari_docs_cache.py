@@ -0,0 +1,145 @@
+# Copyright 2019 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+from urllib.parse import (
+    urljoin,
+    urlsplit,
+)
+
+import ari
+import requests
+import swaggerpy.http_client
+
+logger = logging.getLogger(__name__)
+
+RESOURCES_PATH = 'ari/api-docs/resources.json'
+
+
+class ARIDocsCache:
+    '''On-disk copy of the ARI Swagger documentation.
+
+    ari.connect downloads and parses every ARI resource declaration. The
+    documents are stored in a directory per Asterisk server and version, and
+    the ARI client is built from these files on the next connections. A
+    background thread then checks that the cached documents are still the
+    ones served by Asterisk, so that a changed spec is used on next startup.'''
+
+    def __init__(self, directory):
+        self._directory = directory
+
+    def connect(self, base_url, username, password):
+        auth = (username, password)
+        version = self._asterisk_version(base_url, auth)
+        docs_dir = self._docs_dir(base_url, version)
+
+        if os.path.exists(os.path.join(docs_dir, RESOURCES_PATH)):
+            logger.debug('Loading ARI documentation from %s', docs_dir)
+            try:
+                client = self._new_client(docs_dir, base_url, username, password)
+            except Exception as e:
+                logger.warning('Could not load cached ARI documentation: %s', e)
+            else:
+                self._check_in_background(docs_dir, base_url, auth)
+                return client
+
+        try:
+            self._save(docs_dir, self._download(base_url, auth))
+        except OSError as e:
+            logger.warning('Could not cache ARI documentation: %s', e)
+            return ari.connect(base_url, username, password)
+        return self._new_client(docs_dir, base_url, username, password)
+
+    def _docs_dir(self, base_url, version):
+        key = hashlib.sha1('{}|{}'.format(base_url, version).encode('utf-8')).hexdigest()
+        return os.path.join(self._directory, key)
+
+    def _new_client(self, docs_dir, base_url, username, password):
+        http_client = swaggerpy.http_client.SynchronousHttpClient()
+        http_client.set_basic_auth(urlsplit(base_url).hostname, username, password)
+        return ari.Client('file://{}/'.format(docs_dir), http_client)
+
+    def _check_in_background(self, docs_dir, base_url, auth):
+        thread = threading.Thread(
+            target=self._check,
+            args=(docs_dir, base_url, auth),
+            name='ari_docs_check',
+        )
+        thread.daemon = True
+        thread.start()
+
+    def _check(self, docs_dir, base_url, auth):
+        try:
+            docs = self._download(base_url, auth)
+            if self._is_same_spec(docs, self._load(docs_dir)):
+                return
+            logger.info('ARI documentation changed: it will be used on next startup')
+            self._save(docs_dir, docs)
+        except Exception as e:
+            logger.warning('Could not check the cached ARI documentation: %s', e)
+
+    @staticmethod
+    def _asterisk_version(base_url, auth):
+        response = requests.get(urljoin(base_url, 'ari/asterisk/info'), auth=auth)
+        response.raise_for_status()
+        return response.json()['system']['version']
+
+    @staticmethod
+    def _get_json(url, auth):
+        response = requests.get(url, auth=auth)
+        response.raise_for_status()
+        return response.json()
+
+    def _download(self, base_url, auth):
+        resources = self._get_json(urljoin(base_url, RESOURCES_PATH), auth)
+        docs = {RESOURCES_PATH: resources}
+        for api in resources['apis']:
+            path = api['path'].replace('{format}', 'json').strip('/')
+            docs['ari/' + path] = self._get_json(urljoin(resources['basePath'] + '/', path), auth)
+        return docs
+
+    def _save(self, docs_dir, docs):
+        # The resource declarations are looked up relative to basePath
+        resources = dict(docs[RESOURCES_PATH], basePath='file://{}/ari'.format(docs_dir))
+        docs = dict(docs, **{RESOURCES_PATH: resources})
+
+        os.makedirs(self._directory, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=self._directory)
+        try:
+            for path, doc in docs.items():
+                file_name = os.path.join(tmp_dir, path)
+                os.makedirs(os.path.dirname(file_name), exist_ok=True)
+                with open(file_name, 'w') as f:
+                    json.dump(doc, f)
+            shutil.rmtree(docs_dir, ignore_errors=True)
+            os.rename(tmp_dir, docs_dir)
+        except OSError:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+    @staticmethod
+    def _load(docs_dir):
+        with open(os.path.join(docs_dir, RESOURCES_PATH)) as f:
+            resources = json.load(f)
+        docs = {RESOURCES_PATH: resources}
+        for api in resources['apis']:
+            path = 'ari/' + api['path'].replace('{format}', 'json').strip('/')
+            with open(os.path.join(docs_dir, path)) as f:
+                docs[path] = json.load(f)
+        return docs
+
+    @staticmethod
+    def _is_same_spec(docs, other_docs):
+        # basePath of the cached resources.json is rewritten to the cache directory
+        def without_base_path(docs):
+            resources = dict(docs[RESOURCES_PATH])
+            resources.pop('basePath', None)
+            return dict(docs, **{RESOURCES_PATH: resources})
+        return without_base_path(docs) == without_base_path(other_docs)
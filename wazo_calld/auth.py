@@ -1,10 +1,15 @@
 # Copyright 2015-2019 The Wazo Authors  (see the AUTHORS file)
 # SPDX-License-Identifier: GPL-3.0-or-later
 
+import iso8601
 import logging
+import threading
+import time
 
+from collections import OrderedDict
 from flask import request
 from requests import HTTPError
+from wazo_auth_client import Client as AuthClient
 from xivo import auth_verifier
 
 from wazo_calld.exceptions import TokenWithUserUUIDRequiredError
@@ -15,11 +20,103 @@ extract_token_id_from_query_or_header = auth_verifier.extract_token_id_from_quer
 Unauthorized = auth_verifier.Unauthorized
 
 
+class TokenCache:
+    '''Token informations from wazo-auth, by token and required ACL.
+
+    Valid tokens are kept at most `ttl` seconds, and never after they expire.
+    A token valid for an ACL is also cached for the lookups without ACL.
+    Tokens of a session deleted in wazo-auth are forgotten right away.'''
+
+    def __init__(self):
+        self._auth_client = None
+        self._ttl = 0
+        self._max_size = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    def set_config(self, auth_config, cache_config):
+        self._auth_client = AuthClient(**auth_config)
+        self._ttl = cache_config['ttl']
+        self._max_size = cache_config['max_size']
+
+    def is_configured(self):
+        return self._auth_client is not None
+
+    def get(self, token, required_acl=None):
+        key = (token, required_acl)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry['expires_at'] > now:
+                self._hits += 1
+                self._entries.move_to_end(key)
+                return entry['token_infos']
+            self._misses += 1
+
+        token_infos = self._auth_client.token.get(token, required_acl)
+        if self._ttl:
+            self._add(key, token_infos, now)
+            if required_acl is not None:
+                # any valid entry of the token answers a lookup without ACL
+                self._add((token, None), token_infos, now)
+        return token_infos
+
+    def is_valid(self, token, required_acl=None):
+        try:
+            self.get(token, required_acl)
+        except HTTPError as e:
+            if e.response is not None and e.response.status_code in (401, 403, 404):
+                return False
+            raise
+        return True
+
+    def on_session_deleted(self, event):
+        session_uuid = event['uuid']
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if entry['token_infos'].get('session_uuid') == session_uuid:
+                    del self._entries[key]
+
+    def provide_status(self, status):
+        with self._lock:
+            status['token_cache']['size'] = len(self._entries)
+            status['token_cache']['hits'] = self._hits
+            status['token_cache']['misses'] = self._misses
+
+    def _add(self, key, token_infos, now):
+        expires_at = now + self._ttl
+        utc_expires_at = token_infos.get('utc_expires_at')
+        if utc_expires_at:
+            token_expiry = iso8601.parse_date(utc_expires_at).timestamp()
+            expires_at = min(expires_at, token_expiry)
+
+        with self._lock:
+            self._entries[key] = {'token_infos': token_infos, 'expires_at': expires_at}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+
+class TokenCacheClient:
+    '''The part of the wazo-auth client used by the AuthVerifier, backed by the token cache'''
+
+    def __init__(self, token_cache):
+        self.token = token_cache
+
+
+token_cache = TokenCache()
+
+
 def get_token_user_uuid_from_request(auth_client, token=None):
     if not token:
         token = request.headers.get('X-Auth-Token') or request.args.get('token')
     try:
-        token_infos = auth_client.token.get(token)
+        if token_cache.is_configured():
+            token_infos = token_cache.get(token)
+        else:
+            token_infos = auth_client.token.get(token)
     except HTTPError as e:
         logger.warning('HTTP error from wazo-auth while getting token: %s', e)
         raise TokenWithUserUUIDRequiredError()
@@ -3,6 +3,7 @@
 
 import kombu
 import logging
+import time
 
 from kombu import binding
 from kombu import Connection
@@ -15,14 +16,45 @@ from xivo_bus import Marshaler
 from xivo_bus import Publisher
 from xivo_bus import PublishingQueue
 
+from .dispatch import (
+    ShardedDispatcher,
+    is_shard_safe,
+)
+
 logger = logging.getLogger(__name__)
 
+ACK_MAX_DELAY = 0.5
+
 ROUTING_KEY_MAPPING = {
+    'context_created': 'config.contexts.created',
+    'context_deleted': 'config.contexts.deleted',
+    'context_edited': 'config.contexts.edited',
+    'extension_created': 'config.extensions.created',
+    'extension_deleted': 'config.extensions.deleted',
+    'extension_edited': 'config.extensions.edited',
+    'custom_endpoint_edited': 'config.custom_endpoint.edited',
+    'line_deleted': 'config.line.deleted',
+    'line_edited': 'config.line.edited',
+    'line_endpoint_custom_associated': 'config.lines.*.endpoints.custom.*.updated',
+    'line_endpoint_custom_dissociated': 'config.lines.*.endpoints.custom.*.deleted',
+    'line_endpoint_sccp_associated': 'config.lines.*.endpoints.sccp.*.updated',
+    'line_endpoint_sccp_dissociated': 'config.lines.*.endpoints.sccp.*.deleted',
+    'line_endpoint_sip_associated': 'config.lines.*.endpoints.sip.*.updated',
+    'line_endpoint_sip_dissociated': 'config.lines.*.endpoints.sip.*.deleted',
+    'sccp_endpoint_edited': 'config.sccp_endpoint.edited',
+    'sip_endpoint_edited': 'config.sip_endpoint.edited',
+    'user_deleted': 'config.user.deleted',
+    'user_edited': 'config.user.edited',
+    'user_line_associated': 'config.user_line_association.created',
+    'user_line_dissociated': 'config.user_line_association.deleted',
+    'user_voicemail_associated': 'config.users.*.voicemails.updated',
+    'user_voicemail_dissociated': 'config.users.*.voicemails.deleted',
     'application_created': 'config.applications.created',
     'application_deleted': 'config.applications.deleted',
     'application_edited': 'config.applications.edited',
     'moh_created': 'config.moh.created',
     'moh_deleted': 'config.moh.deleted',
+    'session_deleted': 'auth.sessions.*.deleted',
 }
 
 
@@ -65,21 +97,54 @@ class CoreBusConsumer(ConsumerMixin):
         self._queue = kombu.Queue(exclusive=True)
         self._is_running = False
 
+        consumer_config = global_config['bus']['consumer']
+        if consumer_config['workers']:
+            self._prefetch_count = consumer_config['prefetch_count'] or None
+            self._ack_batch_size = consumer_config['ack_batch_size']
+            if self._prefetch_count:
+                # the broker stops sending messages when prefetch_count messages are not acked
+                self._ack_batch_size = max(1, min(self._ack_batch_size, self._prefetch_count // 2))
+        else:
+            # events are handled by the consumer thread: no prefetch limit and one ack per message
+            self._prefetch_count = None
+            self._ack_batch_size = 1
+        self._unacked_message = None
+        self._unacked_count = 0
+        self._unacked_since = None
+        self._dispatcher = ShardedDispatcher(
+            'bus_events',
+            workers=consumer_config['workers'],
+            queue_size=consumer_config['queue_size'],
+        )
+        self._lag = 0.0
+
     def run(self):
         logger.info("Running AMQP consumer")
-        with Connection(self._bus_url) as connection:
-            self.connection = connection
+        self._dispatcher.start()
+        try:
+            with Connection(self._bus_url) as connection:
+                self.connection = connection
 
-            super().run()
+                super().run()
+        finally:
+            self._dispatcher.stop()
 
     def get_consumers(self, Consumer, channel):
         return [
-            Consumer(self._queue, callbacks=[self._on_bus_message])
+            Consumer(self._queue, callbacks=[self._on_bus_message], prefetch_count=self._prefetch_count)
         ]
 
+    def on_iteration(self):
+        # called after each message and each second without message
+        if self._unacked_message and time.monotonic() - self._unacked_since >= ACK_MAX_DELAY:
+            self._flush_acks()
+
     def on_connection_error(self, exc, interval):
         super().on_connection_error(exc, interval)
         self._is_running = False
+        # the delivery tags of the closed channel can not be acked anymore
+        self._unacked_message = None
+        self._unacked_count = 0
 
     def on_connection_revived(self):
         super().on_connection_revived()
@@ -90,18 +155,30 @@ class CoreBusConsumer(ConsumerMixin):
 
     def provide_status(self, status):
         status['bus_consumer']['status'] = Status.ok if self.is_running() else Status.fail
+        status['bus_consumer']['event_queues'] = self._dispatcher.queue_depths()
+        status['bus_consumer']['lag'] = self._lag
 
     def on_ami_event(self, event_type, callback):
         logger.debug('Added callback on AMI event "%s"', event_type)
         self._queue.bindings.add(binding(self._exchange, routing_key='ami.{}'.format(event_type)))
-        self._events_pubsub.subscribe(event_type, callback)
+        self._events_pubsub.subscribe(event_type, self._dispatched(callback))
 
     def on_event(self, event_name, callback):
         logger.debug('Added callback on event "%s"', event_name)
         self._queue.bindings.add(
             kombu.binding(self._exchange, routing_key=ROUTING_KEY_MAPPING[event_name])
         )
-        self._events_pubsub.subscribe(event_name, callback)
+        self._events_pubsub.subscribe(event_name, self._dispatched(callback))
+
+    def _dispatched(self, callback):
+        # the other handlers keep running one at a time, in the order of the events
+        if not is_shard_safe(callback):
+            return callback
+
+        def dispatch(event):
+            # events about the same channel are handled in order by the same worker
+            self._dispatcher.submit(event.get('Uniqueid'), self._run, callback, event, time.monotonic())
+        return dispatch
 
     def _on_bus_message(self, body, message):
         try:
@@ -112,7 +189,32 @@ class CoreBusConsumer(ConsumerMixin):
         else:
             self._events_pubsub.publish(event_type, event)
         finally:
+            self._ack(message)
+
+    def _run(self, callback, event, received_at):
+        self._lag = time.monotonic() - received_at
+        callback(event)
+
+    def _ack(self, message):
+        if self._ack_batch_size == 1:
             message.ack()
+            return
+
+        if not self._unacked_message:
+            self._unacked_since = time.monotonic()
+        self._unacked_message = message
+        self._unacked_count += 1
+        if self._unacked_count >= self._ack_batch_size:
+            self._flush_acks()
+
+    def _flush_acks(self):
+        if not self._unacked_message:
+            return
+
+        # acks all the messages received before this one on the same channel
+        self._unacked_message.ack(multiple=True)
+        self._unacked_message = None
+        self._unacked_count = 0
 
     def _is_ami_event(self, event):
         return 'Event' in event
@@ -1,7 +1,9 @@
 # Copyright (C) 2015-2016 Avencall
 # SPDX-License-Identifier: GPL-3.0-or-later
 
+import copy
 import logging
+import threading
 
 from kombu import Connection
 from kombu import Exchange
@@ -14,6 +16,44 @@ from xivo_bus import PublishingQueue
 logger = logging.getLogger(__name__)
 
 
+class CollectdAggregator:
+    '''Sum the counters and average the gauges of identical collectd events.
+
+    Events are identified by (plugin, plugin_instance, type, type_instance),
+    i.e. (app, app_instance) and the stat for the calls. flush() returns one
+    event per identifier, in the same format as the aggregated ones.'''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def add(self, event):
+        key = (event.plugin, event.plugin_instance, event.type_, event.type_instance)
+        values = [float(value) for value in event.values]
+        with self._lock:
+            stat = self._stats.get(key)
+            if not stat:
+                self._stats[key] = {'event': event, 'count': 1, 'values': values}
+                return
+            stat['count'] += 1
+            stat['values'] = [total + value for total, value in zip(stat['values'], values)]
+
+    def flush(self):
+        with self._lock:
+            stats, self._stats = self._stats, {}
+
+        events = []
+        for stat in stats.values():
+            event = copy.copy(stat['event'])
+            if event.type_ == 'gauge':
+                values = [round(total / stat['count'], 3) for total in stat['values']]
+            else:
+                values = [int(total) for total in stat['values']]
+            event.values = tuple(str(value) for value in values)
+            events.append(event)
+        return events
+
+
 class CoreCollectd:
 
     def __init__(self, global_config):
@@ -21,10 +61,17 @@ class CoreCollectd:
         self.config.update(global_config['collectd'])
         self._uuid = global_config['uuid']
         self._publisher = PublishingQueue(self._make_publisher)
+        self._flush_interval = global_config['collectd']['flush_interval']
+        self._aggregator = CollectdAggregator()
+        self._stopped = threading.Event()
 
     def run(self):
         logger.info("Running AMQP publisher")
 
+        if self._flush_interval:
+            flush_thread = threading.Thread(target=self._flush_periodically, name='collectd_flush_thread')
+            flush_thread.daemon = True
+            flush_thread.start()
         self._publisher.run()
 
     def _make_publisher(self):
@@ -39,7 +86,20 @@ class CoreCollectd:
         return Publisher(bus_producer, bus_marshaler)
 
     def publish(self, event):
-        self._publisher.publish(event)
+        if self._flush_interval:
+            self._aggregator.add(event)
+        else:
+            self._publisher.publish(event)
+
+    def _flush_periodically(self):
+        while not self._stopped.wait(self._flush_interval):
+            self._flush()
+
+    def _flush(self):
+        for event in self._aggregator.flush():
+            self._publisher.publish(event)
 
     def stop(self):
+        self._stopped.set()
+        self._flush()
         self._publisher.stop()
@@ -24,6 +24,11 @@ _DEFAULT_CONFIG = {
         'port': _DEFAULT_HTTPS_PORT,
         'certificate': _CERT_FILE,
         'private_key': '/usr/share/xivo-certs/server.key',
+        'min_threads': 10,
+        'max_threads': 10,
+        'max_queued_requests': 100,
+        'overload_queue_depth': 50,
+        'overload_retry_after': 1,
         'cors': {
             'enabled': True,
             'allow_headers': ['Content-Type'],
@@ -41,8 +46,20 @@ _DEFAULT_CONFIG = {
             'password': 'opensesame',
         },
         'reconnection_delay': 10,
+        'reload_delay': 0.5,
         'startup_connection_tries': 10,
         'startup_connection_delay': 1,
+        'cache': {
+            'enabled': False,
+        },
+        'dispatch': {
+            'workers': 0,
+            'queue_size': 1000,
+        },
+        'docs_cache': {
+            'enabled': False,
+            'directory': '/var/cache/wazo-calld/ari',
+        },
     },
     'auth': {
         'host': 'localhost',
@@ -50,6 +67,18 @@ _DEFAULT_CONFIG = {
         'verify_certificate': _CERT_FILE,
         'key_file': '/var/lib/wazo-auth-keys/wazo-calld-key.yml',
     },
+    'token_cache': {
+        'ttl': 30,
+        'max_size': 10000,
+    },
+    'dialplan_cache': {
+        'ttl': 60,
+        'max_size': 10000,
+    },
+    'confd_cache': {
+        'ttl': 300,
+        'max_size': 10000,
+    },
     'bus': {
         'username': 'guest',
         'password': 'guest',
@@ -57,9 +86,23 @@ _DEFAULT_CONFIG = {
         'port': 5672,
         'exchange_name': 'xivo',
         'exchange_type': 'topic',
+        'consumer': {
+            'prefetch_count': 100,
+            'ack_batch_size': 20,
+            'workers': 0,
+            'queue_size': 1000,
+        },
+    },
+    'applications': {
+        'call_format_workers': 10,
+    },
+    'calls': {
+        'update_window': 0.05,
+        'user_index_reconcile_interval': 60,
     },
     'collectd': {
         'exchange_name': 'collectd',
+        'flush_interval': 10,
     },
     'confd': {
         'host': 'localhost',
@@ -14,14 +14,39 @@ from xivo.status import StatusAggregator, TokenStatus
 from xivo.token_renewer import TokenRenewer
 
 from .ari_ import CoreARI
+from .auth import token_cache
 from .bus import CoreBusConsumer
 from .bus import CoreBusPublisher
 from .collectd import CoreCollectd
+from .helpers.ami import dialplan_cache
+from .helpers.confd import confd_cache
 from .http_server import api, HTTPServer
 from .service_discovery import self_check
 
 logger = logging.getLogger(__name__)
 
+DIALPLAN_EVENTS = (
+    'context_created',
+    'context_deleted',
+    'context_edited',
+    'extension_created',
+    'extension_deleted',
+    'extension_edited',
+)
+ENDPOINT_EVENTS = (
+    'custom_endpoint_edited',
+    'sccp_endpoint_edited',
+    'sip_endpoint_edited',
+)
+LINE_ENDPOINT_EVENTS = (
+    'line_endpoint_custom_associated',
+    'line_endpoint_custom_dissociated',
+    'line_endpoint_sccp_associated',
+    'line_endpoint_sccp_dissociated',
+    'line_endpoint_sip_associated',
+    'line_endpoint_sip_dissociated',
+)
+
 
 class Controller:
 
@@ -33,6 +58,8 @@ class Controller:
         self.bus_consumer = CoreBusConsumer(config)
         self.collectd = CoreCollectd(config)
         self.http_server = HTTPServer(config)
+        dialplan_cache.set_config(config['dialplan_cache'])
+        confd_cache.set_config(config['confd_cache'])
         self.status_aggregator = StatusAggregator()
         self.token_renewer = TokenRenewer(auth_client)
         self.token_status = TokenStatus()
@@ -68,6 +95,26 @@ class Controller:
         self.status_aggregator.add_provider(self.ari.provide_status)
         self.status_aggregator.add_provider(self.bus_consumer.provide_status)
         self.status_aggregator.add_provider(self.token_status.provide_status)
+        self.status_aggregator.add_provider(token_cache.provide_status)
+        self.status_aggregator.add_provider(self.http_server.provide_status)
+        self.bus_consumer.on_event('session_deleted', token_cache.on_session_deleted)
+        self.status_aggregator.add_provider(dialplan_cache.provide_status)
+        self.bus_consumer.on_ami_event('Reload', dialplan_cache.invalidate)
+        for event_name in DIALPLAN_EVENTS:
+            self.bus_consumer.on_event(event_name, dialplan_cache.invalidate)
+        self.status_aggregator.add_provider(confd_cache.provide_status)
+        self.bus_consumer.on_event('user_edited', confd_cache.on_user_event)
+        self.bus_consumer.on_event('user_deleted', confd_cache.on_user_event)
+        self.bus_consumer.on_event('user_voicemail_associated', confd_cache.on_user_voicemail_event)
+        self.bus_consumer.on_event('user_voicemail_dissociated', confd_cache.on_user_voicemail_event)
+        self.bus_consumer.on_event('line_edited', confd_cache.on_line_event)
+        self.bus_consumer.on_event('line_deleted', confd_cache.on_line_event)
+        self.bus_consumer.on_event('user_line_associated', confd_cache.on_user_line_event)
+        self.bus_consumer.on_event('user_line_dissociated', confd_cache.on_user_line_event)
+        for event_name in ENDPOINT_EVENTS:
+            self.bus_consumer.on_event(event_name, confd_cache.on_endpoint_event)
+        for event_name in LINE_ENDPOINT_EVENTS:
+            self.bus_consumer.on_event(event_name, confd_cache.on_line_endpoint_event)
         bus_producer_thread = Thread(target=self.bus_publisher.run, name='bus_producer_thread')
         bus_producer_thread.start()
         collectd_thread = Thread(target=self.collectd.run, name='collectd_thread')
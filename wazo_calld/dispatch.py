@@ -0,0 +1,110 @@
+# Copyright 2019 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+STOP_TIMEOUT = 5
+_STOP = object()
+
+
+def shard_safe(callback):
+    '''Mark an event handler that may run on the workers of a ShardedDispatcher.
+
+    The handler must only depend on the order of the events with the same
+    key, e.g. the events of the same channel, and must guard the state it
+    shares with other handlers. The other handlers keep running one at a time,
+    in the order of the events.'''
+    callback.shard_safe = True
+    return callback
+
+
+def is_shard_safe(callback):
+    return getattr(callback, 'shard_safe', False)
+
+
+class ShardedDispatcher:
+    '''Run callbacks on a fixed pool of worker threads.
+
+    Callbacks submitted with the same key always run on the same worker, in
+    submission order, while callbacks with different keys may run in
+    parallel. When a worker queue is full, submit blocks until there is room.
+    With no workers, callbacks are run synchronously in the submitting thread.'''
+
+    def __init__(self, name, workers=0, queue_size=0):
+        self._name = name
+        self._queues = [queue.Queue(maxsize=queue_size) for _ in range(workers)]
+        self._threads = []
+
+    def start(self):
+        if self._threads:
+            return
+
+        for index, worker_queue in enumerate(self._queues):
+            thread = threading.Thread(
+                target=self._run,
+                args=(worker_queue,),
+                name='{}_worker_{}'.format(self._name, index),
+            )
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=STOP_TIMEOUT):
+        '''Run the pending callbacks for at most `timeout` seconds, then drop them'''
+        deadline = time.monotonic() + timeout
+        for worker_queue in self._queues if self._threads else ():
+            try:
+                worker_queue.put(_STOP, timeout=max(0, deadline - time.monotonic()))
+            except queue.Full:
+                self._drop_pending(worker_queue)
+        for thread in self._threads:
+            thread.join(max(0, deadline - time.monotonic()))
+            if thread.is_alive():
+                logger.warning('%s: %s did not stop', self._name, thread.name)
+        self._threads = []
+
+    def submit(self, key, callback, *args, **kwargs):
+        if not self._queues:
+            callback(*args, **kwargs)
+            return
+
+        self._queues[self._shard(key)].put((callback, args, kwargs))
+
+    def queue_depths(self):
+        return [worker_queue.qsize() for worker_queue in self._queues]
+
+    def _drop_pending(self, worker_queue):
+        dropped = 0
+        while True:
+            try:
+                worker_queue.get_nowait()
+            except queue.Empty:
+                break
+            dropped += 1
+        logger.warning('%s: dropped %s pending callbacks', self._name, dropped)
+        try:
+            worker_queue.put_nowait(_STOP)
+        except queue.Full:
+            pass  # the worker threads are daemons
+
+    def _shard(self, key):
+        if key is None:
+            return 0
+        return hash(key) % len(self._queues)
+
+    def _run(self, worker_queue):
+        while True:
+            task = worker_queue.get()
+            if task is _STOP:
+                return
+
+            callback, args, kwargs = task
+            try:
+                callback(*args, **kwargs)
+            except Exception:
+                logger.exception('%s: error while running %s', self._name, callback)
@@ -3,7 +3,10 @@
 
 import logging
 import re
+import threading
+import time
 
+from collections import OrderedDict
 from requests import RequestException
 
 from wazo_calld.exceptions import WazoAmidError
@@ -13,6 +16,69 @@ logger = logging.getLogger(__name__)
 MOH_CLASS_RE = re.compile(r'^Class: (.+)$')
 
 
+class DialplanCache:
+    '''Priorities of the dialplan extensions, by context and extension.
+
+    Missing extensions are cached too, as an empty set of priorities. Entries
+    are kept at most `ttl` seconds and the whole cache is dropped when the
+    dialplan may have changed. A ttl of 0 disables the cache.'''
+
+    def __init__(self):
+        self._ttl = 0
+        self._max_size = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._hits = 0
+        self._misses = 0
+
+    def set_config(self, cache_config):
+        self._ttl = cache_config['ttl']
+        self._max_size = cache_config['max_size']
+
+    def get(self, context, exten):
+        '''Return (priorities, generation). priorities is None when unknown.'''
+        if not self._ttl:
+            return None, None
+
+        key = (context, exten)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry['expires_at'] > time.time():
+                self._hits += 1
+                self._entries.move_to_end(key)
+                return entry['priorities'], self._generation
+            self._misses += 1
+            return None, self._generation
+
+    def set(self, context, exten, priorities, generation):
+        if not self._ttl:
+            return
+
+        key = (context, exten)
+        with self._lock:
+            if generation != self._generation:
+                return  # the dialplan changed while it was read
+            self._entries[key] = {'priorities': priorities, 'expires_at': time.time() + self._ttl}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, event=None):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def provide_status(self, status):
+        with self._lock:
+            status['dialplan_cache']['size'] = len(self._entries)
+            status['dialplan_cache']['hits'] = self._hits
+            status['dialplan_cache']['misses'] = self._misses
+
+
+dialplan_cache = DialplanCache()
+
+
 def set_variable_ami(amid, channel_id, variable, value):
     try:
         parameters = {'Channel': channel_id,
@@ -28,13 +94,22 @@ def unset_variable_ami(amid, channel_id, variable):
 
 
 def extension_exists(amid, context, exten, priority=1):
+    priorities, generation = dialplan_cache.get(context, exten)
+    if priorities is None:
+        priorities = _extension_priorities(amid, context, exten)
+        dialplan_cache.set(context, exten, priorities, generation)
+
+    return str(priority) in priorities
+
+
+def _extension_priorities(amid, context, exten):
     try:
         response = amid.action('ShowDialplan', {'Context': context,
                                                 'Extension': exten})
     except RequestException as e:
         raise WazoAmidError(amid, e)
 
-    return str(priority) in (event['Priority'] for event in response if event.get('Event') == 'ListDialplan')
+    return frozenset(event['Priority'] for event in response if event.get('Event') == 'ListDialplan')
 
 
 def moh_class_exists(amid, moh_class):
@@ -85,21 +85,27 @@ class GlobalVariableConstantNameAdapter:
 
 class Channel:
 
-    def __init__(self, channel_id, ari):
+    def __init__(self, channel_id, ari, ari_cache=None, snapshot=None):
         self.id = channel_id
         self._ari = ari
+        self._ari_cache = ari_cache
+        self._snapshot = snapshot
 
     def __str__(self):
         return self.id
 
+    def bridges(self):
+        if self._ari_cache:
+            return self._ari_cache.list_channel_bridges(self.id)
+        return [bridge for bridge in self._ari.bridges.list() if self.id in bridge.json['channels']]
+
     def connected_channels(self):
-        channel_ids = set(sum((bridge.json['channels'] for bridge in self._ari.bridges.list()
-                               if self.id in bridge.json['channels']), list()))
+        channel_ids = set(sum((bridge.json['channels'] for bridge in self.bridges()), list()))
         try:
             channel_ids.remove(self.id)
         except KeyError:
             pass
-        return {Channel(channel_id, self._ari) for channel_id in channel_ids}
+        return {Channel(channel_id, self._ari, self._ari_cache) for channel_id in channel_ids}
 
     def only_connected_channel(self):
         connected_channels = self.connected_channels()
@@ -109,7 +115,7 @@ class Channel:
             channel_id = connected_channels.pop().id
         except KeyError:
             raise NotEnoughChannels()
-        return Channel(channel_id, self._ari)
+        return Channel(channel_id, self._ari, self._ari_cache)
 
     def user(self, default=None):
         if self.is_local():
@@ -127,14 +133,14 @@ class Channel:
 
     def exists(self):
         try:
-            self._ari.channels.get(channelId=self.id)
+            self._get_channel()
             return True
         except ARINotFound:
             return False
 
     def is_local(self):
         try:
-            channel = self._ari.channels.get(channelId=self.id)
+            channel = self._get_channel()
         except ARINotFound:
             return False
 
@@ -163,6 +169,9 @@ class Channel:
             return False
 
     def is_sip(self):
+        if self._snapshot:
+            return self._snapshot.json['name'].startswith('PJSIP/')
+
         try:
             return self._get_var('CHANNEL(channeltype)') == 'PJSIP'
         except ARINotFound:
@@ -170,12 +179,12 @@ class Channel:
 
     def dialed_extension(self):
         try:
-            channel = self._ari.channels.get(channelId=self.id)
+            channel = self._get_channel()
         except ARINotFound:
             return
 
         try:
-            return channel.getChannelVar(variable='XIVO_BASE_EXTEN')['value']
+            return self._get_var('XIVO_BASE_EXTEN', channel)
         except ARINotFound:
             return channel.json['dialplan']['exten']
 
@@ -202,5 +211,35 @@ class Channel:
         except ARINotFound:
             return
 
-    def _get_var(self, var):
+    def get_variable(self, variable, default=None):
+        try:
+            return self._get_var(variable)
+        except ARINotFound:
+            return default
+
+    def _get_channel(self):
+        if self._snapshot:
+            return self._snapshot
+        if self._ari_cache:
+            return self._ari_cache.get_channel(self.id)
+        return self._ari.channels.get(channelId=self.id)
+
+    def _channelvars(self):
+        if self._snapshot:
+            return self._snapshot.json.get('channelvars') or {}
+        if self._ari_cache:
+            return self._ari_cache.get_channelvars(self.id)
+        return {}
+
+    def _get_var(self, var, channel=None):
+        # variables listed in the channelvars option of ari.conf are embedded in the
+        # channel snapshots, with an empty value when they are not set
+        channelvars = self._channelvars()
+        if var in channelvars:
+            if not channelvars[var]:
+                raise ARINotFound(self._ari, KeyError(var))
+            return channelvars[var]
+
+        if channel:
+            return channel.getChannelVar(variable=var)['value']
         return self._ari.channels.getChannelVar(channelId=self.id, variable=var)['value']
@@ -1,6 +1,10 @@
 # Copyright 2016-2019 The Wazo Authors  (see the AUTHORS file)
 # SPDX-License-Identifier: GPL-3.0-or-later
 
+import threading
+import time
+
+from collections import OrderedDict
 from requests import HTTPError
 from requests import RequestException
 
@@ -20,6 +24,97 @@ def not_found(error):
     return error.response is not None and error.response.status_code == 404
 
 
+class ConfdCache:
+    '''Users and lines from wazo-confd, by ID and tenant.
+
+    Entries are kept at most `ttl` seconds and are forgotten when wazo-confd
+    sends an event about them. Errors are never cached. A ttl of 0 disables
+    the cache.'''
+
+    def __init__(self):
+        self._ttl = 0
+        self._max_size = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._hits = 0
+        self._misses = 0
+
+    def set_config(self, cache_config):
+        self._ttl = cache_config['ttl']
+        self._max_size = cache_config['max_size']
+
+    def get_user(self, confd_client, user_uuid, tenant_uuid=None):
+        return self._get(('user', user_uuid, tenant_uuid),
+                         lambda: confd_client.users.get(user_uuid, tenant_uuid=tenant_uuid))
+
+    def get_line(self, confd_client, line_id, tenant_uuid=None):
+        return self._get(('line', line_id, tenant_uuid),
+                         lambda: confd_client.lines.get(line_id, tenant_uuid=tenant_uuid))
+
+    def on_user_event(self, event):
+        self._invalidate('user', event.get('uuid'))
+
+    def on_user_voicemail_event(self, event):
+        self._invalidate('user', event.get('user_uuid'))
+
+    def on_line_event(self, event):
+        self._invalidate('line', event.get('id'))
+
+    def on_user_line_event(self, event):
+        # older events only have the IDs of the user and the line
+        self._invalidate('user', event.get('user', {}).get('uuid'))
+        self._invalidate('line', event.get('line', {}).get('id', event.get('line_id')))
+
+    def on_line_endpoint_event(self, event):
+        # older events only have the IDs of the line and the endpoint
+        self._invalidate('line', event.get('line', {}).get('id', event.get('line_id')))
+
+    def on_endpoint_event(self, event):
+        # the lines of an endpoint are not known: all the lines are forgotten
+        self._invalidate('line', None)
+
+    def provide_status(self, status):
+        with self._lock:
+            status['confd_cache']['size'] = len(self._entries)
+            status['confd_cache']['hits'] = self._hits
+            status['confd_cache']['misses'] = self._misses
+
+    def _get(self, key, fetch):
+        if not self._ttl:
+            return fetch()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry['expires_at'] > time.time():
+                self._hits += 1
+                self._entries.move_to_end(key)
+                return entry['resource']
+            self._misses += 1
+            generation = self._generation
+
+        resource = fetch()
+
+        with self._lock:
+            if generation != self._generation:
+                return resource  # an event was received while the resource was read
+            self._entries[key] = {'resource': resource, 'expires_at': time.time() + self._ttl}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+        return resource
+
+    def _invalidate(self, kind, resource_id):
+        with self._lock:
+            self._generation += 1
+            for key in list(self._entries):
+                if key[0] == kind and (resource_id is None or key[1] == resource_id):
+                    del self._entries[key]
+
+
+confd_cache = ConfdCache()
+
+
 class User:
 
     # TODO set tenant_uuid mandatory when calls plugin will be multi-tenant
@@ -30,7 +125,7 @@ class User:
 
     def main_line(self):
         try:
-            lines = self._confd.users.get(self.uuid, tenant_uuid=self.tenant_uuid)['lines']
+            lines = confd_cache.get_user(self._confd, self.uuid, tenant_uuid=self.tenant_uuid)['lines']
         except HTTPError as e:
             if not_found(e):
                 raise InvalidUserUUID(self.uuid)
@@ -46,7 +141,7 @@ class User:
 
     def line(self, line_id):
         try:
-            lines = self._confd.users.get(self.uuid, tenant_uuid=self.tenant_uuid)['lines']
+            lines = confd_cache.get_user(self._confd, self.uuid, tenant_uuid=self.tenant_uuid)['lines']
         except HTTPError as e:
             if not_found(e):
                 raise InvalidUserUUID(self.uuid)
@@ -62,7 +157,7 @@ class User:
 
     def mobile_phone_number(self):
         try:
-            return self._confd.users.get(self.uuid, tenant_uuid=self.tenant_uuid)['mobile_phone_number']
+            return confd_cache.get_user(self._confd, self.uuid, tenant_uuid=self.tenant_uuid)['mobile_phone_number']
         except HTTPError as e:
             if not_found(e):
                 raise InvalidUserUUID(self.uuid)
@@ -81,7 +176,7 @@ class Line:
 
     def _get(self):
         try:
-            return self._confd.lines.get(self.id, tenant_uuid=self.tenant_uuid)
+            return confd_cache.get_line(self._confd, self.id, tenant_uuid=self.tenant_uuid)
         except HTTPError:
             raise
         except RequestException as e:
@@ -133,7 +228,7 @@ class Conference:
 
 def get_user_voicemail(user_uuid, confd_client):
     try:
-        return confd_client.users.get(user_uuid)['voicemail']
+        return confd_cache.get_user(confd_client, user_uuid)['voicemail']
     except IndexError:
         raise NoSuchUserVoicemail(user_uuid)
     except HTTPError as e:
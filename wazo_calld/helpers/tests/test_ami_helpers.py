@@ -8,9 +8,11 @@ from hamcrest import calling
 from hamcrest import is_
 from hamcrest import raises
 from mock import Mock
+from mock import patch
 from unittest import TestCase
 
 from wazo_calld.exceptions import WazoAmidError
+from ..ami import DialplanCache
 from ..ami import extension_exists
 from ..ami import moh_class_exists
 
@@ -140,3 +142,48 @@ class TestExtensionExists(TestCase):
         result = moh_class_exists(amid, moh_class)
 
         assert_that(result, is_(True))
+
+
+class TestExtensionExistsCache(TestCase):
+
+    def setUp(self):
+        self.amid = Mock()
+        self.amid.action.return_value = [
+            {
+                "Extension": SOME_EXTEN,
+                "Priority": "1",
+                "Context": SOME_CONTEXT,
+                "Event": "ListDialplan"
+            },
+        ]
+        self.cache = DialplanCache()
+        self.cache.set_config({'ttl': 60, 'max_size': 10})
+        patcher = patch('wazo_calld.helpers.ami.dialplan_cache', self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_given_cached_extension_when_extension_exists_then_amid_not_called_again(self):
+        extension_exists(self.amid, SOME_CONTEXT, SOME_EXTEN)
+
+        assert_that(extension_exists(self.amid, SOME_CONTEXT, SOME_EXTEN, priority=1), is_(True))
+        assert_that(extension_exists(self.amid, SOME_CONTEXT, SOME_EXTEN, priority=2), is_(False))
+        assert_that(self.amid.action.call_count, is_(1))
+
+    def test_given_invalidated_cache_when_extension_exists_then_amid_called_again(self):
+        extension_exists(self.amid, SOME_CONTEXT, SOME_EXTEN)
+
+        self.cache.invalidate({'Event': 'Reload'})
+        extension_exists(self.amid, SOME_CONTEXT, SOME_EXTEN)
+
+        assert_that(self.amid.action.call_count, is_(2))
+
+    def test_given_dialplan_changed_while_read_then_result_not_cached(self):
+        def invalidate_and_reply(*args):
+            self.cache.invalidate()
+            return []
+        self.amid.action.side_effect = invalidate_and_reply
+
+        extension_exists(self.amid, SOME_CONTEXT, SOME_EXTEN)
+        extension_exists(self.amid, SOME_CONTEXT, SOME_EXTEN)
+
+        assert_that(self.amid.action.call_count, is_(2))
@@ -53,3 +53,34 @@ class TestChannelHelper(TestCase):
         result = channel.dialed_extension()
 
         assert_that(result, equal_to(s.exten))
+
+    def test_user_from_snapshot_channelvars(self):
+        snapshot = Mock(json={'name': 'PJSIP/abcdef-00000001',
+                              'channelvars': {'XIVO_USERUUID': s.user_uuid}})
+
+        channel = Channel(s.channel_id, self.ari, snapshot=snapshot)
+        result = channel.user()
+
+        assert_that(result, equal_to(s.user_uuid))
+        assert_that(self.ari.channels.getChannelVar.called, equal_to(False))
+
+    def test_user_from_snapshot_channelvars_when_unset(self):
+        snapshot = Mock(json={'name': 'PJSIP/abcdef-00000001',
+                              'channelvars': {'XIVO_USERUUID': ''}})
+
+        channel = Channel(s.channel_id, self.ari, snapshot=snapshot)
+        result = channel.user(default=s.default)
+
+        assert_that(result, equal_to(s.default))
+        assert_that(self.ari.channels.getChannelVar.called, equal_to(False))
+
+    def test_get_variable_missing_from_snapshot_channelvars(self):
+        snapshot = Mock(json={'channelvars': {}})
+        self.ari.channels.getChannelVar.return_value = {'value': s.value}
+
+        channel = Channel(s.channel_id, self.ari, snapshot=snapshot)
+        result = channel.get_variable('WAZO_CALL_MUTED')
+
+        assert_that(result, equal_to(s.value))
+        self.ari.channels.getChannelVar.assert_called_once_with(channelId=s.channel_id,
+                                                                variable='WAZO_CALL_MUTED')
@@ -10,10 +10,13 @@ from hamcrest import (
     raises,
 )
 from mock import Mock
+from mock import patch
 from unittest import TestCase
 
 from wazo_calld.exceptions import WazoConfdUnreachable
+from ..confd import ConfdCache
 from ..confd import Line
+from ..confd import User
 
 
 class TestLine(TestCase):
@@ -41,3 +44,71 @@ class TestLine(TestCase):
             'name': 'abcdef',
         }
         assert_that(self.line.interface_autoanswer(), equal_to('sccp/abcdef/autoanswer'))
+
+
+class TestConfdCache(TestCase):
+
+    def setUp(self):
+        self.confd_client = Mock()
+        self.confd_client.users.get.return_value = {'lines': [{'id': 42}], 'mobile_phone_number': '5555'}
+        self.confd_client.lines.get.return_value = {'protocol': 'sip', 'name': 'abcdef', 'context': 'default'}
+        self.cache = ConfdCache()
+        self.cache.set_config({'ttl': 60, 'max_size': 10})
+        patcher = patch('wazo_calld.helpers.confd.confd_cache', self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_user_and_line_are_fetched_once(self):
+        user = User('user-uuid', self.confd_client)
+
+        user.main_line().interface()
+        user.main_line().context()
+        user.mobile_phone_number()
+
+        assert_that(self.confd_client.users.get.call_count, equal_to(1))
+        assert_that(self.confd_client.lines.get.call_count, equal_to(1))
+
+    def test_user_edited_invalidates_the_user(self):
+        user = User('user-uuid', self.confd_client)
+        user.mobile_phone_number()
+
+        self.cache.on_user_event({'uuid': 'user-uuid', 'id': 1})
+        user.mobile_phone_number()
+
+        assert_that(self.confd_client.users.get.call_count, equal_to(2))
+
+    def test_user_line_associated_invalidates_the_user_and_the_line(self):
+        User('user-uuid', self.confd_client).main_line().context()
+
+        self.cache.on_user_line_event({'user': {'uuid': 'user-uuid'}, 'line': {'id': 42}})
+        User('user-uuid', self.confd_client).main_line().context()
+
+        assert_that(self.confd_client.users.get.call_count, equal_to(2))
+        assert_that(self.confd_client.lines.get.call_count, equal_to(2))
+
+    def test_line_endpoint_associated_invalidates_the_line(self):
+        Line(42, self.confd_client).interface()
+
+        self.cache.on_line_endpoint_event({'line': {'id': 42}, 'endpoint_sip': {'id': 7}})
+        Line(42, self.confd_client).interface()
+
+        assert_that(self.confd_client.lines.get.call_count, equal_to(2))
+
+    def test_endpoint_edited_invalidates_the_lines(self):
+        Line(42, self.confd_client).interface()
+        User('user-uuid', self.confd_client).mobile_phone_number()
+
+        self.cache.on_endpoint_event({'id': 7})
+        Line(42, self.confd_client).interface()
+        User('user-uuid', self.confd_client).mobile_phone_number()
+
+        assert_that(self.confd_client.lines.get.call_count, equal_to(2))
+        assert_that(self.confd_client.users.get.call_count, equal_to(1))
+
+    def test_size_is_bounded(self):
+        for line_id in range(20):
+            Line(line_id, self.confd_client).context()
+
+        status = {'confd_cache': {}}
+        self.cache.provide_status(status)
+        assert_that(status['confd_cache'], equal_to({'size': 10, 'hits': 0, 'misses': 20}))
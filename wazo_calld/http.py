@@ -15,12 +15,25 @@ from xivo import (
 )
 from xivo.auth_verifier import AuthVerifier
 
+from .auth import (
+    TokenCacheClient,
+    token_cache,
+)
 from .exceptions import (
     AsteriskARIError,
     AsteriskARIUnreachable,
 )
 
-auth_verifier = AuthVerifier()
+
+class CachedAuthVerifier(AuthVerifier):
+
+    def client(self):
+        if token_cache.is_configured():
+            return TokenCacheClient(token_cache)
+        return super().client()
+
+
+auth_verifier = CachedAuthVerifier()
 
 
 def handle_ari_exception(func):
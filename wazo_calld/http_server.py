@@ -1,8 +1,12 @@
 # Copyright 2015-2019 The Wazo Authors  (see the AUTHORS file)
 # SPDX-License-Identifier: GPL-3.0-or-later
 
+import json
 import logging
 import os
+import socket
+import threading
+import time
 
 from cheroot import wsgi
 from datetime import timedelta
@@ -13,6 +17,7 @@ from werkzeug.contrib.fixers import ProxyFix
 from xivo import http_helpers
 from xivo.http_helpers import ReverseProxied
 
+from .auth import token_cache
 from .http import auth_verifier
 
 VERSION = 1.0
@@ -30,6 +35,66 @@ def log_request_params(response):
     return response
 
 
+class LoadShedder:
+    '''Answer 503 at accept time while too many connections are waiting for a worker thread'''
+
+    def __init__(self, thread_pool, max_queue_depth, retry_after):
+        self._thread_pool = thread_pool
+        self._max_queue_depth = max_queue_depth
+        self._retry_after = retry_after
+        self.rejected = 0
+
+    def __getattr__(self, name):
+        return getattr(self._thread_pool, name)
+
+    def put(self, conn):
+        # Called from the accept loop, before any worker thread is taken
+        if self._thread_pool.qsize < self._max_queue_depth:
+            self._thread_pool.put(conn)
+            return
+
+        self.rejected += 1
+        logger.warning('Rejecting connection from %s: server overloaded', getattr(conn, 'remote_addr', None))
+        body = json.dumps({
+            'message': 'Server overloaded',
+            'error_id': 'server-overloaded',
+            'details': {},
+            'timestamp': time.time(),
+        })
+        response = ''.join([
+            'HTTP/1.1 503 Service Unavailable\r\n',
+            'Content-Type: application/json\r\n',
+            'Content-Length: {}\r\n'.format(len(body)),
+            'Retry-After: {}\r\n'.format(self._retry_after),
+            'Connection: close\r\n\r\n',
+            body,
+        ])
+        try:
+            conn.wfile.write(response.encode('ISO-8859-1'))
+            conn.wfile.flush()
+        except socket.error as e:
+            logger.debug('Could not send 503 to %s: %s', getattr(conn, 'remote_addr', None), e)
+        finally:
+            conn.close()
+
+
+class RequestCounter:
+
+    def __init__(self, wsgi_app):
+        self._wsgi_app = wsgi_app
+        self._lock = threading.Lock()
+        self.in_flight = 0
+
+    def __call__(self, environ, start_response):
+        with self._lock:
+            self.in_flight += 1
+        try:
+            return self._wsgi_app(environ, start_response)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
 class HTTPServer:
 
     def __init__(self, global_config):
@@ -44,8 +109,11 @@ class HTTPServer:
         adapter_app.after_request(log_request_params)
         adapter_app.permanent_session_lifetime = timedelta(minutes=5)
         auth_verifier.set_config(global_config['auth'])
+        token_cache.set_config(global_config['auth'], global_config['token_cache'])
         self._load_cors()
         self.server = None
+        self._load_shedder = None
+        self._request_counter = None
 
     def _load_cors(self):
         cors_config = dict(self.config.get('cors', {}))
@@ -55,9 +123,22 @@ class HTTPServer:
 
     def run(self):
         wsgi_app_https = ReverseProxied(ProxyFix(wsgi.WSGIPathInfoDispatcher({'/': app})))
+        self._request_counter = RequestCounter(wsgi_app_https)
 
         bind_addr = (self.config['listen'], self.config['port'])
-        self.server = wsgi.WSGIServer(bind_addr=bind_addr, wsgi_app=wsgi_app_https)
+        self.server = wsgi.WSGIServer(
+            bind_addr=bind_addr,
+            wsgi_app=self._request_counter,
+            numthreads=self.config['min_threads'],
+            max=self.config['max_threads'],
+            accepted_queue_size=self.config['max_queued_requests'],
+        )
+        self._load_shedder = LoadShedder(
+            self.server.requests,
+            max_queue_depth=self.config['overload_queue_depth'],
+            retry_after=self.config['overload_retry_after'],
+        )
+        self.server.requests = self._load_shedder
         self.server.ssl_adapter = http_helpers.ssl_adapter(
             self.config['certificate'],
             self.config['private_key'],
@@ -81,3 +162,10 @@ class HTTPServer:
     def stop(self):
         if self.server:
             self.server.stop()
+
+    def provide_status(self, status):
+        if not self._load_shedder:
+            return
+        status['rest_api']['queued_requests'] = self._load_shedder.qsize
+        status['rest_api']['in_flight_requests'] = self._request_counter.in_flight
+        status['rest_api']['rejected_requests'] = self._load_shedder.rejected
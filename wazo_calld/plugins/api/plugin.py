@@ -2,11 +2,15 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 
-from .resources import SwaggerResource
+from .resources import (
+    APISpec,
+    SwaggerResource,
+)
 
 
 class Plugin:
 
     def load(self, dependencies):
         api = dependencies['api']
-        api.add_resource(SwaggerResource, '/api/api.yml')
+        api_spec = APISpec(SwaggerResource.api_filename)
+        api.add_resource(SwaggerResource, '/api/api.yml', resource_class_args=[api_spec])
@@ -1,10 +1,12 @@
-# Copyright 2016-2017 The Wazo Authors  (see the AUTHORS file)
+# Copyright 2016-2019 The Wazo Authors  (see the AUTHORS file)
 # SPDX-License-Identifier: GPL-3.0-or-later
 
+import hashlib
+import json
 import logging
 import yaml
 
-from flask import make_response
+from flask import make_response, request
 from flask_restful import Resource
 from xivo.chain_map import ChainMap
 from xivo.rest_api_helpers import load_all_api_specs
@@ -12,14 +14,34 @@ from xivo.rest_api_helpers import load_all_api_specs
 logger = logging.getLogger(__name__)
 
 
+class APISpec:
+    '''The API spec of all the plugins, merged and serialized once'''
+
+    def __init__(self, api_filename):
+        api_spec = dict(ChainMap(*load_all_api_specs('wazo_calld.plugins', api_filename)))
+        self.exists = bool(api_spec.get('info'))
+        self.yaml = yaml.dump(api_spec)
+        self.yaml_etag = hashlib.sha1(self.yaml.encode('utf-8')).hexdigest()
+        self.json = json.dumps(api_spec)
+        self.json_etag = hashlib.sha1(self.json.encode('utf-8')).hexdigest()
+
+
 class SwaggerResource(Resource):
 
     api_filename = "api.yml"
 
-    def get(self):
-        api_spec = ChainMap(*load_all_api_specs('wazo_calld.plugins', self.api_filename))
+    def __init__(self, api_spec):
+        self._api_spec = api_spec
 
-        if not api_spec.get('info'):
+    def get(self):
+        if not self._api_spec.exists:
             return {'error': "API spec does not exist"}, 404
 
-        return make_response(yaml.dump(dict(api_spec)), 200, {'Content-Type': 'application/x-yaml'})
+        if request.accept_mimetypes.best_match(['application/x-yaml', 'application/json']) == 'application/json':
+            response = make_response(self._api_spec.json, 200, {'Content-Type': 'application/json'})
+            response.set_etag(self._api_spec.json_etag)
+        else:
+            response = make_response(self._api_spec.yaml, 200, {'Content-Type': 'application/x-yaml'})
+            response.set_etag(self._api_spec.yaml_etag)
+        response.vary.add('Accept')
+        return response.make_conditional(request)
@@ -4,7 +4,10 @@
 import logging
 import threading
 
+from ari.exceptions import ARINotFound
+
 from .exceptions import NoSuchApplication, NoSuchMoh
+from .stasis import AppNameHelper
 
 UNINITIALIZED_FMT = 'Received an event when {} cache is not initialized'
 UNINITIALIZED_APP = UNINITIALIZED_FMT.format('application')
@@ -137,3 +140,161 @@ class MohCache:
                 logger.debug(UNINITIALIZED_MOH)
                 return False
             return True
+
+
+class ApplicationMembersCache:
+    '''Channels and bridges of the Stasis applications, by application name.
+
+    The members are read with applications.get when the application is
+    registered and are then kept up to date with the ARI events. The sets are
+    replaced instead of modified, so that readers can use them without lock.
+    get() returns None when the application is not registered.'''
+
+    def __init__(self, ari):
+        self._ari = ari
+        self._lock = threading.Lock()
+        self._applications = {}
+
+    def subscribe(self):
+        self._ari.on_event('StasisStart', self._on_stasis_start)
+        self._ari.on_event('StasisEnd', self._on_stasis_end)
+        self._ari.on_event('BridgeCreated', self._on_bridge_created)
+        self._ari.on_event('ChannelEnteredBridge', self._on_bridge_created)
+        self._ari.on_event('ChannelLeftBridge', self._on_bridge_created)
+        self._ari.on_event('BridgeDestroyed', self._on_bridge_destroyed)
+        self._ari.on_event('ChannelDestroyed', self._on_channel_destroyed)
+
+    def add_application(self, app_name):
+        self._ari.on_application_registered(app_name, lambda: self._on_websocket_start(app_name))
+        self._ari.on_application_deregistered(app_name, lambda: self._on_websocket_stop(app_name))
+
+    def remove_application(self, app_name):
+        self._on_websocket_stop(app_name)
+
+    def add_channel(self, app_name, channel_id):
+        # originated channels are subscribed to the application before StasisStart
+        self._update(app_name, 'channel_ids', add=channel_id)
+
+    def get(self, app_name):
+        with self._lock:
+            members = self._applications.get(app_name)
+        if members is None:
+            return None
+        return dict(members, name=app_name)
+
+    def _on_websocket_start(self, app_name):
+        try:
+            application = self._ari.applications.get(applicationName=app_name)
+        except ARINotFound:
+            logger.debug('application %s not found', app_name)
+            return
+        except Exception as e:
+            logger.error('could not read the members of application %s: %s', app_name, e)
+            return
+
+        with self._lock:
+            self._applications[app_name] = {
+                'channel_ids': frozenset(application['channel_ids']),
+                'bridge_ids': frozenset(application['bridge_ids']),
+            }
+
+    def _on_websocket_stop(self, app_name):
+        with self._lock:
+            self._applications.pop(app_name, None)
+
+    def _on_stasis_start(self, event):
+        self._update(event.get('application'), 'channel_ids', add=event['channel']['id'])
+
+    def _on_stasis_end(self, event):
+        self._update(event.get('application'), 'channel_ids', discard=event['channel']['id'])
+
+    def _on_channel_destroyed(self, event):
+        # the channel may leave before entering Stasis, without StasisEnd
+        with self._lock:
+            app_names = list(self._applications)
+        for app_name in app_names:
+            self._update(app_name, 'channel_ids', discard=event['channel']['id'])
+
+    def _on_bridge_created(self, event):
+        self._update(event.get('application'), 'bridge_ids', add=event['bridge']['id'])
+
+    def _on_bridge_destroyed(self, event):
+        self._update(event.get('application'), 'bridge_ids', discard=event['bridge']['id'])
+
+    def _update(self, app_name, kind, add=None, discard=None):
+        with self._lock:
+            members = self._applications.get(app_name)
+            if members is None:
+                return
+            ids = members[kind]
+            if add is not None and add not in ids:
+                ids = ids | {add}
+            if discard is not None and discard in ids:
+                ids = ids - {discard}
+            if ids is not members[kind]:
+                self._applications[app_name] = dict(members, **{kind: ids})
+
+
+class CallVariablesCache:
+    '''X_WAZO_ variables of the application calls, by channel ID.
+
+    The variables of a call are read once, with set(), and are then kept up to
+    date with the ChannelVarset events until the call leaves the application.
+    The variables set before the first set() of a call are kept aside.'''
+
+    prefix = 'X_WAZO_'
+
+    def __init__(self, ari):
+        self._ari = ari
+        self._lock = threading.Lock()
+        self._variables = {}
+        self._pending = {}
+
+    def subscribe(self):
+        self._ari.on_event('ChannelVarset', self._on_channel_variable_set)
+        self._ari.on_event('StasisEnd', self._on_channel_gone)
+        self._ari.on_event('ChannelDestroyed', self._on_channel_gone)
+
+    def get(self, channel_id):
+        with self._lock:
+            variables = self._variables.get(channel_id)
+            return dict(variables) if variables is not None else None
+
+    def set(self, channel_id, variables):
+        variables = dict(variables)
+        with self._lock:
+            for name, value in self._pending.pop(channel_id, {}).items():
+                self._set_variable(variables, name, value)
+            self._variables[channel_id] = variables
+            return dict(variables)
+
+    def _on_channel_variable_set(self, event):
+        channel = event.get('channel')
+        if not channel or not AppNameHelper.to_uuid(event.get('application')):
+            return
+
+        name = event['variable'].lstrip('_')
+        if not name.startswith(self.prefix):
+            return
+
+        name = name[len(self.prefix):]
+        with self._lock:
+            variables = self._variables.get(channel['id'])
+            if variables is None:
+                self._pending.setdefault(channel['id'], {})[name] = event['value']
+            else:
+                self._set_variable(variables, name, event['value'])
+
+    @staticmethod
+    def _set_variable(variables, name, value):
+        # setting an empty value removes the variable
+        if value:
+            variables[name] = value
+        else:
+            variables.pop(name, None)
+
+    def _on_channel_gone(self, event):
+        channel_id = event['channel']['id']
+        with self._lock:
+            self._variables.pop(channel_id, None)
+            self._pending.pop(channel_id, None)
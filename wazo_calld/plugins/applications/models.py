@@ -1,6 +1,10 @@
 # Copyright 2018-2019 The Wazo Authors  (see the AUTHORS file)
 # SPDX-License-Identifier: GPL-3.0-or-later
 
+import logging
+import threading
+
+from collections import defaultdict
 from uuid import uuid4
 from requests import HTTPError
 
@@ -12,6 +16,8 @@ from .exceptions import (
     NoSuchSnoop,
 )
 
+logger = logging.getLogger(__name__)
+
 
 class InvalidSnoopBridge(Exception):
     def __init__(self, bridge_id):
@@ -37,13 +43,39 @@ class ApplicationNode:
 
 
 class CallFormatter:
+    '''Build the ApplicationCall of channels.
+
+    from_channels formats many calls at once: the bridges are read once and
+    the calls are formatted concurrently on `executor`, when one is given.'''
 
-    def __init__(self, application, ari=None):
+    def __init__(self, application, ari=None, ari_cache=None, snoops=None, executor=None):
         self._application = application
         self._ari = ari
-        self._snoop_list = None
+        self._ari_cache = ari_cache
+        self._snoops = snoops
+        self._executor = executor
 
     def from_channel(self, channel, variables=None, node_uuid=None):
+        return self._format(channel, variables, node_uuid)
+
+    def from_channels(self, channels, get_variables=None):
+        node_uuids = None
+        if self._ari is not None:
+            bridges = self._ari_cache.list_bridges() if self._ari_cache else self._ari.bridges.list()
+            node_uuids = {}
+            for bridge in bridges:
+                for channel_id in bridge.json['channels']:
+                    node_uuids.setdefault(channel_id, bridge.id)
+
+        def format_call(channel):
+            variables = get_variables(channel) if get_variables else None
+            return self._format(channel, variables, None, node_uuids)
+
+        if not self._executor:
+            return [format_call(channel) for channel in channels]
+        return list(self._executor.map(format_call, channels))
+
+    def _format(self, channel, variables, node_uuid, node_uuids=None):
         call = ApplicationCall(channel.id)
         call.creation_time = channel.json['creationtime']
         call.status = channel.json['state']
@@ -55,33 +87,20 @@ class CallFormatter:
             call.node_uuid = node_uuid
 
         if self._ari is not None:
-            channel_helper = _ChannelHelper(channel.id, self._ari)
+            channel_helper = _ChannelHelper(channel.id, self._ari, self._ari_cache, snapshot=channel)
             call.on_hold = channel_helper.on_hold()
             call.is_caller = channel_helper.is_caller()
             call.dialed_extension = channel_helper.dialed_extension()
-            try:
-                call.moh_uuid = channel.getChannelVar(variable='WAZO_MOH_UUID').get('value') or None
-            except ARINotFound:
-                call.moh_uuid = None
-
-            try:
-                call.user_uuid = channel.getChannelVar(variable='XIVO_USERUUID').get('value')
-            except ARINotFound:
-                call.user_uuid = None
-
-            try:
-                call.tenant_uuid = channel.getChannelVar(variable='WAZO_TENANT_UUID').get('value')
-            except ARINotFound:
-                call.tenant_uuid = None
-
-            try:
-                call.muted = channel.getChannelVar(variable='WAZO_CALL_MUTED').get('value') == '1'
-            except ARINotFound:
-                call.muted = False
+            call.moh_uuid = channel_helper.get_variable('WAZO_MOH_UUID') or None
+            call.user_uuid = channel_helper.get_variable('XIVO_USERUUID')
+            call.tenant_uuid = channel_helper.get_variable('WAZO_TENANT_UUID')
+            call.muted = channel_helper.get_variable('WAZO_CALL_MUTED') == '1'
 
             call.node_uuid = getattr(call, 'node_uuid', None)
-            for bridge in self._ari.bridges.list():
-                if channel.id in bridge.json['channels']:
+            if node_uuids is not None:
+                call.node_uuid = node_uuids.get(channel.id, call.node_uuid)
+            else:
+                for bridge in channel_helper.bridges():
                     call.node_uuid = bridge.id
                     break
 
@@ -94,15 +113,11 @@ class CallFormatter:
         return call
 
     def _get_snoops(self, channel):
-        if self._snoop_list is None:
-            if not self._ari:
-                return {}
-
-            snoop_helper = SnoopHelper(self._ari)
-            self._snoop_list = snoop_helper.list_(self._application)
+        if self._snoops is None:
+            return {}
 
         result = {}
-        for snoop in self._snoop_list:
+        for snoop in self._snoops.list_by_call(self._application, channel.id):
             if channel.id == snoop.snooped_call_id:
                 result[snoop.uuid] = {
                     'uuid': snoop.uuid,
@@ -146,6 +161,11 @@ class _Snoop:
         self._bridge = kwargs.get('bridge')
         self._snoop_channel = kwargs.get('snoop_channel')
 
+    @property
+    def snoop_channel_id(self):
+        if self._snoop_channel:
+            return self._snoop_channel.id
+
     def create_bridge(self, ari):
         self._bridge = ari.bridges.createWithId(
             bridgeId=self.uuid,
@@ -210,6 +230,7 @@ class _Snoop:
     @classmethod
     def from_bridge(cls, ari, application, bridge):
         snoop_channel = None
+        snooping_call_id = None
 
         for channel_id in bridge.json['channels']:
             try:
@@ -221,7 +242,7 @@ class _Snoop:
             except ARINotFound:
                 continue
 
-        if not snoop_channel:
+        if not snoop_channel or not snooping_call_id:
             raise InvalidSnoopBridge(bridge.id)
 
         snooped_call_id = cls.get_snooped_call_id(snoop_channel)
@@ -246,10 +267,172 @@ class _Snoop:
         return snoop_channel.getChannelVar(variable=cls._whisper_mode_chan_var)['value']
 
 
-class SnoopHelper:
+class SnoopRegistry:
+    '''Snoops of the applications, by application and by call.
+
+    The snoops of an application are read from the snoop bridges on first use,
+    then kept up to date by the snoop operations and the ARI events. They are
+    read again after Asterisk reconnects. The bridges are read without holding
+    the lock, once per application, while the other readers of the same
+    application wait.'''
 
     def __init__(self, ari):
         self._ari = ari
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._loaded = set()
+        self._loading = {}
+        self._removed_while_loading = set()
+        self._snoops = {}
+        self._by_application = defaultdict(set)
+        self._by_call = defaultdict(set)
+
+    def subscribe(self):
+        self._ari.on_event('BridgeDestroyed', self._on_bridge_destroyed)
+
+    @staticmethod
+    def is_snoop_bridge(application_uuid, bridge_json):
+        return bridge_json['name'] == _Snoop.bridge_name_tpl.format(application_uuid)
+
+    def add(self, snoop):
+        self._load(snoop.application)
+        with self._lock:
+            self._add(snoop)
+
+    def get(self, application, snoop_uuid):
+        self._load(application)
+        with self._lock:
+            snoop = self._snoops.get(str(snoop_uuid))
+            if snoop and snoop.application['uuid'] == application['uuid']:
+                return snoop
+
+    def list_(self, application):
+        self._load(application)
+        with self._lock:
+            snoop_uuids = self._by_application.get(application['uuid'], ())
+            return [self._snoops[snoop_uuid] for snoop_uuid in snoop_uuids]
+
+    def list_by_call(self, application, call_id):
+        self._load(application)
+        with self._lock:
+            snoop_uuids = self._by_call.get(call_id, ())
+            return [self._snoops[snoop_uuid] for snoop_uuid in snoop_uuids
+                    if self._snoops[snoop_uuid].application['uuid'] == application['uuid']]
+
+    def remove(self, snoop_uuid):
+        with self._lock:
+            return self._remove(str(snoop_uuid))
+
+    def channel_left(self, application, snoop_uuid, channel_id):
+        '''Return the snoop, or None if it ended when `channel_id` left its bridge
+
+        A snoop ends when its snoop channel or the snooping call leaves. When
+        the snooping call leaves, the snoop bridge and channel are destroyed.'''
+        self._load(application)
+        with self._lock:
+            snoop = self._snoops.get(str(snoop_uuid))
+            if not snoop:
+                return None
+            if channel_id not in (snoop.snoop_channel_id, snoop.snooping_call_id):
+                return snoop
+            self._remove(snoop.uuid)
+
+        if channel_id == snoop.snooping_call_id:
+            snoop.destroy()
+        return None
+
+    def reset(self):
+        with self._lock:
+            self._generation += 1
+            self._loaded = set()
+            self._snoops = {}
+            self._by_application = defaultdict(set)
+            self._by_call = defaultdict(set)
+
+    def _on_bridge_destroyed(self, event):
+        self.remove(event['bridge']['id'])
+
+    def _load(self, application):
+        application_uuid = application['uuid']
+        with self._lock:
+            if application_uuid in self._loaded:
+                return
+            loading = self._loading.get(application_uuid)
+            if loading:
+                is_loader = False
+            else:
+                is_loader = True
+                loading = self._loading[application_uuid] = threading.Event()
+            generation = self._generation
+
+        if not is_loader:
+            loading.wait()
+            return
+
+        try:
+            snoops = self._read_snoops(application)
+        except Exception as e:
+            logger.error('could not read the snoops of application %s: %s', application_uuid, e)
+            snoops = None
+
+        with self._lock:
+            del self._loading[application_uuid]
+            if snoops is not None and generation == self._generation:
+                for snoop in snoops:
+                    if snoop.uuid not in self._removed_while_loading:
+                        self._add(snoop)
+                self._loaded.add(application_uuid)
+                logger.debug('snoops of application %s loaded', application_uuid)
+            if not self._loading:
+                self._removed_while_loading = set()
+        loading.set()
+
+    def _read_snoops(self, application):
+        snoops = []
+        bridge_name = _Snoop.bridge_name_tpl.format(application['uuid'])
+        for bridge in self._ari.bridges.list():
+            if bridge.json['name'] != bridge_name:
+                continue
+            try:
+                snoops.append(_Snoop.from_bridge(self._ari, application, bridge))
+            except InvalidSnoopBridge:
+                pass
+        return snoops
+
+    def _add(self, snoop):
+        self._snoops[snoop.uuid] = snoop
+        self._by_application[snoop.application['uuid']].add(snoop.uuid)
+        self._by_call[snoop.snooped_call_id].add(snoop.uuid)
+        self._by_call[snoop.snooping_call_id].add(snoop.uuid)
+
+    def _remove(self, snoop_uuid):
+        if self._loading:
+            self._removed_while_loading.add(snoop_uuid)
+
+        snoop = self._snoops.pop(snoop_uuid, None)
+        if not snoop:
+            return None
+
+        self._discard(self._by_application, snoop.application['uuid'], snoop_uuid)
+        self._discard(self._by_call, snoop.snooped_call_id, snoop_uuid)
+        self._discard(self._by_call, snoop.snooping_call_id, snoop_uuid)
+        return snoop
+
+    @staticmethod
+    def _discard(index, key, snoop_uuid):
+        snoop_uuids = index.get(key)
+        if snoop_uuids is None:
+            return
+        snoop_uuids.discard(snoop_uuid)
+        if not snoop_uuids:
+            del index[key]
+
+
+class SnoopHelper:
+
+    def __init__(self, ari, snoops):
+        self._ari = ari
+        self._snoops = snoops
 
     def create(self, application, snooped_call_id, snooping_call_id, whisper_mode):
         self.validate_ownership(application, snooped_call_id, snooping_call_id)
@@ -262,10 +445,12 @@ class SnoopHelper:
         except Exception:
             snoop.destroy()
             raise
+        self._snoops.add(snoop)
         return snoop
 
     def delete(self, application, snoop_uuid):
         snoop = self.get(application, snoop_uuid)
+        self._snoops.remove(snoop.uuid)
         snoop.destroy()
 
     def edit(self, application, snoop_uuid, whisper_mode):
@@ -277,34 +462,13 @@ class SnoopHelper:
         return snoop
 
     def get(self, application, snoop_uuid):
-        uuid = str(snoop_uuid)
-        for snoop_bridge in self._snoop_bridges(application):
-            if snoop_bridge.id != uuid:
-                continue
-
-            try:
-                return _Snoop.from_bridge(self._ari, application, snoop_bridge)
-            except InvalidSnoopBridge:
-                pass
-
-        raise NoSuchSnoop(snoop_uuid)
+        snoop = self._snoops.get(application, snoop_uuid)
+        if not snoop:
+            raise NoSuchSnoop(snoop_uuid)
+        return snoop
 
     def list_(self, application):
-        result = []
-        for snoop_bridge in self._snoop_bridges(application):
-            try:
-                snoop = _Snoop.from_bridge(self._ari, application, snoop_bridge)
-            except InvalidSnoopBridge:
-                pass
-            else:
-                result.append(snoop)
-        return result
-
-    def _snoop_bridges(self, application):
-        bridge_name = _Snoop.bridge_name_tpl.format(application['uuid'])
-        for bridge in self._ari.bridges.list():
-            if bridge.json['name'] == bridge_name:
-                yield bridge
+        return self._snoops.list_(application)
 
     def validate_ownership(self, application, snooped_call_id, snooping_call_id=None):
         if snooped_call_id not in application['channel_ids']:
@@ -1,11 +1,19 @@
 # Copyright 2018-2019 The Wazo Authors  (see the AUTHORS file)
 # SPDX-License-Identifier: GPL-3.0-or-later
 
+from concurrent.futures import ThreadPoolExecutor
+
 from wazo_auth_client import Client as AuthClient
 from wazo_confd_client import Client as ConfdClient
 from wazo_amid_client import Client as AmidClient
 
-from .caches import ConfdApplicationsCache, MohCache
+from .caches import (
+    ApplicationMembersCache,
+    CallVariablesCache,
+    ConfdApplicationsCache,
+    MohCache,
+)
+from .models import SnoopRegistry
 from .notifier import ApplicationNotifier
 from .resources import (
     ApplicationCallAnswer,
@@ -33,6 +41,7 @@ from .resources import (
 )
 from .services import ApplicationService
 from .stasis import ApplicationStasis
+from .waiters import ChannelVariableWaiters
 
 
 class Plugin:
@@ -44,6 +53,7 @@ class Plugin:
         bus_consumer = dependencies['bus_consumer']
         bus_publisher = dependencies['bus_publisher']
         config = dependencies['config']
+        pubsub = dependencies['pubsub']
         token_changed_subscribe = dependencies['token_changed_subscribe']
         next_token_changed_subscribe = dependencies['next_token_changed_subscribe']
 
@@ -59,15 +69,35 @@ class Plugin:
         confd_apps_cache.subscribe(bus_consumer)
         moh_cache = MohCache(confd_client)
         moh_cache.subscribe(bus_consumer)
+        app_members_cache = ApplicationMembersCache(ari.client)
+        app_members_cache.subscribe()
+        call_variables_cache = CallVariablesCache(ari.client)
+        call_variables_cache.subscribe()
+        variable_waiters = ChannelVariableWaiters(ari.client)
+        variable_waiters.subscribe()
+        snoops = SnoopRegistry(ari.client)
+        snoops.subscribe()
+
+        executor = None
+        format_workers = config['applications']['call_format_workers']
+        if format_workers:
+            executor = ThreadPoolExecutor(max_workers=format_workers, thread_name_prefix='call_formatter')
+            pubsub.subscribe('stopping', lambda _: executor.shutdown())
 
         notifier = ApplicationNotifier(bus_publisher)
         service = ApplicationService(
             ari.client,
+            ari.cache,
             confd_client,
             amid_client,
             notifier,
             confd_apps_cache,
             moh_cache,
+            app_members_cache,
+            call_variables_cache,
+            variable_waiters,
+            snoops,
+            executor,
         )
 
         stasis = ApplicationStasis(
@@ -77,6 +107,8 @@ class Plugin:
             notifier,
             confd_apps_cache,
             moh_cache,
+            app_members_cache,
+            snoops,
         )
         next_token_changed_subscribe(stasis.initialize)
         confd_apps_cache.created_subscribe(stasis.add_ari_application)
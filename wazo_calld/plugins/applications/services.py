@@ -2,13 +2,13 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 import logging
-import time
 
 from requests import HTTPError
 from ari.exceptions import ARINotFound
 from wazo_calld.helpers import ami
 from wazo_calld.helpers import confd
 from wazo_calld.exceptions import InvalidExtension
+from .caches import CallVariablesCache
 from .models import (
     CallFormatter,
     make_node_from_bridge,
@@ -27,17 +27,26 @@ from .stasis import AppNameHelper
 
 logger = logging.getLogger(__name__)
 
+SET_VARIABLE_TIMEOUT = 0.2
+
 
 class ApplicationService:
 
-    def __init__(self, ari, confd, amid, notifier, confd_apps, moh):
+    def __init__(self, ari, ari_cache, confd, amid, notifier, confd_apps, moh, app_members, call_variables,
+                 variable_waiters, snoops, executor):
         self._ari = ari
+        self._ari_cache = ari_cache
+        self._app_members = app_members
+        self._call_variables = call_variables
+        self._variable_waiters = variable_waiters
         self._amid = amid
         self._notifier = notifier
         self._confd = confd
         self._confd_apps = confd_apps
         self._moh = moh
-        self._snoop_helper = SnoopHelper(self._ari)
+        self._snoops = snoops
+        self._executor = executor
+        self._snoop_helper = SnoopHelper(self._ari, snoops)
 
     def call_mute(self, application, call_id):
         try:
@@ -47,7 +56,7 @@ class ApplicationService:
         except ARINotFound:
             raise NoSuchCall(call_id)
 
-        formatter = CallFormatter(application, self._ari)
+        formatter = CallFormatter(application, self._ari, self._ari_cache, self._snoops)
         call = formatter.from_channel(channel)
         self._notifier.call_updated(application['uuid'], call)
 
@@ -59,7 +68,7 @@ class ApplicationService:
         except ARINotFound:
             raise NoSuchCall(call_id)
 
-        formatter = CallFormatter(application, self._ari)
+        formatter = CallFormatter(application, self._ari, self._ari_cache, self._snoops)
         call = formatter.from_channel(channel)
         self._notifier.call_updated(application['uuid'], call)
 
@@ -72,9 +81,9 @@ class ApplicationService:
         channel.answer()
 
     def start_user_outgoing_call(self, application, channel):
-        self.set_channel_var_sync(channel, 'WAZO_USER_OUTGOING_CALL', 'true')
+        self.set_channel_var(channel, 'WAZO_USER_OUTGOING_CALL', 'true')
         variables = self.get_channel_variables(channel)
-        formatter = CallFormatter(application, self._ari)
+        formatter = CallFormatter(application, self._ari, self._ari_cache, self._snoops)
         call = formatter.from_channel(channel, variables=variables)
         self._notifier.user_outgoing_call_created(application['uuid'], call)
 
@@ -138,8 +147,7 @@ class ApplicationService:
             self._notifier.destination_node_created(application['uuid'], node)
 
     def create_node_with_calls(self, application_uuid, call_ids):
-        bridges = self._ari.bridges.list()
-        self.validate_call_not_in_node(application_uuid, bridges, call_ids)
+        self.validate_call_not_in_node(application_uuid, call_ids)
 
         stasis_app = AppNameHelper.to_name(application_uuid)
         bridge = self._ari.bridges.create(name=application_uuid, type='mixing')
@@ -155,12 +163,13 @@ class ApplicationService:
         return node
 
     def get_application(self, application_uuid):
-        try:
-            application = self._ari.applications.get(
-                applicationName=AppNameHelper.to_name(application_uuid)
-            )
-        except ARINotFound:
-            raise NoSuchApplication(application_uuid)
+        app_name = AppNameHelper.to_name(application_uuid)
+        application = self._app_members.get(app_name)
+        if application is None:
+            try:
+                application = self._ari.applications.get(applicationName=app_name)
+            except ARINotFound:
+                raise NoSuchApplication(application_uuid)
 
         confd_app = self._confd_apps.get(application_uuid)
         node_uuid = application_uuid if confd_app['destination'] == 'node' else None
@@ -196,9 +205,14 @@ class ApplicationService:
             pass  # The bridge has already disappeared
 
     def get_channel_variables(self, channel):
+        variables = self._call_variables.get(channel.id)
+        if variables is not None:
+            return variables
+
         command = 'core show channel {}'.format(channel.json['name'])
         result = self._amid.command(command)
-        return {var: val for var, val in self._extract_variables(result['response'])}
+        variables = {var: val for var, val in self._extract_variables(result['response'])}
+        return self._call_variables.set(channel.id, variables)
 
     def get_node(self, application, node_uuid, verify_application=True):
         if verify_application:
@@ -233,8 +247,7 @@ class ApplicationService:
             self._ari.bridges.startMoh(bridgeId=application['uuid'], mohClass=moh)
 
     def join_node(self, application_uuid, node_uuid, call_ids, no_call_status_code=400):
-        bridges = self._ari.bridges.list()
-        self.validate_call_not_in_node(application_uuid, bridges, call_ids)
+        self.validate_call_not_in_node(application_uuid, call_ids)
 
         for call_id in call_ids:
             try:
@@ -248,14 +261,13 @@ class ApplicationService:
                     raise NoSuchCall(call_id, no_call_status_code)
                 raise
 
-    def validate_call_not_in_node(self, application_uuid, bridges, call_ids):
-        for bridge in bridges:
-            if str(bridge.id) == str(application_uuid):
-                # Allow to switch channel from default bridge
-                continue
-            for call_id in call_ids:
-                if call_id in bridge.json['channels']:
-                    raise CallAlreadyInNode(application_uuid, bridge.id, call_id)
+    def validate_call_not_in_node(self, application_uuid, call_ids):
+        for call_id in call_ids:
+            for bridge in self._ari_cache.list_channel_bridges(call_id):
+                if str(bridge.id) == str(application_uuid):
+                    # Allow to switch channel from default bridge
+                    continue
+                raise CallAlreadyInNode(application_uuid, bridge.id, call_id)
 
     def leave_node(self, application_uuid, node_uuid, call_id):
         try:
@@ -274,18 +286,16 @@ class ApplicationService:
             name = channel.json['name']
             return name.startswith('Local/') and name.endswith(';2')
 
-        formatter = CallFormatter(application, self._ari)
+        channels = {channel.id: channel for channel in self._ari_cache.list_channels()}
+        application_channels = []
         for channel_id in application['channel_ids']:
-            try:
-                channel = self._ari.channels.get(channelId=channel_id)
-            except ARINotFound:
-                continue
-
-            if is_wrong_side_of_local_channel(channel):
+            channel = channels.get(channel_id)
+            if not channel or is_wrong_side_of_local_channel(channel):
                 continue
+            application_channels.append(channel)
 
-            variables = self.get_channel_variables(channel)
-            yield formatter.from_channel(channel, variables=variables)
+        formatter = CallFormatter(application, self._ari, self._ari_cache, self._snoops, self._executor)
+        return formatter.from_channels(application_channels, get_variables=self.get_channel_variables)
 
     def list_nodes(self, application_uuid):
         try:
@@ -340,8 +350,9 @@ class ApplicationService:
             originate_kwargs['variables']['variables'][name] = value
 
         channel = self._ari.channels.originate(**originate_kwargs)
+        self._app_members.add_channel(originate_kwargs['app'], channel.id)
         variables = self.get_channel_variables(channel)
-        formatter = CallFormatter(application, self._ari)
+        formatter = CallFormatter(application, self._ari, self._ari_cache, self._snoops)
         return formatter.from_channel(channel, variables=variables, node_uuid=node_uuid)
 
     def originate_user(
@@ -372,9 +383,10 @@ class ApplicationService:
         )
 
     def originate_answered(self, application, channel):
+        self._app_members.add_channel(AppNameHelper.to_name(application['uuid']), channel.id)
         channel.answer()
         variables = self.get_channel_variables(channel)
-        formatter = CallFormatter(application, self._ari)
+        formatter = CallFormatter(application, self._ari, self._ari_cache, self._snoops)
         call = formatter.from_channel(channel, variables=variables)
         self._notifier.call_initiated(application['uuid'], call)
 
@@ -403,6 +415,9 @@ class ApplicationService:
         snoops = self._snoop_helper.list_(application)
         return snoops
 
+    def snoop_channel_left(self, application, snoop_uuid, channel_id):
+        return self._snoops.channel_left(application, snoop_uuid, channel_id)
+
     def start_call_hold(self, call_id):
         try:
             self._ari.channels.setChannelVar(channelId=call_id, variable='XIVO_ON_HOLD', value='1')
@@ -460,27 +475,38 @@ class ApplicationService:
 
     def set_channel_var_sync(self, channel, var, value):
         # TODO remove this when Asterisk gets fixed to set var synchronously
-        def get_value():
+        waiter = self._variable_waiters.expect(channel.id, var, value)
+        channel.setChannelVar(variable=var, value=value)
+        if not self._variable_waiters.wait(waiter, timeout=SET_VARIABLE_TIMEOUT):
+            logger.debug('no ChannelVarset event for %s, checking the variable', var)
             try:
-                return channel.getChannelVar(variable=var)['value']
+                current_value = channel.getChannelVar(variable=var)['value']
             except ARINotFound as e:
-                if e.original_error.response.reason == 'Variable Not Found':
-                    return None
-                raise
+                if e.original_error.response.reason != 'Variable Not Found':
+                    raise
+                current_value = None
+            if current_value != value:
+                raise Exception('failed to set channel variable {}={}'.format(var, value))
 
-        channel.setChannelVar(variable=var, value=value)
-        for _ in range(20):
-            if get_value() == value:
-                return
+        self._update_channelvars(channel, var, value)
 
-            logger.debug('waiting for a setvar to complete')
-            time.sleep(0.01)
+    def set_channel_var(self, channel, var, value):
+        # For the ARI event handlers: the ChannelVarset event of the variable
+        # can't be handled before they return
+        channel.setChannelVar(variable=var, value=value)
+        self._update_channelvars(channel, var, value, add=True)
 
-        raise Exception('failed to set channel variable {}={}'.format(var, value))
+    @staticmethod
+    def _update_channelvars(channel, var, value, add=False):
+        # keep the channel snapshot consistent with the variable we just set
+        channelvars = channel.json.get('channelvars')
+        if not add and (channelvars is None or var not in channelvars):
+            return
+        channel.json = dict(channel.json, channelvars=dict(channelvars or {}, **{var: value}))
 
     @staticmethod
     def _extract_variables(lines):
-        prefix = 'X_WAZO_'
+        prefix = CallVariablesCache.prefix
         for line in lines:
             if not line.startswith(prefix):
                 continue
@@ -3,9 +3,6 @@
 
 import logging
 
-from .exceptions import (
-    NoSuchSnoop,
-)
 from .models import (
     CallFormatter,
     make_node_from_bridge,
@@ -32,11 +29,14 @@ class AppNameHelper:
 
 class ApplicationStasis:
 
-    def __init__(self, ari, confd, service, notifier, confd_apps, moh):
+    def __init__(self, ari, confd, service, notifier, confd_apps, moh, app_members, snoops):
         self._ari = ari.client
+        self._ari_cache = ari.cache
+        self._app_members = app_members
         self._confd = confd
         self._confd_apps = confd_apps
         self._moh = moh
+        self._snoops = snoops
         self._core_ari = ari
         self._service = service
         self._notifier = notifier
@@ -64,11 +64,15 @@ class ApplicationStasis:
         if channel.json['name'].startswith('Snoop/'):
             application = self._service.get_application(application_uuid)
             snoop_uuid = event['bridge']['id']
-            try:
-                snoop = self._service.snoop_get(application, snoop_uuid)
+            snoop = self._service.snoop_channel_left(application, snoop_uuid, channel.id)
+            if snoop:
                 self._notifier.snoop_updated(application_uuid, snoop)
-            except NoSuchSnoop:
+            else:
                 self._notifier.snoop_deleted(application_uuid, snoop_uuid)
+        elif self._snoops.is_snoop_bridge(application_uuid, event['bridge']):
+            # the snoop is destroyed: snoop_deleted is sent when its snoop channel leaves
+            application = self._service.get_application(application_uuid)
+            self._service.snoop_channel_left(application, event['bridge']['id'], channel.id)
 
         self._channel_update_bridge(application_uuid, channel, event)
 
@@ -78,7 +82,7 @@ class ApplicationStasis:
         node = make_node_from_bridge_event(event.get('bridge'))
         self._notifier.node_updated(application_uuid, node)
 
-        formatter = CallFormatter(application, self._ari)
+        formatter = CallFormatter(application, self._ari, self._ari_cache, self._snoops)
         call = formatter.from_channel(channel)
         self._notifier.call_updated(application_uuid, call)
 
@@ -93,6 +97,7 @@ class ApplicationStasis:
         app_name = AppNameHelper.to_name(application['uuid'])
         self._ari.on_application_deregistered(app_name, self._on_websocket_stop)
         self._ari.on_application_registered(app_name, self._on_websocket_start)
+        self._app_members.add_application(app_name)
         self._core_ari.register_application(app_name)
         self._core_ari.reload()
         logger.debug('Stasis application added')
@@ -104,6 +109,7 @@ class ApplicationStasis:
         # Should be implemented in ari-py
         self._ari._app_registered_callbacks.pop(app_name, None)
         self._ari._app_deregistered_callbacks.pop(app_name, None)
+        self._app_members.remove_application(app_name)
 
         self._core_ari.deregister_application(app_name)
         self._core_ari.reload()
@@ -130,7 +136,7 @@ class ApplicationStasis:
             return
 
         application = self._service.get_application(application_uuid)
-        formatter = CallFormatter(application, self._ari)
+        formatter = CallFormatter(application, self._ari, self._ari_cache, self._snoops)
         call = formatter.from_channel(channel)
         self._notifier.call_deleted(application_uuid, call)
 
@@ -151,9 +157,9 @@ class ApplicationStasis:
 
         moh = self._moh.find_by_name(event['moh_class'])
         if moh:
-            self._service.set_channel_var_sync(channel, 'WAZO_MOH_UUID', str(moh['uuid']))
+            self._service.set_channel_var(channel, 'WAZO_MOH_UUID', str(moh['uuid']))
 
-        formatter = CallFormatter(application, self._ari)
+        formatter = CallFormatter(application, self._ari, self._ari_cache, self._snoops)
         call = formatter.from_channel(channel)
         self._notifier.call_updated(application_uuid, call)
 
@@ -164,8 +170,8 @@ class ApplicationStasis:
 
         application = self._service.get_application(application_uuid)
 
-        self._service.set_channel_var_sync(channel, 'WAZO_MOH_UUID', '')
-        formatter = CallFormatter(application, self._ari)
+        self._service.set_channel_var(channel, 'WAZO_MOH_UUID', '')
+        formatter = CallFormatter(application, self._ari, self._ari_cache, self._snoops)
         call = formatter.from_channel(channel)
         self._notifier.call_updated(application_uuid, call)
 
@@ -176,7 +182,7 @@ class ApplicationStasis:
 
         application = self._service.get_application(application_uuid)
 
-        formatter = CallFormatter(application, self._ari)
+        formatter = CallFormatter(application, self._ari, self._ari_cache, self._snoops)
         call = formatter.from_channel(channel)
 
         if channel.json['state'] == 'Up':
@@ -190,7 +196,7 @@ class ApplicationStasis:
 
             application = self._service.get_application(application_uuid)
 
-            formatter = CallFormatter(application, self._ari)
+            formatter = CallFormatter(application, self._ari, self._ari_cache, self._snoops)
             call = formatter.from_channel(channel)
 
             if event['value'] == '1':
@@ -231,6 +237,7 @@ class ApplicationStasis:
             app_name = AppNameHelper.to_name(app_uuid)
             self._ari.on_application_deregistered(app_name, self._on_websocket_stop)
             self._ari.on_application_registered(app_name, self._on_websocket_start)
+            self._app_members.add_application(app_name)
 
     def _create_destinations(self, applications):
         logger.info('Creating destination nodes')
@@ -245,7 +252,7 @@ class ApplicationStasis:
 
         application = self._service.get_application(application_uuid)
         variables = self._service.get_channel_variables(channel)
-        formatter = CallFormatter(application, self._ari)
+        formatter = CallFormatter(application, self._ari, self._ari_cache, self._snoops)
         call = formatter.from_channel(channel, variables=variables)
         self._notifier.call_entered(application['uuid'], call)
 
@@ -282,3 +289,4 @@ class ApplicationStasis:
 
     def _on_websocket_stop(self):
         self._destinations_created = False
+        self._snoops.reset()
@@ -0,0 +1,99 @@
+# Copyright 2019 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from hamcrest import (
+    assert_that,
+    equal_to,
+    has_entries,
+    none,
+)
+from mock import Mock
+from unittest import TestCase
+
+from ..caches import (
+    ApplicationMembersCache,
+    CallVariablesCache,
+)
+
+APP_NAME = 'wazo-app-00000000-0000-4000-8000-000000000001'
+
+
+class TestApplicationMembersCache(TestCase):
+
+    def setUp(self):
+        self.ari = Mock()
+        self.ari.applications.get.return_value = {
+            'name': APP_NAME,
+            'channel_ids': ['1'],
+            'bridge_ids': ['bridge-1'],
+        }
+        self.cache = ApplicationMembersCache(self.ari)
+
+    def test_given_not_registered_when_get_then_none(self):
+        assert_that(self.cache.get(APP_NAME), none())
+
+    def test_members_are_read_when_registered(self):
+        self.cache._on_websocket_start(APP_NAME)
+
+        assert_that(self.cache.get(APP_NAME), has_entries(
+            name=APP_NAME,
+            channel_ids={'1'},
+            bridge_ids={'bridge-1'},
+        ))
+
+    def test_members_are_updated_with_the_events(self):
+        self.cache._on_websocket_start(APP_NAME)
+        before = self.cache.get(APP_NAME)
+
+        self.cache._on_stasis_start({'application': APP_NAME, 'channel': {'id': '2'}})
+        self.cache._on_stasis_end({'application': APP_NAME, 'channel': {'id': '1'}})
+        self.cache._on_bridge_created({'application': APP_NAME, 'bridge': {'id': 'bridge-2'}})
+        self.cache._on_bridge_destroyed({'application': APP_NAME, 'bridge': {'id': 'bridge-1'}})
+
+        assert_that(self.cache.get(APP_NAME), has_entries(channel_ids={'2'}, bridge_ids={'bridge-2'}))
+        assert_that(before['channel_ids'], equal_to({'1'}))
+
+    def test_members_are_forgotten_when_deregistered(self):
+        self.cache._on_websocket_start(APP_NAME)
+
+        self.cache._on_websocket_stop(APP_NAME)
+
+        assert_that(self.cache.get(APP_NAME), none())
+
+
+class TestCallVariablesCache(TestCase):
+
+    def setUp(self):
+        self.cache = CallVariablesCache(Mock())
+
+    def varset(self, variable, value, channel_id='1'):
+        self.cache._on_channel_variable_set({
+            'application': APP_NAME,
+            'channel': {'id': channel_id},
+            'variable': variable,
+            'value': value,
+        })
+
+    def test_variables_are_updated_with_the_events(self):
+        self.cache.set('1', {'FOO': 'foo', 'BAR': 'bar'})
+
+        self.varset('X_WAZO_FOO', 'new-foo')
+        self.varset('__X_WAZO_BAZ', 'baz')
+        self.varset('X_WAZO_BAR', '')
+        self.varset('OTHER', 'other')
+
+        assert_that(self.cache.get('1'), equal_to({'FOO': 'new-foo', 'BAZ': 'baz'}))
+
+    def test_variables_set_before_they_are_read_are_kept(self):
+        self.varset('X_WAZO_FOO', 'new-foo')
+
+        variables = self.cache.set('1', {'FOO': 'foo'})
+
+        assert_that(variables, equal_to({'FOO': 'new-foo'}))
+
+    def test_variables_are_forgotten_when_the_call_leaves(self):
+        self.cache.set('1', {'FOO': 'foo'})
+
+        self.cache._on_channel_gone({'channel': {'id': '1'}})
+
+        assert_that(self.cache.get('1'), none())
@@ -0,0 +1,192 @@
+# Copyright 2019 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import threading
+
+from ari.exceptions import ARINotFound
+from concurrent.futures import ThreadPoolExecutor
+from hamcrest import (
+    assert_that,
+    contains,
+    empty,
+    equal_to,
+    has_properties,
+    none,
+    same_instance,
+)
+from mock import Mock
+from unittest import TestCase
+
+from ..models import (
+    CallFormatter,
+    SnoopRegistry,
+    _Snoop,
+)
+
+APPLICATION = {'uuid': '00000000-0000-4000-8000-000000000001'}
+OTHER_APPLICATION = {'uuid': '00000000-0000-4000-8000-000000000002'}
+
+
+class TestSnoopRegistry(TestCase):
+
+    def setUp(self):
+        self.ari = Mock()
+        self.ari.bridges.list.return_value = []
+        self.snoops = SnoopRegistry(self.ari)
+
+    def new_snoop(self, application=APPLICATION, uuid='snoop-1', snoop_channel_id='snoop-channel-1'):
+        return _Snoop(application, 'snooped-1', 'snooping-1', uuid=uuid, snoop_channel=Mock(id=snoop_channel_id))
+
+    def test_snoops_are_read_from_the_bridges_once(self):
+        snoop_bridge = Mock(id='snoop-1', json={
+            'name': 'wazo-app-snoop-{}'.format(APPLICATION['uuid']),
+            'channels': ['snooping-1', 'snoop-channel-1'],
+        })
+        other_bridge = Mock(json={'name': 'other', 'channels': []})
+        self.ari.bridges.list.return_value = [snoop_bridge, other_bridge]
+        channels = {
+            'snooping-1': Mock(id='snooping-1', json={'name': 'PJSIP/abc-00000001'}),
+            'snoop-channel-1': Mock(id='snoop-channel-1', json={'name': 'Snoop/abc-00000002'}),
+        }
+        self.ari.channels.get.side_effect = lambda channelId: channels[channelId]
+        channels['snoop-channel-1'].getChannelVar.return_value = {'value': 'snooped-1'}
+
+        self.snoops.list_(APPLICATION)
+        result = self.snoops.list_(APPLICATION)
+
+        assert_that(result, contains(has_properties(
+            uuid='snoop-1',
+            snooped_call_id='snooped-1',
+            snooping_call_id='snooping-1',
+        )))
+        self.ari.bridges.list.assert_called_once_with()
+
+    def test_snoops_are_indexed_by_call_and_application(self):
+        snoop = self.new_snoop()
+        self.snoops.add(snoop)
+        self.snoops.add(self.new_snoop(application=OTHER_APPLICATION, uuid='snoop-2'))
+
+        assert_that(self.snoops.list_by_call(APPLICATION, 'snooped-1'), contains(same_instance(snoop)))
+        assert_that(self.snoops.list_by_call(APPLICATION, 'snooping-1'), contains(same_instance(snoop)))
+        assert_that(self.snoops.list_by_call(APPLICATION, 'other'), empty())
+        assert_that(self.snoops.get(OTHER_APPLICATION, 'snoop-1'), none())
+
+    def test_removed_snoops_are_forgotten(self):
+        self.snoops.add(self.new_snoop())
+
+        self.snoops._on_bridge_destroyed({'bridge': {'id': 'snoop-1'}})
+
+        assert_that(self.snoops.list_(APPLICATION), empty())
+        assert_that(self.snoops.list_by_call(APPLICATION, 'snooped-1'), empty())
+
+    def test_snoop_ends_when_its_snoop_channel_leaves(self):
+        snoop = self.new_snoop()
+        self.snoops.add(snoop)
+
+        result = self.snoops.channel_left(APPLICATION, 'snoop-1', 'old-snoop-channel')
+        assert_that(result, same_instance(snoop))
+
+        result = self.snoops.channel_left(APPLICATION, 'snoop-1', 'snoop-channel-1')
+        assert_that(result, none())
+        assert_that(self.snoops.get(APPLICATION, 'snoop-1'), none())
+
+    def test_snoop_is_destroyed_when_the_snooping_call_leaves(self):
+        snoop = self.new_snoop()
+        snoop.destroy = Mock()
+        self.snoops.add(snoop)
+
+        result = self.snoops.channel_left(APPLICATION, 'snoop-1', 'snooping-1')
+
+        assert_that(result, none())
+        assert_that(self.snoops.list_by_call(APPLICATION, 'snooping-1'), empty())
+        snoop.destroy.assert_called_once_with()
+
+    def test_snoops_are_read_without_the_lock_once_per_application(self):
+        reading, release = threading.Event(), threading.Event()
+
+        def list_bridges():
+            reading.set()
+            release.wait(timeout=1)
+            return []
+
+        self.ari.bridges.list.side_effect = list_bridges
+        reader = threading.Thread(target=self.snoops.list_, args=(APPLICATION,))
+        reader.start()
+        reading.wait(timeout=1)
+
+        assert_that(self.snoops.remove('other'), none())
+        assert_that(reader.is_alive(), equal_to(True))
+        waiter = threading.Thread(target=self.snoops.list_, args=(APPLICATION,))
+        waiter.start()
+        release.set()
+        reader.join()
+        waiter.join()
+
+        self.ari.bridges.list.assert_called_once_with()
+
+    def test_call_formatter_uses_the_registry(self):
+        self.snoops.add(self.new_snoop())
+        formatter = CallFormatter(APPLICATION, snoops=self.snoops)
+        channel = Mock(id='snooped-1', json={
+            'creationtime': '2019-01-01T00:00:00.000-0500',
+            'state': 'Up',
+            'caller': {'name': 'Alice', 'number': '1001'},
+        })
+
+        call = formatter.from_channel(channel)
+
+        assert_that(call.snoops, equal_to({'snoop-1': {'uuid': 'snoop-1', 'role': 'snooped'}}))
+
+
+class TestCallFormatter(TestCase):
+
+    def setUp(self):
+        self.ari = Mock()
+        self.ari_cache = Mock()
+        self.ari_cache.list_bridges.return_value = [Mock(id='bridge-1', json={'channels': ['1', '2']})]
+        self.ari.channels.getChannelVar.side_effect = self.get_variable
+        self.variables = {}
+
+    def get_variable(self, channelId, variable):
+        try:
+            return {'value': self.variables[channelId, variable]}
+        except KeyError:
+            raise ARINotFound(self.ari, 'not found')
+
+    def new_channel(self, channel_id, state='Up'):
+        channel = Mock(id=channel_id, json={
+            'creationtime': '2019-01-01T00:00:00.000-0500',
+            'state': state,
+            'caller': {'name': 'Alice', 'number': '1001'},
+            'dialplan': {'exten': '1001'},
+            'channelvars': {},
+        })
+        channel.getChannelVar.side_effect = lambda variable: self.get_variable(channel_id, variable)
+        return channel
+
+    def test_from_channels_reads_the_bridges_once(self):
+        self.variables['1', 'XIVO_USERUUID'] = 'user-1'
+        self.variables['3', 'WAZO_CALL_PROGRESS'] = '1'
+        channels = [self.new_channel('1'), self.new_channel('2'), self.new_channel('3', state='Ring')]
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            formatter = CallFormatter(APPLICATION, self.ari, self.ari_cache, executor=executor)
+            calls = formatter.from_channels(channels, get_variables=lambda channel: {'id': channel.id})
+
+        assert_that(calls, contains(
+            has_properties(id_='1', node_uuid='bridge-1', user_uuid='user-1', variables={'id': '1'}),
+            has_properties(id_='2', node_uuid='bridge-1', user_uuid=None, status='Up'),
+            has_properties(id_='3', node_uuid=None, status='Progress'),
+        ))
+        self.ari_cache.list_bridges.assert_called_once_with()
+        self.ari_cache.list_channel_bridges.assert_not_called()
+
+    def test_from_channel_after_from_channels_reads_the_current_bridges(self):
+        self.variables['1', 'WAZO_CALL_MUTED'] = '1'
+        formatter = CallFormatter(APPLICATION, self.ari, self.ari_cache)
+        formatter.from_channels([self.new_channel('1')])
+        self.ari_cache.list_channel_bridges.return_value = [Mock(id='bridge-2')]
+
+        call = formatter.from_channel(self.new_channel('1'), node_uuid='node-1')
+
+        assert_that(call, has_properties(muted=True, on_hold=False, node_uuid='bridge-2', dialed_extension='1001'))
@@ -0,0 +1,91 @@
+# Copyright 2019 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from hamcrest import (
+    assert_that,
+    contains,
+    empty,
+    has_properties,
+)
+from mock import (
+    Mock,
+    patch,
+)
+from unittest import TestCase
+
+from ..caches import ApplicationMembersCache
+from ..services import ApplicationService
+
+APPLICATION_UUID = '00000000-0000-4000-8000-000000000001'
+APPLICATION_NAME = 'wazo-app-{}'.format(APPLICATION_UUID)
+
+
+class TestOriginatedCalls(TestCase):
+
+    def setUp(self):
+        self.ari = Mock()
+        self.ari.applications.get.return_value = {
+            'name': APPLICATION_NAME,
+            'channel_ids': [],
+            'bridge_ids': [],
+        }
+        self.ari.channels.getChannelVar.return_value = {'value': ''}
+        self.ari_cache = Mock()
+        self.ari_cache.list_bridges.return_value = []
+        self.ari_cache.list_channel_bridges.return_value = []
+        self.confd_apps = Mock()
+        self.confd_apps.get.return_value = {'destination': None}
+        self.app_members = ApplicationMembersCache(self.ari)
+        self.app_members._on_websocket_start(APPLICATION_NAME)
+        call_variables = Mock()
+        call_variables.get.return_value = {}
+
+        self.service = ApplicationService(
+            self.ari,
+            self.ari_cache,
+            Mock(),
+            Mock(),
+            Mock(),
+            self.confd_apps,
+            Mock(),
+            self.app_members,
+            call_variables,
+            Mock(),
+            None,
+            None,
+        )
+
+    def new_channel(self, channel_id):
+        channel = Mock(id=channel_id, json={
+            'name': 'Local/1001@default-00000001;1',
+            'creationtime': '2019-01-01T00:00:00.000-0500',
+            'state': 'Down',
+            'caller': {'name': '', 'number': ''},
+            'dialplan': {'exten': '1001'},
+        })
+        channel.getChannelVar.return_value = {'value': ''}
+        return channel
+
+    @patch('wazo_calld.plugins.applications.services.ami.extension_exists', Mock(return_value=True))
+    def test_originated_call_is_listed_before_stasis_start(self):
+        channel = self.new_channel('originated-1')
+        self.ari.channels.originate.return_value = channel
+        self.ari_cache.list_channels.return_value = [channel]
+
+        application = self.service.get_application(APPLICATION_UUID)
+        self.service.originate(application, None, '1001', 'default', False, None, None)
+
+        application = self.service.get_application(APPLICATION_UUID)
+        assert_that(self.service.list_calls(application), contains(has_properties(id_='originated-1')))
+
+    @patch('wazo_calld.plugins.applications.services.ami.extension_exists', Mock(return_value=True))
+    def test_originated_call_is_removed_when_destroyed(self):
+        channel = self.new_channel('originated-1')
+        self.ari.channels.originate.return_value = channel
+        application = self.service.get_application(APPLICATION_UUID)
+        self.service.originate(application, None, '1001', 'default', False, None, None)
+
+        self.app_members._on_channel_destroyed({'channel': {'id': 'originated-1'}})
+
+        application = self.service.get_application(APPLICATION_UUID)
+        assert_that(application['channel_ids'], empty())
@@ -27,6 +27,8 @@ class TestApplicationStasisStartHandler(TestCase):
         self.notifier = Mock()
         self.confd_apps_cache = Mock()
         self.moh_cache = Mock()
+        self.app_members_cache = Mock()
+        self.snoops = Mock()
 
         self.app = ApplicationStasis(
             self.ari,
@@ -35,6 +37,8 @@ class TestApplicationStasisStartHandler(TestCase):
             self.notifier,
             self.confd_apps_cache,
             self.moh_cache,
+            self.app_members_cache,
+            self.snoops,
         )
 
     def test_stasis_start_no_a_wazo_app(self):
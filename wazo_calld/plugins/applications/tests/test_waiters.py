@@ -0,0 +1,48 @@
+# Copyright 2019 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from hamcrest import (
+    assert_that,
+    empty,
+    equal_to,
+)
+from mock import Mock
+from unittest import TestCase
+
+from ..waiters import ChannelVariableWaiters
+
+
+class TestChannelVariableWaiters(TestCase):
+
+    def setUp(self):
+        self.waiters = ChannelVariableWaiters(Mock())
+
+    def varset(self, channel_id, variable, value):
+        self.waiters._on_channel_variable_set({
+            'channel': {'id': channel_id},
+            'variable': variable,
+            'value': value,
+        })
+
+    def test_waiter_is_resolved_by_the_variable_event(self):
+        waiter = self.waiters.expect('1', 'WAZO_CALL_MUTED', '1')
+
+        self.varset('1', 'WAZO_CALL_MUTED', '1')
+
+        assert_that(self.waiters.wait(waiter, timeout=0), equal_to(True))
+
+    def test_waiter_is_not_resolved_by_other_values_or_channels(self):
+        waiter = self.waiters.expect('1', 'WAZO_CALL_MUTED', '1')
+
+        self.varset('1', 'WAZO_CALL_MUTED', '')
+        self.varset('2', 'WAZO_CALL_MUTED', '1')
+        self.waiters._on_channel_variable_set({'variable': 'WAZO_CALL_MUTED', 'value': '1'})
+
+        assert_that(self.waiters.wait(waiter, timeout=0), equal_to(False))
+
+    def test_waiters_are_forgotten_after_the_wait(self):
+        waiter = self.waiters.expect('1', 'WAZO_CALL_MUTED', '1')
+
+        self.waiters.wait(waiter, timeout=0)
+
+        assert_that(self.waiters._waiters, empty())
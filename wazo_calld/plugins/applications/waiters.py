@@ -0,0 +1,68 @@
+# Copyright 2019 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import threading
+
+from collections import defaultdict
+
+from wazo_calld.dispatch import shard_safe
+
+
+class _Waiter:
+
+    def __init__(self, key, value):
+        self.key = key
+        self.value = value
+        self.done = threading.Event()
+
+
+class ChannelVariableWaiters:
+    '''Wait for the ChannelVarset events of the variables set with ARI.
+
+    Asterisk sets the variables of a channel in Stasis after setChannelVar
+    returns. A waiter must be created with expect() before the variable is
+    set, and must not be waited on from the thread handling the ARI events of
+    the channel.'''
+
+    def __init__(self, ari):
+        self._ari = ari
+        self._lock = threading.Lock()
+        self._waiters = defaultdict(list)
+
+    def subscribe(self):
+        self._ari.on_event('ChannelVarset', self._on_channel_variable_set)
+
+    def expect(self, channel_id, variable, value):
+        waiter = _Waiter((channel_id, variable), value)
+        with self._lock:
+            self._waiters[waiter.key].append(waiter)
+        return waiter
+
+    def wait(self, waiter, timeout):
+        try:
+            return waiter.done.wait(timeout)
+        finally:
+            self._discard(waiter)
+
+    def _discard(self, waiter):
+        with self._lock:
+            waiters = self._waiters.get(waiter.key)
+            if not waiters:
+                return
+            if waiter in waiters:
+                waiters.remove(waiter)
+            if not waiters:
+                del self._waiters[waiter.key]
+
+    @shard_safe
+    def _on_channel_variable_set(self, event):
+        channel = event.get('channel')
+        if not channel:
+            return  # global variable
+
+        key = (channel['id'], event['variable'])
+        with self._lock:
+            waiters = self._waiters.get(key, [])
+            for waiter in waiters:
+                if waiter.value == event['value']:
+                    waiter.done.set()
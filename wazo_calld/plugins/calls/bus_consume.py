@@ -2,6 +2,7 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 import logging
+import threading
 
 from ari.exceptions import ARINotFound
 from xivo_bus.collectd.channels import ChannelCreatedCollectdEvent
@@ -10,41 +11,75 @@ from xivo_bus.resources.calls.hold import CallOnHoldEvent
 from xivo_bus.resources.calls.hold import CallResumeEvent
 from xivo_bus.resources.common.event import ArbitraryEvent
 
+from wazo_calld.dispatch import shard_safe
 from wazo_calld.helpers import ami
 from wazo_calld.helpers.ari_ import Channel
 
+from .call_cache import CallCache
+from .coalescer import Coalescer
 from .schema import call_schema
 
 logger = logging.getLogger(__name__)
 
+CALLER_VARIABLES = ('WAZO_USER_OUTGOING_CALL', 'WAZO_CHANNEL_DIRECTION')
+
 
 class CallsBusEventHandler:
 
-    def __init__(self, ami, ari, collectd, bus_publisher, services, xivo_uuid, dial_echo_manager):
+    def __init__(self, ami, ari, ari_cache, collectd, bus_publisher, services, xivo_uuid, dial_echo_manager,
+                 user_call_index, update_window=0):
         self.ami = ami
         self.ari = ari
+        self.ari_cache = ari_cache
         self.collectd = collectd
         self.bus_publisher = bus_publisher
         self.services = services
         self.xivo_uuid = xivo_uuid
         self.dial_echo_manager = dial_echo_manager
+        self.user_call_index = user_call_index
+        self.call_updates = Coalescer(update_window, self._publish_call_updated)
+        self.calls = CallCache()
+        # the caller variables are updated from the bus and from the ARI events
+        self._caller_variables_lock = threading.Lock()
+        self._caller_variables = {}
 
     def subscribe(self, bus_consumer):
         bus_consumer.on_ami_event('Newchannel', self._add_sip_call_id)
         bus_consumer.on_ami_event('Newchannel', self._relay_channel_created)
         bus_consumer.on_ami_event('Newchannel', self._collectd_channel_created)
+        bus_consumer.on_ami_event('Newchannel', self._index_user_call)
         bus_consumer.on_ami_event('Newstate', self._relay_channel_updated)
+        bus_consumer.on_ami_event('Newstate', self._index_user_call)
         bus_consumer.on_ami_event('NewConnectedLine', self._relay_channel_updated)
+        bus_consumer.on_ami_event('NewConnectedLine', self._index_user_call)
         bus_consumer.on_ami_event('Hold', self._channel_hold)
         bus_consumer.on_ami_event('Unhold', self._channel_unhold)
         bus_consumer.on_ami_event('Hangup', self._relay_channel_hung_up)
+        bus_consumer.on_ami_event('Hangup', self._unindex_user_call)
         bus_consumer.on_ami_event('Hangup', self._collectd_channel_ended)
         bus_consumer.on_ami_event('UserEvent', self._set_dial_echo_result)
+        # the variables of every channel are received when the ARI cache is enabled,
+        # the dialplan sets too many variables to consume the AMI VarSet events
+        self.ari.on_event('ChannelVarset', self._update_caller_variable)
+        self.ari.on_event('ChannelVarset', self._index_user_call_variable)
+        self.ari.on_event('ChannelVarset', self._update_on_hold_variable)
+        self.ari.on_event('ChannelDestroyed', self._forget_channel_variables)
 
+    @shard_safe
     def _add_sip_call_id(self, event):
+        if not event['Channel'].startswith('PJSIP/'):
+            return
+
         channel_id = event['Uniqueid']
-        channel = Channel(channel_id, self.ari)
-        sip_call_id = channel.sip_call_id()
+        variables = event.get('ChanVariable', {})
+        if variables.get('WAZO_SIP_CALL_ID'):
+            return
+
+        # the call-id is in ChanVariable when it is in the channelvars of manager.conf
+        sip_call_id = variables.get('CHANNEL(pjsip,call-id)')
+        if not sip_call_id:
+            channel = Channel(channel_id, self.ari, self.ari_cache)
+            sip_call_id = channel.get_variable('CHANNEL(pjsip,call-id)')
         if not sip_call_id:
             return
 
@@ -58,15 +93,17 @@ class CallsBusEventHandler:
         except ARINotFound:
             logger.debug('channel %s not found', channel_id)
 
+    @shard_safe
     def _relay_channel_created(self, event):
         channel_id = event['Uniqueid']
         logger.debug('Relaying to bus: channel %s created', channel_id)
         try:
-            channel = self.ari.channels.get(channelId=channel_id)
+            channel = self.ari_cache.get_channel(channel_id)
         except ARINotFound:
             logger.debug('channel %s not found', channel_id)
             return
         call = self.services.make_call_from_channel(self.ari, channel)
+        self.calls.set(call)
         bus_event = ArbitraryEvent(
             name='call_created',
             body=call_schema.dump(call),
@@ -75,20 +112,124 @@ class CallsBusEventHandler:
         bus_event.routing_key = 'calls.call.created'
         self.bus_publisher.publish(bus_event, headers={'user_uuid:{uuid}'.format(uuid=call.user_uuid): True})
 
+    @shard_safe
     def _collectd_channel_created(self, event):
         channel_id = event['Uniqueid']
         logger.debug('sending stat for new channel %s', channel_id)
         self.collectd.publish(ChannelCreatedCollectdEvent())
 
+    @shard_safe
+    def _index_user_call(self, event):
+        if event['Channel'].startswith('Local/'):
+            return
+
+        # XIVO_USERUUID is usually set by the dialplan after Newchannel
+        user_uuid = event.get('ChanVariable', {}).get('XIVO_USERUUID')
+        if user_uuid:
+            self.user_call_index.update(event['Uniqueid'], user_uuid)
+
+    @shard_safe
+    def _index_user_call_variable(self, event):
+        channel = event.get('channel')
+        if not channel:
+            return  # global variable
+
+        # Local channels, identified by WAZO_DEREFERENCED_USERUUID, are never indexed
+        if channel['name'].startswith('Local/'):
+            return
+
+        if event['variable'].lstrip('_') == 'XIVO_USERUUID':
+            self.user_call_index.update(channel['id'], event['value'] or None)
+
+    @shard_safe
+    def _unindex_user_call(self, event):
+        self.user_call_index.remove(event['Uniqueid'])
+
+    @shard_safe
     def _relay_channel_updated(self, event):
-        channel_id = event['Uniqueid']
-        logger.debug('Relaying to bus: channel %s updated', channel_id)
-        try:
-            channel = self.ari.channels.get(channelId=channel_id)
-        except ARINotFound:
-            logger.debug('channel %s not found', channel_id)
+        self._update_cached_call(event)
+        self.call_updates.update(event['Uniqueid'])
+
+    def _update_cached_call(self, event):
+        def caller_id(value):
+            return '' if value == '<unknown>' else value
+
+        fields = {
+            'status': event['ChannelStateDesc'],
+            'caller_id_name': caller_id(event['CallerIDName']),
+            'caller_id_number': caller_id(event['CallerIDNum']),
+            'peer_caller_id_name': caller_id(event['ConnectedLineName']),
+            'peer_caller_id_number': caller_id(event['ConnectedLineNum']),
+        }
+        variables = event.get('ChanVariable', {})
+        user_variable = 'WAZO_DEREFERENCED_USERUUID' if event['Channel'].startswith('Local/') else 'XIVO_USERUUID'
+        for field, variable in (('user_uuid', user_variable),
+                                ('dialed_extension', 'XIVO_BASE_EXTEN'),
+                                ('sip_call_id', 'WAZO_SIP_CALL_ID')):
+            if variables.get(variable):
+                fields[field] = variables[variable]
+        self.calls.update(event['Uniqueid'], **fields)
+        self._update_caller(event['Uniqueid'], {
+            name: variables[name] for name in CALLER_VARIABLES if variables.get(name)
+        })
+
+    @shard_safe
+    def _update_caller_variable(self, event):
+        channel = event.get('channel')
+        if not channel:
+            return  # global variable
+
+        # the dialplan sets the direction of the call after Newchannel
+        if event['variable'] in CALLER_VARIABLES:
+            self._update_caller(channel['id'], {event['variable']: event['value']})
+
+    @shard_safe
+    def _update_on_hold_variable(self, event):
+        channel = event.get('channel')
+        if not channel:
+            return  # global variable
+
+        # the applications hold and unhold their calls with ARI, without AMI Hold event
+        if event['variable'] == 'XIVO_ON_HOLD':
+            self.calls.update(channel['id'], on_hold=event['value'] == '1')
+
+    @shard_safe
+    def _forget_channel_variables(self, event):
+        # the ChannelVarset events handled after the AMI Hangup must not outlive the channel
+        channel_id = event['channel']['id']
+        self.user_call_index.remove(channel_id)
+        with self._caller_variables_lock:
+            self._caller_variables.pop(channel_id, None)
+
+    def _update_caller(self, channel_id, variables):
+        if not variables:
             return
-        call = self.services.make_call_from_channel(self.ari, channel)
+
+        with self._caller_variables_lock:
+            caller_variables = self._caller_variables.setdefault(channel_id, {})
+            caller_variables.update(variables)
+            # same precedence as Channel.is_caller
+            user_outgoing_call = caller_variables.get('WAZO_USER_OUTGOING_CALL')
+            if user_outgoing_call:
+                is_caller = user_outgoing_call == 'true'
+            else:
+                is_caller = caller_variables.get('WAZO_CHANNEL_DIRECTION') == 'to-wazo'
+            self.calls.update(channel_id, is_caller=is_caller)
+
+    def _publish_call_updated(self, channel_id):
+        logger.debug('Relaying to bus: channel %s updated', channel_id)
+        call = self.calls.get(channel_id)
+        if call:
+            self._update_call_bridges(call)
+        else:
+            try:
+                channel = self.ari_cache.get_channel(channel_id)
+            except ARINotFound:
+                logger.debug('channel %s not found', channel_id)
+                return
+            call = self.services.make_call_from_channel(self.ari, channel)
+        self.calls.set(call)
+
         bus_event = ArbitraryEvent(
             name='call_updated',
             body=call_schema.dump(call),
@@ -97,8 +238,30 @@ class CallsBusEventHandler:
         bus_event.routing_key = 'calls.call.updated'
         self.bus_publisher.publish(bus_event, headers={'user_uuid:{uuid}'.format(uuid=call.user_uuid): True})
 
+    def _update_call_bridges(self, call):
+        # the bridges are read from the ARI cache when it is enabled
+        channel = Channel(call.id_, self.ari, self.ari_cache)
+        if not call.user_uuid:
+            call.user_uuid = channel.user()
+        bridges = channel.bridges()
+        connected_channel_ids = set(sum((bridge.json['channels'] for bridge in bridges), list()))
+        connected_channel_ids.discard(call.id_)
+        call.bridges = [bridge.id for bridge in bridges]
+        call.talking_to = {
+            connected_channel_id: self._user_uuid(connected_channel_id)
+            for connected_channel_id in connected_channel_ids
+        }
+
+    def _user_uuid(self, channel_id):
+        call = self.calls.get(channel_id)
+        if call and call.user_uuid:
+            return call.user_uuid
+        return Channel(channel_id, self.ari, self.ari_cache).user()
+
+    @shard_safe
     def _relay_channel_hung_up(self, event):
         channel_id = event['Uniqueid']
+        self.call_updates.flush(channel_id)
         logger.debug('Relaying to bus: channel %s ended', channel_id)
         call = self.services.make_call_from_ami_event(event)
         bus_event = ArbitraryEvent(
@@ -108,27 +271,35 @@ class CallsBusEventHandler:
         )
         bus_event.routing_key = 'calls.call.ended'
         self.bus_publisher.publish(bus_event, headers={'user_uuid:{uuid}'.format(uuid=call.user_uuid): True})
+        self.calls.remove(channel_id)
+        with self._caller_variables_lock:
+            self._caller_variables.pop(channel_id, None)
 
+    @shard_safe
     def _collectd_channel_ended(self, event):
         channel_id = event['Uniqueid']
         logger.debug('sending stat for channel ended %s', channel_id)
         self.collectd.publish(ChannelEndedCollectdEvent())
 
+    @shard_safe
     def _channel_hold(self, event):
         channel_id = event['Uniqueid']
         logger.debug('marking channel %s on hold', channel_id)
         ami.set_variable_ami(self.ami, channel_id, 'XIVO_ON_HOLD', '1')
+        self.calls.update(channel_id, on_hold=True)
 
-        user_uuid = Channel(channel_id, self.ari).user()
+        user_uuid = self._user_uuid(channel_id)
         bus_msg = CallOnHoldEvent(channel_id, user_uuid)
         self.bus_publisher.publish(bus_msg, headers={'user_uuid:{uuid}'.format(uuid=user_uuid): True})
 
+    @shard_safe
     def _channel_unhold(self, event):
         channel_id = event['Uniqueid']
         logger.debug('marking channel %s not on hold', channel_id)
         ami.unset_variable_ami(self.ami, channel_id, 'XIVO_ON_HOLD')
+        self.calls.update(channel_id, on_hold=False)
 
-        user_uuid = Channel(channel_id, self.ari).user()
+        user_uuid = self._user_uuid(channel_id)
         bus_msg = CallResumeEvent(channel_id, user_uuid)
         self.bus_publisher.publish(bus_msg, headers={'user_uuid:{uuid}'.format(uuid=user_uuid): True})
 
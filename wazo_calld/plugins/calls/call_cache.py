@@ -0,0 +1,43 @@
+# Copyright 2019 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import copy
+import threading
+
+
+class CallCache:
+    '''Latest known state of the calls, by channel ID.
+
+    The calls are added when they are created and removed when they are hung
+    up. get() returns a copy that may be changed freely.'''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def get(self, channel_id):
+        with self._lock:
+            call = self._calls.get(channel_id)
+            return copy.copy(call) if call else None
+
+    def set(self, call):
+        with self._lock:
+            self._calls[call.id_] = copy.copy(call)
+
+    def update(self, channel_id, **fields):
+        with self._lock:
+            call = self._calls.get(channel_id)
+            if not call:
+                return False
+            call = self._calls[channel_id] = copy.copy(call)
+            for name, value in fields.items():
+                setattr(call, name, value)
+            return True
+
+    def remove(self, channel_id):
+        with self._lock:
+            self._calls.pop(channel_id, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._calls)
@@ -0,0 +1,109 @@
+# Copyright 2019 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Coalescer:
+    '''Collapse the updates of a channel into a single callback.
+
+    The callback is called `window` seconds after the first update of a
+    channel, once for all the updates received in the meantime. The callbacks
+    are run one at a time, in deadline order, by a single scheduler thread.
+    flush() calls the callback right away if an update is pending, and waits
+    for a callback that is already running, so that nothing is relayed after
+    it returns.'''
+
+    def __init__(self, window, callback):
+        self._window = window
+        self._callback = callback
+        self._condition = threading.Condition()
+        self._heap = []
+        self._pending = {}
+        self._tokens = itertools.count()
+        self._running = None
+        self._stopped = False
+        self._thread = None
+
+    def update(self, channel_id):
+        if self._window <= 0:
+            self._callback(channel_id)
+            return
+
+        with self._condition:
+            if channel_id in self._pending:
+                return
+            token = self._pending[channel_id] = next(self._tokens)
+            heapq.heappush(self._heap, (time.monotonic() + self._window, token, channel_id))
+            self._start()
+            self._condition.notify()
+
+    def flush(self, channel_id):
+        with self._condition:
+            while self._running == channel_id:
+                self._condition.wait()
+            pending = self._pending.pop(channel_id, None)
+
+        if pending is not None:
+            self._run_callback(channel_id)
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+            thread, self._thread = self._thread, None
+        if thread:
+            thread.join()
+
+    def _start(self):
+        if self._thread or self._stopped:
+            return
+
+        self._thread = threading.Thread(target=self._run, name='call_updates')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                channel_id = self._next_due()
+                if channel_id is None:
+                    return
+                self._running = channel_id
+
+            try:
+                self._run_callback(channel_id)
+            finally:
+                with self._condition:
+                    self._running = None
+                    self._condition.notify_all()
+
+    def _next_due(self):
+        while not self._stopped:
+            if not self._heap:
+                self._condition.wait()
+                continue
+
+            deadline, token, channel_id = self._heap[0]
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                self._condition.wait(delay)
+                continue
+
+            heapq.heappop(self._heap)
+            if self._pending.get(channel_id) != token:
+                continue  # already flushed
+            del self._pending[channel_id]
+            return channel_id
+
+    def _run_callback(self, channel_id):
+        try:
+            self._callback(channel_id)
+        except Exception:
+            logger.exception('error while relaying the updates of channel %s', channel_id)
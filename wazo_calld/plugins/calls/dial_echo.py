@@ -2,12 +2,16 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 import logging
+import threading
+import time
 import uuid
 
-from queue import Queue, Empty as EmptyQueue
+from concurrent import futures
 
 logger = logging.getLogger(__name__)
 
+DIAL_ECHO_TTL = 5
+
 
 class DialEchoTimeout(Exception):
     pass
@@ -17,6 +21,14 @@ class DialEchoFailure(Exception):
     pass
 
 
+class _DialEchoRequest:
+
+    def __init__(self, expires_at):
+        self.expires_at = expires_at
+        self.future = futures.Future()
+        self.resolved = False
+
+
 class DialEchoManager:
     '''This feature has some problems:
 
@@ -27,45 +39,134 @@ class DialEchoManager:
     A cleaner way to solve the original problem (knowing the non-Local channel
     id of a Local originate), would be to be able to set it. A simple way to do
     that would be to patch the Dial application and add an option to set the
-    Uniqueid of the new Dial'ed channel. '''
+    Uniqueid of the new Dial'ed channel.
+
+    Each request is a future, resolved by set_dial_echo_result. Requests are
+    forgotten `ttl` seconds after their creation, whether someone waits on them
+    or not, and the unresolved ones fail with DialEchoTimeout. The callbacks
+    of add_done_callback run on `callback_workers` worker threads. '''
+
+    def __init__(self, ttl=DIAL_ECHO_TTL, sweep_interval=1, callback_workers=2):
+        self._ttl = ttl
+        self._sweep_interval = sweep_interval
+        self._executor = futures.ThreadPoolExecutor(
+            max_workers=callback_workers,
+            thread_name_prefix='dial_echo_callback',
+        )
+        self._lock = threading.Lock()
+        self._requests = {}
+        self._stopped = threading.Event()
+        self._sweeper = None
+
+    def start(self):
+        if self._sweeper:
+            return
 
-    def __init__(self):
-        self._queues = {}
+        self._sweeper = threading.Thread(target=self._sweep_periodically, name='dial_echo_sweeper')
+        self._sweeper.daemon = True
+        self._sweeper.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._sweeper:
+            self._sweeper.join()
+            self._sweeper = None
+        self._executor.shutdown()
 
     def new_dial_echo_request(self):
         dial_echo_request_id = str(uuid.uuid4())
-        self._queues[dial_echo_request_id] = Queue()
+        with self._lock:
+            self._requests[dial_echo_request_id] = _DialEchoRequest(time.monotonic() + self._ttl)
         logger.debug('Created dial echo request %s', dial_echo_request_id)
         return dial_echo_request_id
 
     def wait(self, dial_echo_request_id, timeout):
-        queue = self._queues.get(dial_echo_request_id)
-        if not queue:
+        with self._lock:
+            request = self._requests.get(dial_echo_request_id)
+        if not request:
             logger.debug('Dial echo: ignoring dial echo wait from unknown request %s', dial_echo_request_id)
             return
 
         logger.debug('Waiting for dial echo request %s', dial_echo_request_id)
         try:
-            result = queue.get(block=True, timeout=timeout)
-        except EmptyQueue:
-            self._queues.pop(dial_echo_request_id, None)
+            result = request.future.result(timeout=timeout)
+        except futures.TimeoutError:
             raise DialEchoTimeout()
+        finally:
+            self._pop(dial_echo_request_id)
         logger.debug('Got result from dial echo request %s: %s', dial_echo_request_id, result)
 
+        return self._channel_id(dial_echo_request_id, result)
+
+    def add_done_callback(self, dial_echo_request_id, callback):
+        """callback(channel_id, error) is called once the result is set or the request expired"""
+        with self._lock:
+            request = self._requests.get(dial_echo_request_id)
+        if not request:
+            logger.debug('Dial echo: ignoring dial echo callback from unknown request %s', dial_echo_request_id)
+            return
+
+        def run_callback(future):
+            try:
+                channel_id = self._channel_id(dial_echo_request_id, future.result())
+            except (DialEchoTimeout, DialEchoFailure) as e:
+                callback(None, e)
+            else:
+                callback(channel_id, None)
+
+        def on_done(future):
+            # the future is resolved by the bus consumer, which must not wait on the callback
+            self._pop(dial_echo_request_id)
+            self._executor.submit(self._log_errors, run_callback, future)
+
+        request.future.add_done_callback(on_done)
+
+    def set_dial_echo_result(self, dial_echo_request_id, result):
+        with self._lock:
+            request = self._requests.get(dial_echo_request_id)
+            if not request or request.resolved:
+                logger.debug('Dial echo: ignoring dial_echo result from unknown request %s', dial_echo_request_id)
+                return
+            request.resolved = True
+        request.future.set_result(result)
+
+    @staticmethod
+    def _log_errors(callback, *args):
+        try:
+            callback(*args)
+        except Exception:
+            logger.exception('error in dial echo callback')
+
+    def _pop(self, dial_echo_request_id):
+        with self._lock:
+            self._requests.pop(dial_echo_request_id, None)
+
+    @staticmethod
+    def _channel_id(dial_echo_request_id, result):
         try:
             channel_id = result['channel_id']
         except KeyError:
-            self._queues.pop(dial_echo_request_id, None)
             raise DialEchoFailure(result)
         logger.debug('Got channel ID from dial echo request %s: %s', dial_echo_request_id, channel_id)
-
-        self._queues.pop(dial_echo_request_id, None)
-
         return channel_id
 
-    def set_dial_echo_result(self, dial_echo_request_id, result):
-        queue = self._queues.get(dial_echo_request_id)
-        if not queue:
-            logger.debug('Dial echo: ignoring dial_echo result from unknown request %s', dial_echo_request_id)
-            return
-        queue.put(result)
+    def _sweep_periodically(self):
+        while not self._stopped.wait(self._sweep_interval):
+            self._sweep()
+
+    def _sweep(self):
+        now = time.monotonic()
+        with self._lock:
+            expired = [(request_id, request) for request_id, request in self._requests.items()
+                       if request.expires_at <= now]
+            unresolved = []
+            for request_id, request in expired:
+                del self._requests[request_id]
+                if not request.resolved:
+                    request.resolved = True
+                    unresolved.append((request_id, request))
+
+        # the callbacks are run outside of the lock, by set_exception
+        for request_id, request in unresolved:
+            logger.debug('Dial echo request %s expired', request_id)
+            request.future.set_exception(DialEchoTimeout())
@@ -0,0 +1,42 @@
+# Copyright 2019 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import logging
+
+from xivo_bus.resources.common.event import ArbitraryEvent
+
+from .schema import call_schema
+
+logger = logging.getLogger(__name__)
+
+
+class CallNotifier:
+
+    def __init__(self, bus):
+        self._bus = bus
+
+    def call_originated(self, request_id, user_uuid, call):
+        logger.debug('Originate request %s: call %s created', request_id, call.id_)
+        body = {
+            'request_id': request_id,
+            'call': call_schema.dump(call),
+        }
+        self._send_event('call_originated', 'calls.call.originated', user_uuid, body)
+
+    def call_originate_failed(self, request_id, user_uuid, message, details):
+        logger.debug('Originate request %s failed: %s', request_id, message)
+        body = {
+            'request_id': request_id,
+            'message': message,
+            'details': details,
+        }
+        self._send_event('call_originate_failed', 'calls.call.originate_failed', user_uuid, body)
+
+    def _send_event(self, name, routing_key, user_uuid, body):
+        event = ArbitraryEvent(
+            name=name,
+            body=body,
+            required_acl='events.calls.{}'.format(user_uuid),
+        )
+        event.routing_key = routing_key
+        self._bus.publish(event, headers={'user_uuid:{uuid}'.format(uuid=user_uuid): True})
@@ -9,6 +9,7 @@ from wazo_calld.ari_ import DEFAULT_APPLICATION_NAME
 
 from .bus_consume import CallsBusEventHandler
 from .dial_echo import DialEchoManager
+from .notifier import CallNotifier
 from .resources import (
     CallResource,
     CallsResource,
@@ -18,6 +19,10 @@ from .resources import (
 )
 from .services import CallsService
 from .stasis import CallsStasis
+from .user_call_index import (
+    UserCallIndex,
+    UserCallIndexReconciler,
+)
 
 
 class Plugin:
@@ -28,6 +33,7 @@ class Plugin:
         bus_consumer = dependencies['bus_consumer']
         bus_publisher = dependencies['bus_publisher']
         collectd = dependencies['collectd']
+        pubsub = dependencies['pubsub']
         token_changed_subscribe = dependencies['token_changed_subscribe']
         config = dependencies['config']
 
@@ -40,15 +46,24 @@ class Plugin:
         token_changed_subscribe(confd_client.set_token)
 
         dial_echo_manager = DialEchoManager()
+        dial_echo_manager.start()
+        pubsub.subscribe('stopping', lambda _: dial_echo_manager.stop())
+        user_call_index = UserCallIndex()
+        notifier = CallNotifier(bus_publisher)
 
-        calls_service = CallsService(amid_client, config['ari']['connection'], ari.client, confd_client, dial_echo_manager)
+        calls_service = CallsService(amid_client, config['ari']['connection'], ari.client, ari.cache, confd_client, dial_echo_manager, user_call_index, notifier)
 
         ari.register_application(DEFAULT_APPLICATION_NAME)
         calls_stasis = CallsStasis(ari.client, collectd, bus_publisher, calls_service, config['uuid'], amid_client)
         calls_stasis.subscribe()
 
-        calls_bus_event_handler = CallsBusEventHandler(amid_client, ari.client, collectd, bus_publisher, calls_service, config['uuid'], dial_echo_manager)
+        calls_bus_event_handler = CallsBusEventHandler(amid_client, ari.client, ari.cache, collectd, bus_publisher, calls_service, config['uuid'], dial_echo_manager, user_call_index, config['calls']['update_window'])
         calls_bus_event_handler.subscribe(bus_consumer)
+        pubsub.subscribe('stopping', lambda _: calls_bus_event_handler.call_updates.stop())
+
+        user_call_index_reconciler = UserCallIndexReconciler(user_call_index, ari.client, ari.cache, config['calls']['user_index_reconcile_interval'])
+        user_call_index_reconciler.start()
+        pubsub.subscribe('stopping', lambda _: user_call_index_reconciler.stop())
 
         api.add_resource(CallsResource, '/calls', resource_class_args=[calls_service])
         api.add_resource(MyCallsResource, '/users/me/calls', resource_class_args=[auth_client, calls_service])
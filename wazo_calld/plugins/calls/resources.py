@@ -10,13 +10,16 @@ from wazo_calld.auth import get_token_user_uuid_from_request
 from wazo_calld.http import AuthResource
 
 from .schema import call_schema
+from .schema import CallListRequestSchema
 from .schema import CallRequestSchema
 from .schema import UserCallRequestSchema
 
 logger = logging.getLogger(__name__)
 
 
+call_list_request_schema = CallListRequestSchema()
 call_request_schema = CallRequestSchema()
+user_call_list_request_schema = CallListRequestSchema(exclude=('user_uuid',))
 user_call_request_schema = UserCallRequestSchema()
 
 
@@ -27,10 +30,11 @@ class CallsResource(AuthResource):
 
     @required_acl('calld.calls.read')
     def get(self):
-        application_filter = request.args.get('application')
-        application_instance_filter = request.args.get('application_instance')
+        search_params = call_list_request_schema.load(request.args)
+        application_filter = search_params.pop('application', None)
+        application_instance_filter = search_params.pop('application_instance', None)
 
-        calls = self.calls_service.list_calls(application_filter, application_instance_filter)
+        calls = self.calls_service.list_calls(application_filter, application_instance_filter, **search_params)
 
         return {
             'items': call_schema.dump(calls, many=True),
@@ -40,6 +44,11 @@ class CallsResource(AuthResource):
     def post(self):
         request_body = call_request_schema.load(request.get_json(force=True))
 
+        # only the calls from a mobile phone wait for it to be dialed
+        if request_body['async_'] and request_body['source']['from_mobile']:
+            request_id = self.calls_service.originate_async(request_body)
+            return {'request_id': request_id}, 202
+
         call = self.calls_service.originate(request_body)
 
         return call_schema.dump(call), 201
@@ -53,11 +62,15 @@ class MyCallsResource(AuthResource):
 
     @required_acl('calld.users.me.calls.read')
     def get(self):
-        application_filter = request.args.get('application')
-        application_instance_filter = request.args.get('application_instance')
+        search_params = user_call_list_request_schema.load(request.args)
+        application_filter = search_params.pop('application', None)
+        application_instance_filter = search_params.pop('application_instance', None)
         user_uuid = get_token_user_uuid_from_request(self.auth_client)
 
-        calls = self.calls_service.list_calls_user(user_uuid, application_filter, application_instance_filter)
+        calls = self.calls_service.list_calls_user(user_uuid,
+                                                   application_filter,
+                                                   application_instance_filter,
+                                                   **search_params)
 
         return {
             'items': call_schema.dump(calls, many=True),
@@ -69,6 +82,10 @@ class MyCallsResource(AuthResource):
 
         user_uuid = get_token_user_uuid_from_request(self.auth_client)
 
+        if request_body['async_'] and request_body['from_mobile']:
+            request_id = self.calls_service.originate_user_async(request_body, user_uuid)
+            return {'request_id': request_id}, 202
+
         call = self.calls_service.originate_user(request_body, user_uuid)
 
         return call_schema.dump(call), 201
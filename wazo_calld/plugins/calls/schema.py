@@ -1,8 +1,9 @@
-# Copyright 2016-2017 The Wazo Authors  (see the AUTHORS file)
+# Copyright 2016-2019 The Wazo Authors  (see the AUTHORS file)
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 from marshmallow import EXCLUDE, Schema, fields, post_dump
 from marshmallow.validate import Length
+from marshmallow.validate import OneOf
 from marshmallow.validate import Range
 
 from wazo_calld.helpers.mallow import StrictDict
@@ -33,6 +34,7 @@ class CallRequestSchema(CallBaseSchema):
     variables = StrictDict(key_field=fields.String(required=True, validate=Length(min=1)),
                            value_field=fields.String(required=True, validate=Length(min=1)),
                            missing=dict)
+    async_ = fields.Boolean(data_key='async', missing=False)
 
 
 class UserCallRequestSchema(CallBaseSchema):
@@ -42,6 +44,19 @@ class UserCallRequestSchema(CallBaseSchema):
     variables = StrictDict(key_field=fields.String(required=True, validate=Length(min=1)),
                            value_field=fields.String(required=True, validate=Length(min=1)),
                            missing=dict)
+    async_ = fields.Boolean(data_key='async', missing=False)
+
+
+class CallListRequestSchema(CallBaseSchema):
+    application = fields.String()
+    application_instance = fields.String()
+    user_uuid = fields.String()
+    tenant_uuid = fields.String()
+    status = fields.String()
+    order = fields.String(validate=OneOf(['caller_id_name', 'caller_id_number', 'creation_time', 'status']))
+    direction = fields.String(validate=OneOf(['asc', 'desc']), missing='asc')
+    limit = fields.Integer(validate=Range(min=0))
+    offset = fields.Integer(validate=Range(min=0), missing=0)
 
 
 class CallSchema(CallBaseSchema):
@@ -3,6 +3,8 @@
 
 import logging
 
+from collections import defaultdict
+
 from ari.exceptions import ARINotFound
 from wazo_calld.ari_ import DEFAULT_APPLICATION_NAME
 from wazo_calld.exceptions import InvalidExtension
@@ -16,23 +18,56 @@ from .exceptions import CallConnectError
 from .exceptions import CallCreationError
 from .exceptions import NoSuchCall
 from .state_persistor import ReadOnlyStatePersistor
+from .dial_echo import DIAL_ECHO_TTL
 from .dial_echo import DialEchoTimeout
 
 logger = logging.getLogger(__name__)
 
+CHANNEL_ORDER_KEYS = {
+    'caller_id_name': lambda channel: channel.json['caller']['name'],
+    'caller_id_number': lambda channel: channel.json['caller']['number'],
+    'creation_time': lambda channel: channel.json['creationtime'],
+    'status': lambda channel: channel.json['state'],
+}
+
 
 class CallsService:
 
-    def __init__(self, amid_client, ari_config, ari, confd_client, dial_echo_manager):
+    def __init__(self, amid_client, ari_config, ari, ari_cache, confd_client, dial_echo_manager, user_call_index,
+                 notifier):
         self._ami = amid_client
         self._ari_config = ari_config
         self._ari = ari
+        self._ari_cache = ari_cache
         self._confd = confd_client
         self._dial_echo_manager = dial_echo_manager
+        self._user_call_index = user_call_index
+        self._notifier = notifier
         self._state_persistor = ReadOnlyStatePersistor(self._ari)
 
-    def list_calls(self, application_filter=None, application_instance_filter=None):
-        channels = self._ari.channels.list()
+    def list_calls(self, application_filter=None, application_instance_filter=None, **search_params):
+        return self._list_calls(application_filter, application_instance_filter, **search_params)
+
+    def list_calls_user(self, user_uuid, application_filter=None, application_instance_filter=None, **search_params):
+        search_params['user_uuid'] = user_uuid
+        if application_filter or not self._user_call_index.is_ready():
+            return self._list_calls(application_filter, application_instance_filter, exclude_local=True, **search_params)
+
+        channels = []
+        for channel_id in self._user_call_index.channel_ids(user_uuid):
+            try:
+                channels.append(self._ari_cache.get_channel(channel_id))
+            except ARINotFound:
+                continue
+
+        # the index may be late: the channels are checked like any other search
+        users = {}
+        channels = self._search_channels(channels, users, exclude_local=True, **search_params)
+        bridges = self._ari_cache.list_bridges()
+        return self.make_calls_from_snapshot(self._ari, channels, bridges, users=users)
+
+    def _list_calls(self, application_filter, application_instance_filter, **search_params):
+        all_channels = channels = self._ari_cache.list_channels()
 
         if application_filter:
             try:
@@ -55,13 +90,86 @@ class CallsService:
                         app_instance_channels.append(channel)
                 channels = app_instance_channels
 
-        return [self.make_call_from_channel(self._ari, channel) for channel in channels]
-
-    def list_calls_user(self, user_uuid, application_filter=None, application_instance_filter=None):
-        calls = self.list_calls(application_filter, application_instance_filter)
-        return [call for call in calls if call.user_uuid == user_uuid and not Channel(call.id_, self._ari).is_local()]
+        users = {}
+        channels = self._search_channels(channels, users, **search_params)
+        bridges = self._ari_cache.list_bridges()
+        return self.make_calls_from_snapshot(self._ari, channels, bridges, all_channels, users)
+
+    def _search_channels(self, channels, users, user_uuid=None, tenant_uuid=None, status=None,
+                         exclude_local=False, order=None, direction='asc', limit=None, offset=0):
+        '''Filter, sort and paginate the channels before the calls are built from them'''
+        def helper(channel):
+            return Channel(channel.id, self._ari, self._ari_cache, snapshot=channel)
+
+        if status:
+            channels = [channel for channel in channels if channel.json['state'] == status]
+        if exclude_local:
+            channels = [channel for channel in channels if not helper(channel).is_local()]
+        if user_uuid:
+            for channel in channels:
+                if channel.id not in users:
+                    users[channel.id] = helper(channel).user()
+            channels = [channel for channel in channels if users[channel.id] == user_uuid]
+        if tenant_uuid:
+            channels = [channel for channel in channels
+                        if helper(channel).get_variable('WAZO_TENANT_UUID') == tenant_uuid]
+        if order:
+            channels = sorted(channels, key=CHANNEL_ORDER_KEYS[order], reverse=(direction == 'desc'))
+
+        if limit is None:
+            return channels[offset:]
+        return channels[offset:offset + limit]
 
     def originate(self, request):
+        self._check_destination(request)
+
+        if request['source']['from_mobile']:
+            dial_echo_request_id, details = self._originate_from_mobile(request)
+            try:
+                channel_id = self._dial_echo_manager.wait(dial_echo_request_id, timeout=DIAL_ECHO_TTL)
+            except DialEchoTimeout:
+                raise CallCreationError('Could not dial mobile number', details=details)
+            channel = self._ari.channels.get(channelId=channel_id)
+        else:
+            channel = self._originate_from_line(request)
+
+        return self._make_originated_call(request, channel)
+
+    def originate_async(self, request):
+        '''Originate a call from the mobile phone of the user, without waiting for it to be dialed
+
+        Returns a request ID. The call, or the reason why it could not be made,
+        is then sent on the bus with this request ID.'''
+        self._check_destination(request)
+        source_user = request['source']['user']
+        dial_echo_request_id, details = self._originate_from_mobile(request)
+
+        def on_mobile_dialed(channel_id, error):
+            if error:
+                self._notifier.call_originate_failed(
+                    dial_echo_request_id, source_user, 'Could not dial mobile number', details,
+                )
+                return
+            try:
+                channel = self._ari.channels.get(channelId=channel_id)
+                call = self._make_originated_call(request, channel)
+            except ARINotFound:
+                self._notifier.call_originate_failed(
+                    dial_echo_request_id, source_user, 'Mobile call ended', details,
+                )
+                return
+            except Exception:
+                logger.exception('could not make the call of dial echo request %s', dial_echo_request_id)
+                self._notifier.call_originate_failed(
+                    dial_echo_request_id, source_user, 'Could not make the call', details,
+                )
+                return
+            self._notifier.call_originated(dial_echo_request_id, source_user, call)
+
+        self._dial_echo_manager.add_done_callback(dial_echo_request_id, on_mobile_dialed)
+        return dial_echo_request_id
+
+    def _check_destination(self, request):
         requested_context = request['destination']['context']
         requested_extension = request['destination']['extension']
         requested_priority = request['destination']['priority']
@@ -69,78 +177,89 @@ class CallsService:
         if not ami.extension_exists(self._ami, requested_context, requested_extension, requested_priority):
             raise InvalidExtension(requested_context, requested_extension)
 
+    def _originate_from_mobile(self, request):
+        requested_context = request['destination']['context']
+        requested_extension = request['destination']['extension']
+        requested_priority = request['destination']['priority']
         source_user = request['source']['user']
         variables = request.get('variables', {})
-        dial_echo_request_id = None
 
-        if request['source']['from_mobile']:
-            source_mobile = User(source_user, self._confd).mobile_phone_number()
-            if not source_mobile:
-                raise CallCreationError('User has no mobile phone number', details={'user': source_user})
-            source_context = User(source_user, self._confd).main_line().context()
-            if not ami.extension_exists(self._ami, source_context, source_mobile, priority=1):
-                details = {'user': source_user,
-                           'mobile_exten': source_mobile,
-                           'mobile_context': source_context}
-                raise CallCreationError('User has invalid mobile phone number', details=details)
-            endpoint = 'local/s@wazo-originate-mobile-leg1/n'
-            context, extension, priority = 'wazo-originate-mobile-leg2', 's', 1
-
-            variables.setdefault('_XIVO_USERUUID', source_user)
-            variables.setdefault('WAZO_DEREFERENCED_USERUUID', source_user)
-            variables.setdefault('WAZO_ORIGINATE_MOBILE_PRIORITY', '1')
-            variables.setdefault('WAZO_ORIGINATE_MOBILE_EXTENSION', source_mobile)
-            variables.setdefault('WAZO_ORIGINATE_MOBILE_CONTEXT', source_context)
-            variables.setdefault('XIVO_FIX_CALLERID', '1')
-            variables.setdefault('XIVO_ORIGINAL_CALLER_ID', '"{exten}" <{exten}>'.format(exten=requested_extension))
-            variables.setdefault('WAZO_ORIGINATE_DESTINATION_PRIORITY', str(requested_priority))
-            variables.setdefault('WAZO_ORIGINATE_DESTINATION_EXTENSION', requested_extension)
-            variables.setdefault('WAZO_ORIGINATE_DESTINATION_CONTEXT', requested_context)
-            variables.setdefault('WAZO_ORIGINATE_DESTINATION_CALLERID_ALL', '"{exten}" <{exten}>'.format(exten=source_mobile))
-            dial_echo_request_id = self._dial_echo_manager.new_dial_echo_request()
-            variables.setdefault('_WAZO_DIAL_ECHO_REQUEST_ID', dial_echo_request_id)
-
-            channel = self._ari.channels.originate(endpoint=endpoint,
-                                                   extension=extension,
-                                                   context=context,
-                                                   priority=priority,
-                                                   variables={'variables': variables})
-            try:
-                channel_id = self._dial_echo_manager.wait(dial_echo_request_id, timeout=5)
-            except DialEchoTimeout:
-                details = {
-                    'mobile_extension': source_mobile,
-                    'mobile_context': source_context,
-                }
-                raise CallCreationError('Could not dial mobile number', details=details)
-            channel = self._ari.channels.get(channelId=channel_id)
+        source_mobile = User(source_user, self._confd).mobile_phone_number()
+        if not source_mobile:
+            raise CallCreationError('User has no mobile phone number', details={'user': source_user})
+        source_context = User(source_user, self._confd).main_line().context()
+        if not ami.extension_exists(self._ami, source_context, source_mobile, priority=1):
+            details = {'user': source_user,
+                       'mobile_exten': source_mobile,
+                       'mobile_context': source_context}
+            raise CallCreationError('User has invalid mobile phone number', details=details)
+        endpoint = 'local/s@wazo-originate-mobile-leg1/n'
+        context, extension, priority = 'wazo-originate-mobile-leg2', 's', 1
+
+        variables.setdefault('_XIVO_USERUUID', source_user)
+        variables.setdefault('WAZO_DEREFERENCED_USERUUID', source_user)
+        variables.setdefault('WAZO_ORIGINATE_MOBILE_PRIORITY', '1')
+        variables.setdefault('WAZO_ORIGINATE_MOBILE_EXTENSION', source_mobile)
+        variables.setdefault('WAZO_ORIGINATE_MOBILE_CONTEXT', source_context)
+        variables.setdefault('XIVO_FIX_CALLERID', '1')
+        variables.setdefault('XIVO_ORIGINAL_CALLER_ID', '"{exten}" <{exten}>'.format(exten=requested_extension))
+        variables.setdefault('WAZO_ORIGINATE_DESTINATION_PRIORITY', str(requested_priority))
+        variables.setdefault('WAZO_ORIGINATE_DESTINATION_EXTENSION', requested_extension)
+        variables.setdefault('WAZO_ORIGINATE_DESTINATION_CONTEXT', requested_context)
+        variables.setdefault('WAZO_ORIGINATE_DESTINATION_CALLERID_ALL', '"{exten}" <{exten}>'.format(exten=source_mobile))
+        dial_echo_request_id = self._dial_echo_manager.new_dial_echo_request()
+        variables.setdefault('_WAZO_DIAL_ECHO_REQUEST_ID', dial_echo_request_id)
+
+        self._ari.channels.originate(endpoint=endpoint,
+                                     extension=extension,
+                                     context=context,
+                                     priority=priority,
+                                     variables={'variables': variables})
+
+        details = {
+            'mobile_extension': source_mobile,
+            'mobile_context': source_context,
+        }
+        return dial_echo_request_id, details
 
-        else:
-            if 'line_id' in request['source']:
-                endpoint = User(source_user, self._confd).line(request['source']['line_id']).interface()
-            else:
-                endpoint = User(source_user, self._confd).main_line().interface()
-
-            context, extension, priority = requested_context, requested_extension, requested_priority
-
-            variables.setdefault('XIVO_FIX_CALLERID', '1')
-            variables.setdefault('CONNECTEDLINE(name)', extension)
-            variables.setdefault('CONNECTEDLINE(num)', '' if extension.startswith('#') else extension)
-            variables.setdefault('CALLERID(name)', extension)
-            variables.setdefault('CALLERID(num)', extension)
-            variables.setdefault('WAZO_CHANNEL_DIRECTION', 'to-wazo')
-
-            channel = self._ari.channels.originate(endpoint=endpoint,
-                                                   extension=extension,
-                                                   context=context,
-                                                   priority=priority,
-                                                   variables={'variables': variables})
+    def _originate_from_line(self, request):
+        source_user = request['source']['user']
+        variables = request.get('variables', {})
 
+        if 'line_id' in request['source']:
+            endpoint = User(source_user, self._confd).line(request['source']['line_id']).interface()
+        else:
+            endpoint = User(source_user, self._confd).main_line().interface()
+
+        context = request['destination']['context']
+        extension = request['destination']['extension']
+        priority = request['destination']['priority']
+
+        variables.setdefault('XIVO_FIX_CALLERID', '1')
+        variables.setdefault('CONNECTEDLINE(name)', extension)
+        variables.setdefault('CONNECTEDLINE(num)', '' if extension.startswith('#') else extension)
+        variables.setdefault('CALLERID(name)', extension)
+        variables.setdefault('CALLERID(num)', extension)
+        variables.setdefault('WAZO_CHANNEL_DIRECTION', 'to-wazo')
+
+        return self._ari.channels.originate(endpoint=endpoint,
+                                            extension=extension,
+                                            context=context,
+                                            priority=priority,
+                                            variables={'variables': variables})
+
+    def _make_originated_call(self, request, channel):
         call = self.make_call_from_channel(self._ari, channel)
         call.dialed_extension = request['destination']['extension']
         return call
 
     def originate_user(self, request, user_uuid):
+        return self.originate(self._user_originate_request(request, user_uuid))
+
+    def originate_user_async(self, request, user_uuid):
+        return self.originate_async(self._user_originate_request(request, user_uuid))
+
+    def _user_originate_request(self, request, user_uuid):
         if 'line_id' in request and not request['from_mobile']:
             context = User(user_uuid, self._confd).line(request['line_id']).context()
         else:
@@ -155,12 +274,12 @@ class CallsService:
         }
         if 'line_id' in request:
             new_request['source']['line_id'] = request['line_id']
-        return self.originate(new_request)
+        return new_request
 
     def get(self, call_id):
         channel_id = call_id
         try:
-            channel = self._ari.channels.get(channelId=channel_id)
+            channel = self._ari_cache.get_channel(channel_id)
         except ARINotFound:
             raise NoSuchCall(channel_id)
 
@@ -169,14 +288,14 @@ class CallsService:
     def hangup(self, call_id):
         channel_id = call_id
         try:
-            self._ari.channels.get(channelId=channel_id)
+            self._ari_cache.get_channel(channel_id)
         except ARINotFound:
             raise NoSuchCall(channel_id)
 
         self._ari.channels.hangup(channelId=channel_id)
 
     def hangup_user(self, call_id, user_uuid):
-        channel = Channel(call_id, self._ari)
+        channel = Channel(call_id, self._ari, self._ari_cache)
         if not channel.exists() or channel.is_local():
             raise NoSuchCall(call_id)
 
@@ -213,24 +332,59 @@ class CallsService:
         return new_channel.id
 
     def make_call_from_channel(self, ari, channel):
-        channel_helper = Channel(channel.id, ari)
-        call = Call(channel.id)
-        call.creation_time = channel.json['creationtime']
-        call.status = channel.json['state']
-        call.caller_id_name = channel.json['caller']['name']
-        call.caller_id_number = channel.json['caller']['number']
-        call.peer_caller_id_name = channel.json['connected']['name']
-        call.peer_caller_id_number = channel.json['connected']['number']
-        call.user_uuid = channel_helper.user()
-        call.on_hold = channel_helper.on_hold()
-        call.bridges = [bridge.id for bridge in ari.bridges.list() if channel.id in bridge.json['channels']]
-        call.talking_to = {connected_channel.id: connected_channel.user()
-                           for connected_channel in channel_helper.connected_channels()}
-        call.is_caller = channel_helper.is_caller()
-        call.dialed_extension = channel_helper.dialed_extension()
-        call.sip_call_id = channel_helper.sip_call_id()
-
-        return call
+        bridges = Channel(channel.id, ari, self._ari_cache).bridges()
+        return self.make_calls_from_snapshot(ari, [channel], bridges)[0]
+
+    def make_calls_from_snapshot(self, ari, channels, bridges, known_channels=None, users=None):
+        '''Build the calls from one snapshot of the channels and the bridges
+
+        The channel and bridge states are read from the snapshot and each
+        channel user is fetched only once, even when it appears in the
+        talking_to of many calls. `users` may hold the users already known
+        by channel id.'''
+        snapshots = {channel.id: channel for channel in (known_channels or channels)}
+        bridges_by_channel = defaultdict(list)
+        for bridge in bridges:
+            for channel_id in bridge.json['channels']:
+                bridges_by_channel[channel_id].append(bridge)
+
+        users = {} if users is None else users
+
+        def user(channel_helper):
+            if channel_helper.id not in users:
+                users[channel_helper.id] = channel_helper.user()
+            return users[channel_helper.id]
+
+        calls = []
+        for channel in channels:
+            channel_helper = Channel(channel.id, ari, self._ari_cache, snapshot=channel)
+            channel_bridges = bridges_by_channel.get(channel.id, [])
+            connected_channel_ids = set(sum((bridge.json['channels'] for bridge in channel_bridges), list()))
+            connected_channel_ids.discard(channel.id)
+
+            call = Call(channel.id)
+            call.creation_time = channel.json['creationtime']
+            call.status = channel.json['state']
+            call.caller_id_name = channel.json['caller']['name']
+            call.caller_id_number = channel.json['caller']['number']
+            call.peer_caller_id_name = channel.json['connected']['name']
+            call.peer_caller_id_number = channel.json['connected']['number']
+            call.user_uuid = user(channel_helper)
+            call.on_hold = channel_helper.on_hold()
+            call.bridges = [bridge.id for bridge in channel_bridges]
+            call.talking_to = {
+                connected_channel_id: user(Channel(connected_channel_id,
+                                                   ari,
+                                                   self._ari_cache,
+                                                   snapshot=snapshots.get(connected_channel_id)))
+                for connected_channel_id in connected_channel_ids
+            }
+            call.is_caller = channel_helper.is_caller()
+            call.dialed_extension = channel_helper.dialed_extension()
+            call.sip_call_id = channel_helper.sip_call_id()
+            calls.append(call)
+
+        return calls
 
     def make_call_from_ami_event(self, event):
         event_variables = event['ChanVariable']
@@ -0,0 +1,224 @@
+# Copyright 2019 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from hamcrest import (
+    assert_that,
+    equal_to,
+    has_entries,
+)
+from mock import Mock
+from unittest import TestCase
+
+from ..bus_consume import CallsBusEventHandler
+from ..call import Call
+from ..user_call_index import UserCallIndex
+
+
+class TestAddSipCallId(TestCase):
+
+    def setUp(self):
+        self.ari = Mock()
+        self.ari_cache = Mock()
+        self.handler = CallsBusEventHandler(
+            Mock(), self.ari, self.ari_cache, Mock(), Mock(), Mock(), 'xivo-uuid', Mock(), Mock(),
+        )
+
+    def test_given_local_channel_then_no_ari_request(self):
+        event = {'Channel': 'Local/1001@default-00000001;1', 'Uniqueid': '123', 'ChanVariable': {}}
+
+        self.handler._add_sip_call_id(event)
+
+        self.ari.channels.getChannelVar.assert_not_called()
+        self.ari.channels.setChannelVar.assert_not_called()
+
+    def test_given_call_id_in_chan_variable_then_only_set(self):
+        event = {
+            'Channel': 'PJSIP/abcdef-00000001',
+            'Uniqueid': '123',
+            'ChanVariable': {'CHANNEL(pjsip,call-id)': 'sip-call-id'},
+        }
+
+        self.handler._add_sip_call_id(event)
+
+        self.ari.channels.getChannelVar.assert_not_called()
+        self.ari.channels.setChannelVar.assert_called_once_with(
+            channelId='123', variable='WAZO_SIP_CALL_ID', value='sip-call-id', bypassStasis=True,
+        )
+
+    def test_given_pjsip_channel_then_call_id_is_read_once(self):
+        self.ari_cache.get_channelvars.return_value = {}
+        self.ari.channels.getChannelVar.return_value = {'value': 'sip-call-id'}
+        event = {'Channel': 'PJSIP/abcdef-00000001', 'Uniqueid': '123', 'ChanVariable': {}}
+
+        self.handler._add_sip_call_id(event)
+
+        self.ari.channels.getChannelVar.assert_called_once_with(
+            channelId='123', variable='CHANNEL(pjsip,call-id)',
+        )
+        self.ari.channels.setChannelVar.assert_called_once_with(
+            channelId='123', variable='WAZO_SIP_CALL_ID', value='sip-call-id', bypassStasis=True,
+        )
+
+
+class TestRelayChannelUpdated(TestCase):
+
+    def setUp(self):
+        self.ari = Mock()
+        self.ari_cache = Mock()
+        self.bus_publisher = Mock()
+        self.services = Mock()
+        self.handler = CallsBusEventHandler(
+            Mock(), self.ari, self.ari_cache, Mock(), self.bus_publisher, self.services, 'xivo-uuid', Mock(), Mock(),
+        )
+
+    def given_cached_call(self, channel_id, **fields):
+        call = Call(channel_id)
+        for name, value in fields.items():
+            setattr(call, name, value)
+        self.handler.calls.set(call)
+
+    def test_given_cached_call_then_body_built_from_the_event(self):
+        self.given_cached_call('1', user_uuid='user-1', dialed_extension='1002')
+        self.given_cached_call('2', user_uuid='user-2')
+        self.ari_cache.list_channel_bridges.return_value = [Mock(id='bridge', json={'channels': ['1', '2']})]
+        event = {
+            'Channel': 'PJSIP/abcdef-00000001',
+            'Uniqueid': '1',
+            'ChannelStateDesc': 'Up',
+            'CallerIDName': 'Alice',
+            'CallerIDNum': '1001',
+            'ConnectedLineName': '<unknown>',
+            'ConnectedLineNum': '1002',
+            'ChanVariable': {},
+        }
+
+        self.handler._relay_channel_updated(event)
+
+        bus_event = self.bus_publisher.publish.call_args[0][0]
+        assert_that(bus_event.body, has_entries(
+            call_id='1',
+            status='Up',
+            caller_id_name='Alice',
+            peer_caller_id_name='',
+            user_uuid='user-1',
+            dialed_extension='1002',
+            bridges=['bridge'],
+            talking_to={'2': 'user-2'},
+        ))
+        self.ari.channels.get.assert_not_called()
+        self.ari.channels.getChannelVar.assert_not_called()
+        self.services.make_call_from_channel.assert_not_called()
+
+    def test_given_direction_set_after_newchannel_then_is_caller_updated(self):
+        self.given_cached_call('1', user_uuid='user-1', is_caller=False)
+        self.ari_cache.list_channel_bridges.return_value = []
+        event = {
+            'Channel': 'PJSIP/abcdef-00000001',
+            'Uniqueid': '1',
+            'ChannelStateDesc': 'Ring',
+            'CallerIDName': 'Alice',
+            'CallerIDNum': '1001',
+            'ConnectedLineName': 'Bob',
+            'ConnectedLineNum': '1002',
+            'ChanVariable': {},
+        }
+
+        self.handler._update_caller_variable({
+            'channel': {'id': '1', 'name': 'PJSIP/abcdef-00000001'},
+            'variable': 'WAZO_CHANNEL_DIRECTION',
+            'value': 'to-wazo',
+        })
+        self.handler._relay_channel_updated(event)
+
+        bus_event = self.bus_publisher.publish.call_args[0][0]
+        assert_that(bus_event.body, has_entries(call_id='1', is_caller=True))
+
+    def test_given_call_held_with_ari_then_on_hold_updated(self):
+        self.given_cached_call('1', user_uuid='user-1', on_hold=False)
+        self.ari_cache.list_channel_bridges.return_value = []
+        event = {
+            'Channel': 'PJSIP/abcdef-00000001',
+            'Uniqueid': '1',
+            'ChannelStateDesc': 'Up',
+            'CallerIDName': 'Alice',
+            'CallerIDNum': '1001',
+            'ConnectedLineName': 'Bob',
+            'ConnectedLineNum': '1002',
+            'ChanVariable': {},
+        }
+
+        self.handler._update_on_hold_variable({
+            'channel': {'id': '1', 'name': 'PJSIP/abcdef-00000001'},
+            'variable': 'XIVO_ON_HOLD',
+            'value': '1',
+        })
+        self.handler._relay_channel_updated(event)
+
+        bus_event = self.bus_publisher.publish.call_args[0][0]
+        assert_that(bus_event.body, has_entries(call_id='1', on_hold=True))
+
+    def test_given_unknown_call_then_call_read_from_ari(self):
+        call = Call('1')
+        self.services.make_call_from_channel.return_value = call
+        event = {
+            'Channel': 'PJSIP/abcdef-00000001',
+            'Uniqueid': '1',
+            'ChannelStateDesc': 'Up',
+            'CallerIDName': 'Alice',
+            'CallerIDNum': '1001',
+            'ConnectedLineName': 'Bob',
+            'ConnectedLineNum': '1002',
+            'ChanVariable': {},
+        }
+
+        self.handler._relay_channel_updated(event)
+
+        self.ari_cache.get_channel.assert_called_once_with('1')
+        self.services.make_call_from_channel.assert_called_once_with(self.ari, self.ari_cache.get_channel.return_value)
+
+
+class TestIndexUserCall(TestCase):
+
+    def setUp(self):
+        self.index = UserCallIndex()
+        self.index.reset({})
+        self.handler = CallsBusEventHandler(
+            Mock(), Mock(), Mock(), Mock(), Mock(), Mock(), 'xivo-uuid', Mock(), self.index,
+        )
+
+    def test_given_user_set_after_newchannel_then_call_indexed(self):
+        self.handler._index_user_call({'Channel': 'PJSIP/abcdef-00000001', 'Uniqueid': '1', 'ChanVariable': {}})
+
+        self.handler._index_user_call_variable({
+            'channel': {'id': '1', 'name': 'PJSIP/abcdef-00000001'},
+            'variable': '_XIVO_USERUUID',
+            'value': 'user-1',
+        })
+
+        assert_that(self.index.channel_ids('user-1'), equal_to({'1'}))
+
+    def test_given_local_channel_then_not_indexed(self):
+        self.handler._index_user_call_variable({
+            'channel': {'id': '1', 'name': 'Local/1001@default-00000001;1'},
+            'variable': 'XIVO_USERUUID',
+            'value': 'user-1',
+        })
+
+        assert_that(self.index.channel_ids('user-1'), equal_to(set()))
+
+    def test_given_variable_set_after_hangup_then_forgotten_when_destroyed(self):
+        channel = {'id': '1', 'name': 'PJSIP/abcdef-00000001'}
+        self.handler._unindex_user_call({'Uniqueid': '1'})
+        self.handler._index_user_call_variable({'channel': channel, 'variable': 'XIVO_USERUUID', 'value': 'user-1'})
+
+        self.handler._forget_channel_variables({'channel': channel})
+
+        assert_that(self.index.channel_ids('user-1'), equal_to(set()))
+
+    def test_no_ami_varset_subscription(self):
+        bus_consumer = Mock()
+
+        self.handler.subscribe(bus_consumer)
+
+        event_types = [call[0][0] for call in bus_consumer.on_ami_event.call_args_list]
+        assert_that('VarSet' in event_types, equal_to(False))
@@ -0,0 +1,93 @@
+# Copyright 2019 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import threading
+
+from hamcrest import (
+    assert_that,
+    equal_to,
+)
+from mock import Mock
+from unittest import TestCase
+
+from ..coalescer import Coalescer
+
+
+class TestCoalescer(TestCase):
+
+    def test_given_no_window_when_update_then_callback_is_called(self):
+        callback = Mock()
+        coalescer = Coalescer(0, callback)
+
+        coalescer.update('c1')
+        coalescer.update('c1')
+
+        assert_that(callback.call_count, equal_to(2))
+
+    def test_updates_are_coalesced(self):
+        called = threading.Event()
+        callback = Mock(side_effect=lambda channel_id: called.set())
+        coalescer = Coalescer(0.01, callback)
+
+        coalescer.update('c1')
+        coalescer.update('c1')
+        coalescer.update('c1')
+
+        called.wait(timeout=1)
+        coalescer.stop()
+        callback.assert_called_once_with('c1')
+
+    def test_callbacks_run_one_at_a_time_on_a_single_thread(self):
+        done = threading.Event()
+        threads = []
+
+        def callback(channel_id):
+            threads.append(threading.current_thread())
+            if len(threads) == 3:
+                done.set()
+
+        coalescer = Coalescer(0.01, callback)
+        for channel_id in ('c1', 'c2', 'c3'):
+            coalescer.update(channel_id)
+
+        done.wait(timeout=1)
+        coalescer.stop()
+        assert_that(len(set(threads)), equal_to(1))
+
+    def test_flush_calls_the_pending_update(self):
+        callback = Mock()
+        coalescer = Coalescer(60, callback)
+
+        coalescer.update('c1')
+        coalescer.flush('c1')
+        coalescer.flush('c1')
+
+        callback.assert_called_once_with('c1')
+
+    def test_flush_without_update(self):
+        callback = Mock()
+        coalescer = Coalescer(60, callback)
+
+        coalescer.flush('c1')
+
+        callback.assert_not_called()
+
+    def test_flush_waits_for_the_running_callback(self):
+        running, release = threading.Event(), threading.Event()
+        result = []
+
+        def callback(channel_id):
+            running.set()
+            release.wait(timeout=1)
+            result.append('updated')
+
+        coalescer = Coalescer(0.01, callback)
+        coalescer.update('c1')
+        running.wait(timeout=1)
+        threading.Timer(0.01, release.set).start()
+
+        coalescer.flush('c1')
+        result.append('ended')
+        coalescer.stop()
+
+        assert_that(result, equal_to(['updated', 'ended']))
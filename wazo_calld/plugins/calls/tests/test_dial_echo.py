@@ -0,0 +1,85 @@
+# Copyright 2019 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import threading
+
+from hamcrest import (
+    assert_that,
+    calling,
+    contains,
+    equal_to,
+    instance_of,
+    not_,
+    raises,
+)
+from mock import Mock
+from unittest import TestCase
+
+from ..dial_echo import (
+    DialEchoManager,
+    DialEchoTimeout,
+)
+
+
+class TestDialEchoManager(TestCase):
+
+    def setUp(self):
+        self.manager = DialEchoManager(ttl=0)
+
+    def tearDown(self):
+        self.manager.stop()
+
+    def test_wait_returns_a_result_set_before(self):
+        request_id = self.manager.new_dial_echo_request()
+        self.manager.set_dial_echo_result(request_id, {'channel_id': 'channel-id'})
+
+        channel_id = self.manager.wait(request_id, timeout=0)
+
+        assert_that(channel_id, equal_to('channel-id'))
+
+    def test_wait_timeout(self):
+        request_id = self.manager.new_dial_echo_request()
+
+        assert_that(calling(self.manager.wait).with_args(request_id, timeout=0),
+                    raises(DialEchoTimeout))
+
+    def test_done_callback_is_called_with_the_channel_id(self):
+        callback = Mock()
+        request_id = self.manager.new_dial_echo_request()
+        self.manager.add_done_callback(request_id, callback)
+
+        self.manager.set_dial_echo_result(request_id, {'channel_id': 'channel-id'})
+        self.manager.stop()
+
+        callback.assert_called_once_with('channel-id', None)
+
+    def test_done_callback_is_not_run_by_the_caller_of_set_dial_echo_result(self):
+        callback_threads = []
+        request_id = self.manager.new_dial_echo_request()
+        self.manager.add_done_callback(request_id, lambda *_: callback_threads.append(threading.current_thread()))
+
+        self.manager.set_dial_echo_result(request_id, {'channel_id': 'channel-id'})
+        self.manager.stop()
+
+        assert_that(callback_threads, contains(not_(threading.current_thread())))
+
+    def test_sweep_fails_and_forgets_the_expired_requests(self):
+        callback = Mock()
+        request_id = self.manager.new_dial_echo_request()
+        self.manager.add_done_callback(request_id, callback)
+
+        self.manager._sweep()
+        self.manager.stop()
+
+        channel_id, error = callback.call_args[0]
+        assert_that(error, instance_of(DialEchoTimeout))
+        self.manager.set_dial_echo_result(request_id, {'channel_id': 'channel-id'})
+        assert_that(self.manager.wait(request_id, timeout=0), equal_to(None))
+
+    def test_sweep_forgets_the_results_nobody_waited_for(self):
+        request_id = self.manager.new_dial_echo_request()
+        self.manager.set_dial_echo_result(request_id, {'channel_id': 'channel-id'})
+
+        self.manager._sweep()
+
+        assert_that(self.manager.wait(request_id, timeout=0), equal_to(None))
@@ -4,18 +4,21 @@
 from collections import defaultdict
 from hamcrest import (
     assert_that,
+    contains,
+    equal_to,
     has_properties,
 )
 from mock import Mock
 from unittest import TestCase
 
 from ..services import CallsService
+from ..user_call_index import UserCallIndex
 
 
 class Testclassname(TestCase):
 
     def setUp(self):
-        self.services = CallsService(Mock(), Mock(), Mock(), Mock(), Mock())
+        self.services = CallsService(Mock(), Mock(), Mock(), Mock(), Mock(), Mock(), Mock(), Mock())
 
     def test_given_no_chan_variables_when_make_call_from_ami_event_then_call_has_none_values(self):
         event = defaultdict(str)
@@ -52,3 +55,121 @@ class Testclassname(TestCase):
         assert_that(call, has_properties({
             'user_uuid': 'new-user-uuid',
         }))
+
+
+def channel(channel_id, name='PJSIP/abcdef', **json):
+    result = Mock(id=channel_id)
+    result.json = {
+        'id': channel_id,
+        'name': '{}-{}'.format(name, channel_id),
+        'creationtime': '2019-01-01T00:00:00.000+0000',
+        'state': 'Up',
+        'caller': {'name': 'caller', 'number': '1001'},
+        'connected': {'name': 'connected', 'number': '1002'},
+        'dialplan': {'exten': '1002'},
+    }
+    result.json.update(json)
+    result.getChannelVar.return_value = {'value': '1002'}
+    return result
+
+
+class TestMakeCallsFromSnapshot(TestCase):
+
+    def setUp(self):
+        self.ari = Mock()
+        self.ari_cache = Mock()
+        self.services = CallsService(Mock(), Mock(), self.ari, self.ari_cache, Mock(), Mock(), Mock(), Mock())
+
+    def test_given_two_channels_talking_then_users_are_fetched_once_per_channel(self):
+        self.ari.channels.getChannelVar.side_effect = lambda channelId, variable: {'value': 'user-' + channelId}
+        channels = [channel('1'), channel('2')]
+        bridges = [Mock(id='bridge', json={'channels': ['1', '2']})]
+
+        calls = self.services.make_calls_from_snapshot(self.ari, channels, bridges)
+
+        assert_that(calls, contains(
+            has_properties(id_='1', user_uuid='user-1', bridges=['bridge'], talking_to={'2': 'user-2'}),
+            has_properties(id_='2', user_uuid='user-2', bridges=['bridge'], talking_to={'1': 'user-1'}),
+        ))
+        user_requests = [kwargs for _, kwargs in self.ari.channels.getChannelVar.call_args_list
+                         if kwargs['variable'] == 'XIVO_USERUUID']
+        assert_that(len(user_requests), equal_to(2))
+        self.ari.channels.get.assert_not_called()
+        self.ari.bridges.list.assert_not_called()
+        self.ari_cache.list_channel_bridges.assert_not_called()
+
+
+class TestListCalls(TestCase):
+
+    def setUp(self):
+        self.ari = Mock()
+        self.ari_cache = Mock()
+        self.ari_cache.list_bridges.return_value = []
+        self.ari.channels.getChannelVar.return_value = {'value': ''}
+        self.user_call_index = UserCallIndex()
+        self.services = CallsService(Mock(), Mock(), self.ari, self.ari_cache, Mock(), Mock(), self.user_call_index, Mock())
+
+    def given_channels(self, *channels):
+        self.ari_cache.list_channels.return_value = list(channels)
+
+    def test_filter_by_status(self):
+        self.given_channels(channel('1', state='Up'), channel('2', state='Ringing'))
+
+        calls = self.services.list_calls(status='Ringing')
+
+        assert_that(calls, contains(has_properties(id_='2')))
+
+    def test_filter_by_user_before_building_the_calls(self):
+        self.given_channels(
+            channel('1', channelvars={'XIVO_USERUUID': 'user-1'}),
+            channel('2', channelvars={'XIVO_USERUUID': 'user-2'}),
+        )
+
+        calls = self.services.list_calls(user_uuid='user-2')
+
+        assert_that(calls, contains(has_properties(id_='2', user_uuid='user-2')))
+
+    def test_filter_by_tenant(self):
+        self.given_channels(
+            channel('1', channelvars={'WAZO_TENANT_UUID': 'tenant-1'}),
+            channel('2', channelvars={'WAZO_TENANT_UUID': 'tenant-2'}),
+        )
+
+        calls = self.services.list_calls(tenant_uuid='tenant-1')
+
+        assert_that(calls, contains(has_properties(id_='1')))
+
+    def test_order_and_paginate(self):
+        self.given_channels(
+            channel('1', creationtime='2019-01-01T00:00:03.000+0000'),
+            channel('2', creationtime='2019-01-01T00:00:01.000+0000'),
+            channel('3', creationtime='2019-01-01T00:00:02.000+0000'),
+        )
+
+        calls = self.services.list_calls(order='creation_time', direction='desc', limit=2, offset=1)
+
+        assert_that(calls, contains(has_properties(id_='3'), has_properties(id_='2')))
+
+    def test_list_calls_user_excludes_local_channels(self):
+        self.given_channels(
+            channel('1', channelvars={'XIVO_USERUUID': 'user-1'}),
+            channel('2', name='Local/1001@default', channelvars={'WAZO_DEREFERENCED_USERUUID': 'user-1'}),
+        )
+
+        calls = self.services.list_calls_user('user-1')
+
+        assert_that(calls, contains(has_properties(id_='1')))
+
+    def test_list_calls_user_reads_only_the_indexed_channels(self):
+        channels = {
+            '1': channel('1', channelvars={'XIVO_USERUUID': 'user-1'}),
+            '2': channel('2', channelvars={'XIVO_USERUUID': 'user-2'}),
+            '3': channel('3', channelvars={'XIVO_USERUUID': 'user-2'}),
+        }
+        self.ari_cache.get_channel.side_effect = channels.get
+        self.user_call_index.reset({'1': 'user-1', '2': 'user-1', '3': 'user-2'})
+
+        calls = self.services.list_calls_user('user-1')
+
+        assert_that(calls, contains(has_properties(id_='1', user_uuid='user-1')))
+        self.ari_cache.list_channels.assert_not_called()
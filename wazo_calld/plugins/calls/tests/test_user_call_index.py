@@ -0,0 +1,120 @@
+# Copyright 2019 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from hamcrest import (
+    assert_that,
+    empty,
+    equal_to,
+)
+from mock import Mock
+from unittest import TestCase
+
+from ..user_call_index import (
+    UserCallIndex,
+    UserCallIndexReconciler,
+)
+
+
+class TestUserCallIndex(TestCase):
+
+    def setUp(self):
+        self.index = UserCallIndex()
+
+    def test_update_moves_the_channel_to_the_new_user(self):
+        self.index.update('1', 'user-1')
+        self.index.update('1', 'user-2')
+
+        assert_that(self.index.channel_ids('user-1'), empty())
+        assert_that(self.index.channel_ids('user-2'), equal_to({'1'}))
+
+    def test_remove(self):
+        self.index.update('1', 'user-1')
+        self.index.update('2', 'user-1')
+
+        self.index.remove('1')
+
+        assert_that(self.index.channel_ids('user-1'), equal_to({'2'}))
+
+    def test_reset_replaces_the_index(self):
+        self.index.update('1', 'user-1')
+
+        self.index.reset({'2': 'user-1', '3': None}, self.index.sequence())
+
+        assert_that(self.index.is_ready(), equal_to(True))
+        assert_that(self.index.channel_ids('user-1'), equal_to({'2'}))
+
+    def test_reset_keeps_the_channels_updated_since_the_snapshot(self):
+        self.index.update('1', 'user-1')
+        since = self.index.sequence()
+        self.index.update('2', 'user-1')
+        self.index.remove('3')
+
+        self.index.reset({'1': 'user-2', '2': None, '3': 'user-1'}, since)
+
+        assert_that(self.index.channel_ids('user-1'), equal_to({'2'}))
+        assert_that(self.index.channel_ids('user-2'), equal_to({'1'}))
+
+    def test_given_no_rebuild_then_updates_are_not_tracked(self):
+        self.index.update('1', 'user-1')
+        self.index.remove('1')
+
+        assert_that(self.index._updated, empty())
+
+    def test_cancel_reset_forgets_the_tracked_updates(self):
+        since = self.index.sequence()
+        self.index.update('1', 'user-1')
+
+        self.index.cancel_reset(since)
+        self.index.update('2', 'user-1')
+
+        assert_that(self.index._updated, empty())
+        assert_that(self.index.is_ready(), equal_to(False))
+
+
+def channel(channel_id, name='PJSIP/abcdef-00000001', **channelvars):
+    return Mock(id=channel_id, json={'name': name, 'channelvars': channelvars})
+
+
+class TestUserCallIndexReconciler(TestCase):
+
+    def setUp(self):
+        self.index = UserCallIndex()
+        self.ari = Mock()
+        self.ari_cache = Mock()
+        self.ari_cache.is_synced.return_value = True
+        self.reconciler = UserCallIndexReconciler(self.index, self.ari, self.ari_cache, interval=60)
+
+    def test_given_cache_disabled_then_not_started(self):
+        self.ari_cache.is_enabled.return_value = False
+
+        self.reconciler.start()
+
+        assert_that(self.reconciler._thread, equal_to(None))
+
+    def test_given_cache_not_synced_then_channels_not_read(self):
+        self.ari_cache.is_synced.return_value = False
+
+        self.reconciler.reconcile()
+
+        self.ari_cache.list_channels.assert_not_called()
+        assert_that(self.index.is_ready(), equal_to(False))
+
+    def test_given_user_in_channelvars_then_index_rebuilt(self):
+        self.ari_cache.list_channels.return_value = [
+            channel('1', XIVO_USERUUID='user-1'),
+            channel('2', name='Local/1001@default-00000001;1'),
+        ]
+
+        self.reconciler.reconcile()
+
+        assert_that(self.index.is_ready(), equal_to(True))
+        assert_that(self.index.channel_ids('user-1'), equal_to({'1'}))
+        self.ari.channels.getChannelVar.assert_not_called()
+
+    def test_given_user_not_in_channelvars_then_no_ari_request(self):
+        self.ari_cache.list_channels.return_value = [channel('1')]
+
+        self.reconciler.reconcile()
+
+        assert_that(self.index.is_ready(), equal_to(False))
+        self.ari.channels.getChannelVar.assert_not_called()
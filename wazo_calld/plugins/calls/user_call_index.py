@@ -0,0 +1,159 @@
+# Copyright 2019 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import itertools
+import logging
+import threading
+
+from collections import defaultdict
+
+from wazo_calld.helpers.ari_ import Channel
+
+logger = logging.getLogger(__name__)
+
+
+class UserCallIndex:
+    '''Channel ids of the calls of each user.
+
+    The index is fed by the AMI and ARI events and periodically rebuilt from the
+    channels by a UserCallIndexReconciler. It is not ready until the first
+    rebuild. Local channels are never indexed.'''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ready = False
+        self._users = {}
+        self._channel_ids = defaultdict(set)
+        # the updates are only tracked once a rebuild has started
+        self._tracking = False
+        self._updated = {}
+        self._sequence = itertools.count(1)
+        self._last_sequence = 0
+
+    def is_ready(self):
+        return self._ready
+
+    def channel_ids(self, user_uuid):
+        with self._lock:
+            return set(self._channel_ids.get(user_uuid, ()))
+
+    def update(self, channel_id, user_uuid):
+        with self._lock:
+            self._remove(channel_id)
+            self._last_sequence = next(self._sequence)
+            if self._tracking:
+                self._updated[channel_id] = self._last_sequence
+            if user_uuid:
+                self._add(channel_id, user_uuid)
+
+    def remove(self, channel_id):
+        self.update(channel_id, None)
+
+    def sequence(self):
+        with self._lock:
+            self._tracking = True
+            return self._last_sequence
+
+    def cancel_reset(self, since):
+        '''Forget the updates tracked for a rebuild from `since` that will not happen'''
+        with self._lock:
+            if self._ready:
+                self._updated = {channel_id: sequence for channel_id, sequence in self._updated.items()
+                                 if sequence > since}
+            else:
+                self._tracking = False
+                self._updated = {}
+
+    def reset(self, users, since=0):
+        '''Replace the index with `users`, a user uuid by channel id
+
+        The channels updated after `since`, a value of sequence(), keep their
+        indexed user, since `users` may have been read before these updates.'''
+        with self._lock:
+            updated = {channel_id: self._users.get(channel_id)
+                       for channel_id, sequence in self._updated.items() if sequence > since}
+            self._users = {}
+            self._channel_ids = defaultdict(set)
+            self._updated = {channel_id: self._updated[channel_id] for channel_id in updated}
+            for channel_id, user_uuid in users.items():
+                if channel_id not in updated and user_uuid:
+                    self._add(channel_id, user_uuid)
+            for channel_id, user_uuid in updated.items():
+                if user_uuid:
+                    self._add(channel_id, user_uuid)
+            self._ready = True
+
+    def _add(self, channel_id, user_uuid):
+        self._users[channel_id] = user_uuid
+        self._channel_ids[user_uuid].add(channel_id)
+
+    def _remove(self, channel_id):
+        user_uuid = self._users.pop(channel_id, None)
+        if not user_uuid:
+            return
+
+        channel_ids = self._channel_ids[user_uuid]
+        channel_ids.discard(channel_id)
+        if not channel_ids:
+            del self._channel_ids[user_uuid]
+
+
+class UserCallIndexReconciler:
+    '''Rebuild a UserCallIndex from the channels every `interval` seconds
+
+    Corrects the index when AMI events were missed, e.g. during a bus
+    reconnection. The channels and their XIVO_USERUUID are read from the ARI
+    cache only: the index is never built when the cache is disabled, when it
+    is not synchronized or when XIVO_USERUUID is not in the channelvars of
+    ari.conf, nor with an interval of 0.'''
+
+    def __init__(self, index, ari, ari_cache, interval):
+        self._index = index
+        self._ari = ari
+        self._ari_cache = ari_cache
+        self._interval = interval
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if not self._interval or not self._ari_cache.is_enabled() or self._thread:
+            return
+
+        self._thread = threading.Thread(target=self._run, name='user_call_index_reconciler')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def reconcile(self):
+        if not self._ari_cache.is_synced():
+            logger.debug('user call index not reconciled: the ARI cache is not synchronized')
+            return
+
+        since = self._index.sequence()
+        users = {}
+        for channel in self._ari_cache.list_channels():
+            channel_helper = Channel(channel.id, self._ari, self._ari_cache, snapshot=channel)
+            if channel_helper.is_local():
+                continue
+            if 'XIVO_USERUUID' not in (channel.json.get('channelvars') or {}):
+                # reading the variable of each channel with ARI costs more than the index saves
+                logger.debug('user call index not reconciled: XIVO_USERUUID is not in the ARI channelvars')
+                self._index.cancel_reset(since)
+                return
+            users[channel.id] = channel_helper.user()
+        self._index.reset(users, since)
+        logger.debug('user call index reconciled: %s channels', len(users))
+
+    def _run(self):
+        while True:
+            try:
+                self.reconcile()
+            except Exception as e:
+                logger.error('could not reconcile the user call index: %s', e)
+            if self._stopped.wait(self._interval):
+                return
@@ -31,7 +31,7 @@ class Plugin:
         token_changed_subscribe(confd_client.set_token)
 
         switchboards_notifier = SwitchboardsNotifier(bus_publisher)
-        switchboards_service = SwitchboardsService(ari.client, confd_client, switchboards_notifier)
+        switchboards_service = SwitchboardsService(ari.client, ari.cache, confd_client, switchboards_notifier)
 
         ari.register_application(DEFAULT_APPLICATION_NAME)
         switchboards_stasis = SwitchboardsStasis(ari.client, confd_client, switchboards_notifier, switchboards_service)
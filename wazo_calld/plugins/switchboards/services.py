@@ -40,8 +40,9 @@ logger = logging.getLogger(__name__)
 
 class SwitchboardsService:
 
-    def __init__(self, ari, confd, notifier):
+    def __init__(self, ari, ari_cache, confd, notifier):
         self._ari = ari
+        self._ari_cache = ari_cache
         self._confd = confd
         self._notifier = notifier
 
@@ -59,7 +60,7 @@ class SwitchboardsService:
 
         result = []
         for channel_id in channel_ids:
-            channel = self._ari.channels.get(channelId=channel_id)
+            channel = self._ari_cache.get_channel(channel_id)
 
             call = QueuedCall(channel.id)
             call.caller_id_name = channel.json['caller']['name']
@@ -132,8 +133,7 @@ class SwitchboardsService:
         except ARINotFound:
             raise NoSuchCall(call_id)
 
-        previous_bridges = [bridge for bridge in self._ari.bridges.list()
-                            if channel_to_hold.id in bridge.json['channels']]
+        previous_bridges = self._ari_cache.list_channel_bridges(channel_to_hold.id)
 
         hold_bridge_id = BRIDGE_HOLD_ID.format(uuid=switchboard_uuid)
         try:
@@ -179,7 +179,7 @@ class SwitchboardsService:
 
         result = []
         for channel_id in channel_ids:
-            channel = self._ari.channels.get(channelId=channel_id)
+            channel = self._ari_cache.get_channel(channel_id)
 
             call = HeldCall(channel.id)
             call.caller_id_name = channel.json['caller']['name']
@@ -32,9 +32,9 @@ class HangupLock:
         return source_candidate_id == self._source_id
 
     @classmethod
-    def from_source(cls, ari, source_id):
+    def from_source(cls, ari, ari_cache, source_id):
         result = []
-        target_candidates = [bridge for bridge in ari.bridges.list()]
+        target_candidates = ari_cache.list_bridges()
         for target_candidate in target_candidates:
             try:
                 lock = cls(ari, source_id, target_candidate.id)
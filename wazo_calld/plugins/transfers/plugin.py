@@ -45,7 +45,7 @@ class Plugin:
         transfers_service = TransfersService(amid_client, ari.client, confd_client, state_factory, state_persistor, transfer_lock)
 
         ari.register_application(DEFAULT_APPLICATION_NAME)
-        transfers_stasis = TransfersStasis(amid_client, ari.client, transfers_service, state_factory, state_persistor, config['uuid'])
+        transfers_stasis = TransfersStasis(amid_client, ari.client, ari.cache, transfers_service, state_factory, state_persistor, config['uuid'])
         transfers_stasis.subscribe()
 
         notifier = TransferNotifier(bus_publisher)
@@ -30,8 +30,9 @@ logger = logging.getLogger(__name__)
 
 class TransfersStasis:
 
-    def __init__(self, amid_client, ari_client, services, state_factory, state_persistor, xivo_uuid):
+    def __init__(self, amid_client, ari_client, ari_cache, services, state_factory, state_persistor, xivo_uuid):
         self.ari = ari_client
+        self.ari_cache = ari_cache
         self.amid = amid_client
         self.services = services
         self.xivo_uuid = xivo_uuid
@@ -262,7 +263,7 @@ class TransfersStasis:
 
     def bypass_hangup_lock_from_source(self, channel, event):
         lock_source = channel
-        for lock in HangupLock.from_source(self.ari, lock_source.id):
+        for lock in HangupLock.from_source(self.ari, self.ari_cache, lock_source.id):
             lock.kill_target()
 
     def bypass_hangup_lock_from_target(self, bridge):
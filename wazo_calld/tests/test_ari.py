@@ -0,0 +1,123 @@
+# Copyright 2019 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from unittest import TestCase
+
+from hamcrest import (
+    assert_that,
+    equal_to,
+    not_,
+)
+from mock import (
+    Mock,
+    patch,
+)
+
+from ..ari_ import (
+    CoreARI,
+    event_shard_key,
+)
+from ..dispatch import shard_safe
+
+
+def config(**kwargs):
+    result = {
+        'connection': {},
+        'startup_connection_tries': 1,
+        'startup_connection_delay': 0,
+        'reload_delay': 0.01,
+        'cache': {'enabled': False},
+        'docs_cache': {'enabled': False, 'directory': None},
+        'dispatch': {'workers': 0, 'queue_size': 0},
+    }
+    result.update(kwargs)
+    return result
+
+
+class TestEventShardKey(TestCase):
+
+    def test_channel_event(self):
+        event = {'type': 'ChannelEnteredBridge', 'channel': {'id': 'c1'}, 'bridge': {'id': 'b1'}}
+
+        assert_that(event_shard_key(event), equal_to('c1'))
+
+    def test_bridge_event(self):
+        event = {'type': 'BridgeDestroyed', 'bridge': {'id': 'b1'}}
+
+        assert_that(event_shard_key(event), equal_to('b1'))
+
+    def test_playback_event(self):
+        event = {'type': 'PlaybackFinished', 'playback': {'id': 'p1', 'target_uri': 'channel:c1'}}
+
+        assert_that(event_shard_key(event), equal_to('c1'))
+
+    def test_other_event(self):
+        event = {'type': 'ApplicationReplaced', 'application': 'callcontrol'}
+
+        assert_that(event_shard_key(event), equal_to(None))
+
+
+class TestCoreARIDispatch(TestCase):
+
+    def setUp(self):
+        client = Mock()
+        self.on_event = client.on_event
+        with patch('wazo_calld.ari_.CoreARI._new_ari_client', return_value=client):
+            self.ari = CoreARI(config(dispatch={'workers': 1, 'queue_size': 0}))
+
+    def test_given_handler_not_shard_safe_then_registered_as_is(self):
+        def handler(event):
+            pass
+
+        self.ari.client.on_event('StasisStart', handler)
+
+        self.on_event.assert_called_with('StasisStart', handler)
+
+    def test_given_shard_safe_handler_then_run_on_the_workers(self):
+        @shard_safe
+        def handler(event):
+            pass
+
+        self.ari.client.on_event('ChannelVarset', handler)
+
+        event_type, callback = self.on_event.call_args[0]
+        assert_that(event_type, equal_to('ChannelVarset'))
+        assert_that(callback, not_(equal_to(handler)))
+
+
+class TestCoreARIReload(TestCase):
+
+    def setUp(self):
+        with patch('wazo_calld.ari_.CoreARI._new_ari_client'):
+            self.ari = CoreARI(config())
+        self.ari.register_application('app1')
+        self.ari._connected_apps = {'app1'}
+        self.ari._trigger_disconnect = Mock()
+
+    def wait_reload(self):
+        timer = self.ari._reload_timer
+        if timer:
+            timer.join()
+
+    def test_given_same_applications_when_reload_then_no_reconnection(self):
+        self.ari.reload()
+        self.wait_reload()
+
+        self.ari._trigger_disconnect.assert_not_called()
+
+    def test_reloads_are_coalesced(self):
+        for app in ('app2', 'app3', 'app4'):
+            self.ari.register_application(app)
+            self.ari.reload()
+        self.wait_reload()
+
+        self.ari._trigger_disconnect.assert_called_once_with()
+
+    def test_given_application_added_then_removed_when_reload_then_no_reconnection(self):
+        self.ari.register_application('app2')
+        self.ari.reload()
+        self.ari.deregister_application('app2')
+        self.ari.reload()
+        self.wait_reload()
+
+        self.ari._trigger_disconnect.assert_not_called()
@@ -0,0 +1,154 @@
+# Copyright 2019 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from unittest import TestCase
+
+from hamcrest import (
+    assert_that,
+    calling,
+    contains_inanyorder,
+    equal_to,
+    raises,
+)
+from mock import (
+    Mock,
+    sentinel as s,
+)
+
+from ari.exceptions import ARINotFound
+
+from ..ari_cache import ARICache
+
+
+def channel_json(channel_id, **kwargs):
+    result = {'id': channel_id, 'name': 'PJSIP/abcdef-{}'.format(channel_id)}
+    result.update(kwargs)
+    return result
+
+
+def bridge_json(bridge_id, channels=None):
+    return {'id': bridge_id, 'channels': channels or []}
+
+
+class TestARICache(TestCase):
+
+    def setUp(self):
+        self.ari = Mock()
+        self.ari.channels.list.return_value = [Mock(id='c1', json=channel_json('c1'))]
+        self.ari.bridges.list.return_value = [Mock(id='b1', json=bridge_json('b1', ['c1']))]
+        self.cache = ARICache(self.ari, 'callcontrol', enabled=True)
+
+    def test_given_not_synced_when_get_channel_then_ari_is_requested(self):
+        self.ari.channels.get.return_value = s.channel
+
+        result = self.cache.get_channel('c1')
+
+        assert_that(result, equal_to(s.channel))
+        self.ari.channels.get.assert_called_once_with(channelId='c1')
+
+    def test_given_synced_when_get_channel_then_no_ari_request(self):
+        self.cache._on_websocket_start()
+
+        result = self.cache.get_channel('c1')
+
+        assert_that(result.json, equal_to(channel_json('c1')))
+        self.ari.channels.get.assert_not_called()
+
+    def test_given_synced_when_list_then_no_ari_request(self):
+        self.cache._on_websocket_start()
+        self.ari.channels.list.reset_mock()
+        self.ari.bridges.list.reset_mock()
+
+        channels = self.cache.list_channels()
+        bridges = self.cache.list_bridges()
+
+        assert_that([channel.id for channel in channels], contains_inanyorder('c1'))
+        assert_that([bridge.id for bridge in bridges], contains_inanyorder('b1'))
+        self.ari.channels.list.assert_not_called()
+        self.ari.bridges.list.assert_not_called()
+
+    def test_given_channel_destroyed_when_get_channel_then_ari_is_requested(self):
+        self.cache._on_websocket_start()
+        self.cache._on_channel_destroyed({'channel': channel_json('c1')})
+        self.ari.channels.get.side_effect = ARINotFound(ari_client=self.ari, original_error='not found')
+
+        assert_that(calling(self.cache.get_channel).with_args('c1'), raises(ARINotFound))
+
+    def test_given_websocket_stopped_when_get_channel_then_ari_is_requested(self):
+        self.cache._on_websocket_start()
+        self.cache._on_websocket_stop()
+
+        self.cache.get_channel('c1')
+
+        self.ari.channels.get.assert_called_once_with(channelId='c1')
+
+    def test_channel_state_change(self):
+        self.cache._on_websocket_start()
+
+        self.cache._on_channel_updated({'channel': channel_json('c1', state='Up')})
+
+        assert_that(self.cache.get_channel('c1').json['state'], equal_to('Up'))
+
+    def test_channel_variable_set_updates_channelvars(self):
+        self.ari.channels.list.return_value = [
+            Mock(id='c1', json=channel_json('c1', channelvars={'XIVO_ON_HOLD': ''})),
+        ]
+        self.cache._on_websocket_start()
+
+        self.cache._on_channel_variable_set({
+            'channel': channel_json('c1'),
+            'variable': 'XIVO_ON_HOLD',
+            'value': '1',
+        })
+
+        result = self.cache.get_channel('c1').json['channelvars']
+        assert_that(result, equal_to({'XIVO_ON_HOLD': '1'}))
+
+    def test_get_channelvars(self):
+        self.ari.channels.list.return_value = [
+            Mock(id='c1', json=channel_json('c1', channelvars={'XIVO_ON_HOLD': '1'})),
+        ]
+        assert_that(self.cache.get_channelvars('c1'), equal_to({}))
+
+        self.cache._on_websocket_start()
+
+        assert_that(self.cache.get_channelvars('c1'), equal_to({'XIVO_ON_HOLD': '1'}))
+        assert_that(self.cache.get_channelvars('unknown'), equal_to({}))
+        self.ari.channels.get.assert_not_called()
+
+    def test_bridge_updated_and_destroyed(self):
+        self.cache._on_websocket_start()
+
+        self.cache._on_bridge_updated({'bridge': bridge_json('b2', ['c1'])})
+        assert_that(self.cache.get_bridge('b2').json['channels'], equal_to(['c1']))
+
+        self.cache._on_bridge_destroyed({'bridge': bridge_json('b2')})
+        self.cache.get_bridge('b2')
+        self.ari.bridges.get.assert_called_once_with(bridgeId='b2')
+
+    def test_given_disabled_when_subscribe_then_no_callbacks(self):
+        cache = ARICache(self.ari, 'callcontrol', enabled=False)
+
+        cache.subscribe()
+
+        self.ari.on_event.assert_not_called()
+
+    def test_list_channel_bridges_follows_bridge_events(self):
+        self.cache._on_websocket_start()
+
+        self.cache._on_bridge_updated({'bridge': bridge_json('b2', ['c1', 'c2']), 'channel': channel_json('c2')})
+        assert_that([b.id for b in self.cache.list_channel_bridges('c1')], contains_inanyorder('b1', 'b2'))
+        assert_that([b.id for b in self.cache.list_channel_bridges('c2')], contains_inanyorder('b2'))
+
+        self.cache._on_bridge_updated({'bridge': bridge_json('b2', ['c1']), 'channel': channel_json('c2')})
+        assert_that(self.cache.list_channel_bridges('c2'), equal_to([]))
+
+        self.cache._on_bridge_destroyed({'bridge': bridge_json('b1')})
+        assert_that([b.id for b in self.cache.list_channel_bridges('c1')], contains_inanyorder('b2'))
+        self.ari.bridges.list.assert_called_once_with()
+
+    def test_given_not_synced_when_list_channel_bridges_then_bridges_are_listed(self):
+        result = self.cache.list_channel_bridges('c1')
+
+        assert_that([bridge.id for bridge in result], contains_inanyorder('b1'))
+        assert_that(self.cache.list_channel_bridges('c2'), equal_to([]))
@@ -0,0 +1,85 @@
+# Copyright 2019 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import shutil
+import tempfile
+
+from unittest import TestCase
+
+from hamcrest import (
+    assert_that,
+    contains_inanyorder,
+    equal_to,
+    starts_with,
+)
+from mock import (
+    Mock,
+    patch,
+)
+
+from ..ari_docs_cache import ARIDocsCache
+
+BASE_URL = 'http://localhost:5039'
+DOCS = {
+    'http://localhost:5039/ari/asterisk/info': {'system': {'version': '16.3.0'}},
+    'http://localhost:5039/ari/api-docs/resources.json': {
+        'basePath': 'http://localhost:5039/ari',
+        'apis': [{'path': '/api-docs/channels.{format}'}],
+    },
+    'http://localhost:5039/ari/api-docs/channels.json': {
+        'basePath': 'http://localhost:5039/ari',
+        'apis': [],
+    },
+}
+
+
+def get(url, auth):
+    return Mock(json=Mock(return_value=DOCS[url]))
+
+
+@patch('wazo_calld.ari_docs_cache.ari')
+@patch('wazo_calld.ari_docs_cache.requests')
+class TestARIDocsCache(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = ARIDocsCache(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_when_connect_then_client_loads_the_docs_from_disk(self, requests, ari):
+        requests.get.side_effect = get
+
+        result = self.cache.connect(BASE_URL, 'username', 'password')
+
+        assert_that(result, equal_to(ari.Client.return_value))
+        file_url = ari.Client.call_args[0][0]
+        assert_that(file_url, starts_with('file://{}/'.format(self.directory)))
+        ari.connect.assert_not_called()
+
+    def test_given_docs_cached_when_connect_then_only_version_is_requested(self, requests, ari):
+        requests.get.side_effect = get
+        self.cache.connect(BASE_URL, 'username', 'password')
+        requests.get.reset_mock()
+
+        with patch.object(self.cache, '_check_in_background') as check:
+            self.cache.connect(BASE_URL, 'username', 'password')
+
+        requested_urls = [call[0][0] for call in requests.get.call_args_list]
+        assert_that(requested_urls, contains_inanyorder('http://localhost:5039/ari/asterisk/info'))
+        check.assert_called_once_with(
+            ari.Client.call_args[0][0][len('file://'):].rstrip('/'),
+            BASE_URL,
+            ('username', 'password'),
+        )
+
+    def test_check_when_spec_unchanged(self, requests, ari):
+        requests.get.side_effect = get
+        self.cache.connect(BASE_URL, 'username', 'password')
+        docs_dir = ari.Client.call_args[0][0][len('file://'):].rstrip('/')
+
+        with patch.object(self.cache, '_save') as save:
+            self.cache._check(docs_dir, BASE_URL, ('username', 'password'))
+
+        save.assert_not_called()
@@ -0,0 +1,139 @@
+# Copyright 2019 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from unittest import TestCase
+
+from hamcrest import (
+    assert_that,
+    equal_to,
+)
+from mock import (
+    Mock,
+    patch,
+)
+from requests import HTTPError
+
+from ..auth import TokenCache
+from ..bus import CoreBusConsumer
+from .test_bus import config as bus_config
+
+
+def token_infos(session_uuid='session-uuid', utc_expires_at='2100-01-01T00:00:00.000000'):
+    return {
+        'token': 'my-token',
+        'session_uuid': session_uuid,
+        'utc_expires_at': utc_expires_at,
+        'metadata': {'pbx_user_uuid': 'user-uuid'},
+    }
+
+
+class TestTokenCache(TestCase):
+
+    def setUp(self):
+        self.cache = TokenCache()
+        with patch('wazo_calld.auth.AuthClient') as AuthClient:
+            self.cache.set_config({}, {'ttl': 30, 'max_size': 2})
+        self.auth_client = AuthClient.return_value
+        self.auth_client.token.get.return_value = token_infos()
+
+    def status(self):
+        status = {'token_cache': {}}
+        self.cache.provide_status(status)
+        return status['token_cache']
+
+    def test_get_is_cached(self):
+        self.cache.get('my-token')
+        result = self.cache.get('my-token')
+
+        assert_that(result, equal_to(token_infos()))
+        self.auth_client.token.get.assert_called_once_with('my-token', None)
+        assert_that(self.status(), equal_to({'size': 1, 'hits': 1, 'misses': 1}))
+
+    def test_get_is_cached_by_acl(self):
+        self.cache.get('my-token', 'calld.calls.read')
+        self.cache.get('my-token', 'calld.calls.create')
+
+        assert_that(self.auth_client.token.get.call_count, equal_to(2))
+
+    def test_given_token_cached_with_acl_when_get_without_acl_then_cached(self):
+        self.cache.get('my-token', 'calld.users.me.calls.read')
+        result = self.cache.get('my-token')
+
+        assert_that(result, equal_to(token_infos()))
+        self.auth_client.token.get.assert_called_once_with('my-token', 'calld.users.me.calls.read')
+
+    def test_given_token_cached_without_acl_when_get_with_acl_then_requested(self):
+        self.cache.get('my-token')
+        self.cache.get('my-token', 'calld.users.me.calls.read')
+
+        assert_that(self.auth_client.token.get.call_count, equal_to(2))
+
+    def test_given_ttl_expired_when_get_then_token_is_requested(self):
+        with patch('wazo_calld.auth.time.time', return_value=1000):
+            self.cache.get('my-token')
+        with patch('wazo_calld.auth.time.time', return_value=1031):
+            self.cache.get('my-token')
+
+        assert_that(self.auth_client.token.get.call_count, equal_to(2))
+
+    def test_given_token_expired_when_get_then_token_is_requested(self):
+        self.auth_client.token.get.return_value = token_infos(utc_expires_at='1970-01-01T00:16:50')
+        with patch('wazo_calld.auth.time.time', return_value=1000):
+            self.cache.get('my-token')
+        with patch('wazo_calld.auth.time.time', return_value=1011):
+            self.cache.get('my-token')
+
+        assert_that(self.auth_client.token.get.call_count, equal_to(2))
+
+    def test_cache_is_bounded(self):
+        for token in ('token-1', 'token-2', 'token-3'):
+            self.cache.get(token)
+
+        assert_that(self.status()['size'], equal_to(2))
+
+    def test_is_valid(self):
+        assert_that(self.cache.is_valid('my-token', 'calld.calls.read'), equal_to(True))
+
+        self.auth_client.token.get.side_effect = HTTPError(response=Mock(status_code=403))
+        assert_that(self.cache.is_valid('my-token', 'calld.calls.create'), equal_to(False))
+
+    def test_invalid_tokens_are_not_cached(self):
+        self.auth_client.token.get.side_effect = HTTPError(response=Mock(status_code=404))
+
+        self.cache.is_valid('my-token')
+        self.cache.is_valid('my-token')
+
+        assert_that(self.auth_client.token.get.call_count, equal_to(2))
+
+    def test_session_deleted(self):
+        self.cache.get('my-token')
+
+        self.cache.on_session_deleted({'uuid': 'session-uuid'})
+        self.cache.get('my-token')
+
+        assert_that(self.auth_client.token.get.call_count, equal_to(2))
+
+
+class TestSessionDeletedEvent(TestCase):
+
+    def setUp(self):
+        self.cache = TokenCache()
+        with patch('wazo_calld.auth.AuthClient') as AuthClient:
+            self.cache.set_config({}, {'ttl': 30, 'max_size': 2})
+        self.auth_client = AuthClient.return_value
+        self.auth_client.token.get.return_value = token_infos()
+        self.consumer = CoreBusConsumer(bus_config())
+        self.consumer.on_event('session_deleted', self.cache.on_session_deleted)
+
+    def test_session_deleted_message_from_wazo_auth(self):
+        self.cache.get('my-token')
+        body = {
+            'name': 'session_deleted',
+            'origin_uuid': 'wazo-uuid',
+            'data': {'uuid': 'session-uuid', 'user_uuid': 'user-uuid', 'tenant_uuid': 'tenant-uuid'},
+        }
+
+        self.consumer._on_bus_message(body, Mock())
+        self.cache.get('my-token')
+
+        assert_that(self.auth_client.token.get.call_count, equal_to(2))
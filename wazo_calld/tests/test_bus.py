@@ -0,0 +1,150 @@
+# Copyright 2019 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import threading
+
+from unittest import TestCase
+
+from hamcrest import (
+    assert_that,
+    contains,
+    equal_to,
+)
+from mock import (
+    Mock,
+    patch,
+)
+
+from ..bus import CoreBusConsumer
+from ..dispatch import shard_safe
+
+
+def config(**consumer_config):
+    consumer = {
+        'prefetch_count': 0,
+        'ack_batch_size': 3,
+        'workers': 0,
+        'queue_size': 0,
+    }
+    consumer.update(consumer_config)
+    return {
+        'bus': {
+            'username': 'guest',
+            'password': 'guest',
+            'host': 'localhost',
+            'port': 5672,
+            'exchange_name': 'xivo',
+            'exchange_type': 'topic',
+            'consumer': consumer,
+        },
+    }
+
+
+def ami_message(event_type='Newstate', uniqueid='1234.5'):
+    return {'data': {'Event': event_type, 'Uniqueid': uniqueid}}
+
+
+class TestCoreBusConsumer(TestCase):
+
+    def setUp(self):
+        self.consumer = CoreBusConsumer(config())
+
+    def test_events_are_published_to_subscribers(self):
+        callback = Mock()
+        self.consumer._events_pubsub.subscribe('Newstate', callback)
+
+        self.consumer._on_bus_message(ami_message(), Mock())
+
+        callback.assert_called_once_with({'Event': 'Newstate', 'Uniqueid': '1234.5'})
+
+    def test_given_no_workers_then_each_message_is_acked_without_prefetch(self):
+        messages = [Mock() for _ in range(2)]
+        consumer = CoreBusConsumer(config(prefetch_count=100))
+
+        for message in messages:
+            consumer._on_bus_message(ami_message(), message)
+
+        for message in messages:
+            message.ack.assert_called_once_with()
+        Consumer = Mock()
+        consumer.get_consumers(Consumer, Mock())
+        assert_that(Consumer.call_args[1]['prefetch_count'], equal_to(None))
+
+    def test_given_workers_then_messages_are_acked_by_batch(self):
+        consumer = CoreBusConsumer(config(workers=1))
+        messages = [Mock() for _ in range(4)]
+
+        for message in messages:
+            consumer._on_bus_message(ami_message(), message)
+
+        messages[2].ack.assert_called_once_with(multiple=True)
+        for message in (messages[0], messages[1], messages[3]):
+            message.ack.assert_not_called()
+
+    def test_invalid_messages_are_acked(self):
+        consumer = CoreBusConsumer(config(workers=1))
+        messages = [Mock() for _ in range(3)]
+
+        for message in messages:
+            consumer._on_bus_message({}, message)
+
+        messages[2].ack.assert_called_once_with(multiple=True)
+
+    def test_given_old_unacked_message_when_on_iteration_then_acked(self):
+        consumer = CoreBusConsumer(config(workers=1))
+        message = Mock()
+        with patch('wazo_calld.bus.time.monotonic', return_value=10):
+            consumer._on_bus_message(ami_message(), message)
+
+        with patch('wazo_calld.bus.time.monotonic', return_value=10.1):
+            consumer.on_iteration()
+        message.ack.assert_not_called()
+
+        with patch('wazo_calld.bus.time.monotonic', return_value=11):
+            consumer.on_iteration()
+        message.ack.assert_called_once_with(multiple=True)
+
+    def test_ack_batch_size_is_limited_by_prefetch_count(self):
+        consumer = CoreBusConsumer(config(prefetch_count=4, ack_batch_size=20, workers=1))
+        messages = [Mock() for _ in range(2)]
+
+        for message in messages:
+            consumer._on_bus_message(ami_message(), message)
+
+        messages[1].ack.assert_called_once_with(multiple=True)
+
+    def test_events_are_handled_in_order_by_workers(self):
+        consumer = CoreBusConsumer(config(workers=2, queue_size=10))
+        result = {'0': [], '1': []}
+
+        @shard_safe
+        def handler(event):
+            result[event['Uniqueid']].append(event['Index'])
+
+        consumer.on_ami_event('Newstate', handler)
+        consumer._dispatcher.start()
+
+        for i in range(10):
+            message = ami_message(uniqueid=str(i % 2))
+            message['data']['Index'] = i
+            consumer._on_bus_message(message, Mock())
+        consumer._dispatcher.stop()
+
+        assert_that(result['0'], equal_to([0, 2, 4, 6, 8]))
+        assert_that(result['1'], equal_to([1, 3, 5, 7, 9]))
+
+    def test_given_workers_then_handlers_not_shard_safe_run_on_the_consumer_thread(self):
+        consumer = CoreBusConsumer(config(workers=2, queue_size=10))
+        result = []
+        consumer.on_ami_event('Newstate', lambda event: result.append(threading.current_thread()))
+
+        consumer._on_bus_message(ami_message(), Mock())
+
+        assert_that(result, equal_to([threading.current_thread()]))
+
+    def test_provide_status(self):
+        status = {'bus_consumer': {}}
+
+        self.consumer.provide_status(status)
+
+        assert_that(status['bus_consumer']['event_queues'], contains())
@@ -0,0 +1,62 @@
+# Copyright 2019 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from unittest import TestCase
+
+from hamcrest import (
+    assert_that,
+    contains_inanyorder,
+    empty,
+    equal_to,
+)
+
+from ..collectd import CollectdAggregator
+
+
+class Event:
+
+    def __init__(self, plugin_instance, type_, type_instance, value):
+        self.plugin = 'calls'
+        self.plugin_instance = plugin_instance
+        self.type_ = type_
+        self.type_instance = type_instance
+        self.values = (value,)
+
+
+class TestCollectdAggregator(TestCase):
+
+    def setUp(self):
+        self.aggregator = CollectdAggregator()
+
+    def test_counters_are_summed_by_instance(self):
+        self.aggregator.add(Event('app.1', 'counter', 'start', '1'))
+        self.aggregator.add(Event('app.1', 'counter', 'start', '1'))
+        self.aggregator.add(Event('app.2', 'counter', 'start', '1'))
+        self.aggregator.add(Event('app.1', 'counter', 'end', '1'))
+
+        result = self.aggregator.flush()
+
+        assert_that(
+            [(event.plugin_instance, event.type_instance, event.values) for event in result],
+            contains_inanyorder(
+                ('app.1', 'start', ('2',)),
+                ('app.2', 'start', ('1',)),
+                ('app.1', 'end', ('1',)),
+            )
+        )
+
+    def test_gauges_are_averaged(self):
+        self.aggregator.add(Event('app.1', 'gauge', 'duration', '10.5'))
+        self.aggregator.add(Event('app.1', 'gauge', 'duration', '20.0'))
+
+        result = self.aggregator.flush()
+
+        assert_that([event.values for event in result], equal_to([('15.25',)]))
+
+    def test_flush_resets_the_stats(self):
+        self.aggregator.add(Event('app.1', 'counter', 'start', '1'))
+        self.aggregator.flush()
+
+        result = self.aggregator.flush()
+
+        assert_that(result, empty())
@@ -0,0 +1,90 @@
+# Copyright 2019 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import threading
+
+from unittest import TestCase
+
+from hamcrest import (
+    assert_that,
+    contains,
+    equal_to,
+)
+
+from ..dispatch import ShardedDispatcher
+
+
+class TestShardedDispatcher(TestCase):
+
+    def test_given_no_workers_when_submit_then_callback_is_run_synchronously(self):
+        dispatcher = ShardedDispatcher('test')
+        result = []
+
+        dispatcher.submit('key', result.append, 'value')
+
+        assert_that(result, contains('value'))
+        assert_that(dispatcher.queue_depths(), equal_to([]))
+
+    def test_callbacks_with_the_same_key_are_run_in_order(self):
+        dispatcher = ShardedDispatcher('test', workers=4, queue_size=100)
+        dispatcher.start()
+        result = {'a': [], 'b': []}
+
+        for i in range(50):
+            dispatcher.submit('a', result['a'].append, i)
+            dispatcher.submit('b', result['b'].append, i)
+        dispatcher.stop()
+
+        assert_that(result['a'], equal_to(list(range(50))))
+        assert_that(result['b'], equal_to(list(range(50))))
+
+    def test_a_failing_callback_does_not_stop_the_worker(self):
+        dispatcher = ShardedDispatcher('test', workers=1)
+        dispatcher.start()
+        result = []
+
+        def fail():
+            raise Exception('failure')
+
+        dispatcher.submit('key', fail)
+        dispatcher.submit('key', result.append, 'value')
+        dispatcher.stop()
+
+        assert_that(result, contains('value'))
+
+    def test_queue_depths(self):
+        dispatcher = ShardedDispatcher('test', workers=1)
+        dispatcher.start()
+        blocked = threading.Event()
+        dispatcher.submit('key', blocked.wait)
+        dispatcher.submit('key', lambda: None)
+        dispatcher.submit('key', lambda: None)
+
+        try:
+            assert_that(dispatcher.queue_depths()[0] >= 2, equal_to(True))
+        finally:
+            blocked.set()
+            dispatcher.stop()
+
+        assert_that(dispatcher.queue_depths(), equal_to([0]))
+
+    def test_given_blocked_worker_and_full_queue_when_stop_then_pending_callbacks_dropped(self):
+        dispatcher = ShardedDispatcher('test', workers=1, queue_size=1)
+        dispatcher.start()
+        blocked = threading.Event()
+        started = threading.Event()
+        result = []
+        dispatcher.submit('key', lambda: started.set() or blocked.wait())
+        started.wait()
+        dispatcher.submit('key', result.append, 'dropped')
+
+        dispatcher.stop(timeout=0.1)
+        blocked.set()
+
+        assert_that(result, equal_to([]))
+
+    def test_given_not_started_when_stop_then_returns(self):
+        dispatcher = ShardedDispatcher('test', workers=1, queue_size=1)
+        dispatcher.submit('key', lambda: None)
+
+        dispatcher.stop(timeout=0.1)
@@ -0,0 +1,86 @@
+# Copyright 2019 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from unittest import TestCase
+
+from hamcrest import (
+    assert_that,
+    contains_string,
+    equal_to,
+)
+from mock import (
+    Mock,
+    sentinel as s,
+)
+
+from ..http_server import (
+    LoadShedder,
+    RequestCounter,
+)
+
+
+class TestLoadShedder(TestCase):
+
+    def setUp(self):
+        self.thread_pool = Mock(qsize=0)
+        self.load_shedder = LoadShedder(self.thread_pool, max_queue_depth=10, retry_after=2)
+
+    def test_given_queue_not_full_then_connection_is_queued(self):
+        conn = Mock()
+
+        self.load_shedder.put(conn)
+
+        self.thread_pool.put.assert_called_once_with(conn)
+        conn.close.assert_not_called()
+
+    def test_given_queue_full_then_503_and_connection_closed(self):
+        self.thread_pool.qsize = 10
+        conn = Mock()
+
+        self.load_shedder.put(conn)
+
+        self.thread_pool.put.assert_not_called()
+        response = conn.wfile.write.call_args[0][0].decode('ISO-8859-1')
+        assert_that(response, contains_string('HTTP/1.1 503 Service Unavailable\r\n'))
+        assert_that(response, contains_string('Retry-After: 2\r\n'))
+        conn.close.assert_called_once_with()
+        assert_that(self.load_shedder.rejected, equal_to(1))
+
+    def test_given_client_gone_then_connection_closed(self):
+        self.thread_pool.qsize = 10
+        conn = Mock()
+        conn.wfile.write.side_effect = OSError('broken pipe')
+
+        self.load_shedder.put(conn)
+
+        conn.close.assert_called_once_with()
+
+    def test_other_attributes_are_those_of_the_thread_pool(self):
+        self.load_shedder.start()
+
+        self.thread_pool.start.assert_called_once_with()
+        assert_that(self.load_shedder.qsize, equal_to(0))
+
+
+class TestRequestCounter(TestCase):
+
+    def setUp(self):
+        self.wsgi_app = Mock(return_value=s.response)
+        self.request_counter = RequestCounter(self.wsgi_app)
+
+    def test_request_is_handled(self):
+        start_response = Mock()
+
+        result = self.request_counter({}, start_response)
+
+        assert_that(result, equal_to(s.response))
+        self.wsgi_app.assert_called_once_with({}, start_response)
+        assert_that(self.request_counter.in_flight, equal_to(0))
+
+    def test_in_flight_requests_are_counted(self):
+        in_flight = []
+        self.wsgi_app.side_effect = lambda environ, start_response: in_flight.append(self.request_counter.in_flight)
+
+        self.request_counter({}, Mock())
+
+        assert_that(in_flight, equal_to([1]))